@@ -1,4 +1,16 @@
 from context import Context
-from scraper import Scraper
-from model import Capacity, Course, Subject, Term
+from model import Capacity, Course, CourseRecord, SectionRecord, Subject, \
+    Term
 import ui
+
+__all__ = ['Capacity', 'Context', 'Course', 'CourseRecord', 'Scraper',
+           'SectionRecord', 'Subject', 'Term', 'ui']
+
+
+def __getattr__(name):
+    # The scraper is imported only when it is first used, so that the
+    # grouch command does not import it to answer from the cache.
+    if name == 'Scraper':
+        from scraper import Scraper
+        return Scraper
+    raise AttributeError("module 'grouch' has no attribute %r" % name)
@@ -0,0 +1,170 @@
+"""
+Compares the snapshots that the Journal writes with the codec, with
+each kind of compression, against the pickles it wrote before: bytes on
+disk, and the time to load a subject's courses and sections, both to
+use one course's sections and to use every row. Then the same for a
+term's CRN and search indexes, with the rows split among subjects: the
+time to load each and answer one lookup.
+
+Run from the root of the repository:
+
+    python -m grouch.benchmarks.codec
+    python -m grouch.benchmarks.codec --copies 1000
+"""
+
+import argparse
+from io import BytesIO
+import pickle
+import timeit
+
+from grouch import CourseRecord, SectionRecord
+from grouch.benchmarks.memory import catalog
+from grouch.index import CrnIndex, SearchIndex
+from grouch.store import Courses, Sections
+
+
+def distinct(courses, sections, copies):
+    """
+    :return: The (courses, sections) repeated, with each copy given
+        its own course numbers and CRNs.
+    """
+
+    def number(n, k):
+        return '%04d' % ((int(n) + 17 * k) % 10000)
+
+    return (
+        list([
+            CourseRecord(number(c['number'], k), c['name'],
+                         c['description'])
+            for k in range(copies) for c in courses
+        ]),
+        list([
+            SectionRecord(str(int(s['crn']) + 100000 * k),
+                          number(s['course'], k), s['name'])
+            for k in range(copies) for s in sections
+        ]),
+    )
+
+
+def split(rows, n):
+    """
+    :return: A dict of the rows split into n subjects, by subject id.
+    """
+    size = -(-len(rows) // n)
+    return dict(
+        ('S%03d' % k, rows[k * size:(k + 1) * size])
+        for k in range(n)
+    )
+
+
+def pickled(data):
+    # As Courses and Sections were dumped before the codec.
+    if isinstance(data, Sections):
+        x = {'source': list(data.source), 'index': data.index}
+    elif isinstance(data, Courses):
+        x = list(data.source)
+    else:
+        x = data
+    return pickle.dumps(x)
+
+
+def load(type_, b):
+    # Pickles of indexes are the indexes themselves.
+    if type_ in (CrnIndex, SearchIndex) and not b.startswith(b'GRCH'):
+        return pickle.loads(b)
+    return type_.load(BytesIO(b))
+
+
+def encoded(data, compression):
+    fp = BytesIO()
+    data.dump(fp, compression)
+    return fp.getvalue()
+
+
+def seconds(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the snapshot codec with pickle'
+    )
+
+    parser.add_argument(
+        '--copies',
+        type=int,
+        default=50,
+        help='How many times to repeat the rows of the recorded pages '
+             '(default 50)',
+    )
+
+    parser.add_argument(
+        '--subjects',
+        type=int,
+        default=100,
+        help='How many subjects to split the rows among in the indexes '
+             '(default 100)',
+    )
+
+    args = parser.parse_args()
+
+    (courses, sections) = distinct(*catalog(1, 1), copies=args.copies)
+    courses = Courses(courses)
+    sections = Sections(sections)
+    number = sections.source[0]['course']
+
+    formats = [('pickle', pickled)] + [
+        (c, lambda data, c=c: encoded(data, c))
+        for c in ('none', 'zlib', 'lzma')
+    ]
+
+    print('%d courses, %d sections' % (len(courses.source),
+                                       len(sections.source)))
+    print('%-8s %10s %10s %12s %12s' % (
+        'format', 'courses', 'sections', 'one ms', 'all ms'))
+
+    for (name, fn) in formats:
+        c = fn(courses)
+        s = fn(sections)
+
+        def load_one():
+            Sections.load(BytesIO(s)).for_course(number)
+
+        def load_all():
+            list(Courses.load(BytesIO(c)).source)
+            list(Sections.load(BytesIO(s)).source)
+
+        print('%-8s %10d %10d %12.3f %12.3f' % (
+            name, len(c), len(s),
+            seconds(load_one, 50) * 1000,
+            seconds(load_all, 20) * 1000,
+        ))
+
+    # The rows split among as many subjects as a term has.
+    crns = CrnIndex.build(split(sections.source, args.subjects))
+    search = SearchIndex.build(split(courses.source, args.subjects))
+    crn = sections.source[len(sections.source) // 2]['crn']
+
+    print('')
+    print('%-8s %10s %10s %12s %12s' % (
+        'format', 'crns', 'search', 'crns ms', 'search ms'))
+
+    for (name, fn) in formats:
+        c = fn(crns)
+        s = fn(search)
+
+        def find():
+            load(CrnIndex, c).find(crn)
+
+        def query():
+            load(SearchIndex, s).search('data structures', limit=20)
+
+        print('%-8s %10d %10d %12.3f %12.3f' % (
+            name, len(c), len(s),
+            seconds(find, 20) * 1000,
+            seconds(query, 20) * 1000,
+        ))
+
+
+if __name__ == '__main__':
+    main()
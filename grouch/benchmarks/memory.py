@@ -0,0 +1,136 @@
+"""
+Measures the memory that a full term's catalog takes once it is loaded
+from the cache: the courses and sections of every subject, as a
+long-lived process such as grouch serve holds them. It compares the
+records that Scraper produces with the dicts it produced before, each
+with its own copies of strings, as they were loaded from the cache.
+
+Run from the root of the repository:
+
+    python -m grouch.benchmarks.memory
+    python -m grouch.benchmarks.memory --subjects 150
+"""
+
+import argparse
+from io import BytesIO
+import pickle
+import tracemalloc
+
+from grouch import Scraper
+from grouch.benchmarks.pages import read_fixture, scale
+from grouch.store import Courses, Sections
+
+
+def retained(build):
+    """
+    :return: The number of bytes still allocated by build() once it has
+        returned, and its result.
+    """
+
+    tracemalloc.start()
+    try:
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (size, result)
+
+
+def _copy(s):
+    # A new string equal to s, as unpickling a dict row made.
+    if s is None:
+        return None
+    return (s + '.')[:-1]
+
+
+def as_dicts(records):
+    return [
+        dict((k, _copy(v)) for (k, v) in zip(r._fields, r))
+        for r in records
+    ]
+
+
+def catalog(course_copies=10, section_copies=12):
+    """
+    :return: The (courses, sections) of one subject, as scraped from
+        the recorded pages with their rows repeated, by default about
+        as many as a large subject has.
+    """
+
+    scraper = Scraper(enable_http=False)
+
+    courses = scraper.scrape_courses_html(scale(
+        read_fixture('bwckctlg.p_display_courses.html'),
+        '<TR>\n<TD CLASS="nttitle"', '</TABLE>\n<BR>\n<FORM',
+        course_copies))
+
+    sections = scraper.scrape_sections_html(scale(
+        read_fixture('bwckschd.p_get_crse_unsec.html'),
+        '<TR>\n<TH CLASS="ddtitle"',
+        '</TABLE>\n<BR>\n<TABLE  CLASS="datadisplaytable" summary',
+        section_copies))
+
+    return (courses, sections)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the memory used by a loaded term catalog'
+    )
+
+    parser.add_argument(
+        '--subjects',
+        type=int,
+        default=100,
+        help='The number of subjects in the term (default 100)',
+    )
+
+    args = parser.parse_args()
+
+    (courses, sections) = catalog()
+
+    # What the cache held for each subject, before and after.
+    dict_snapshots = [
+        (pickle.dumps(as_dicts(courses)), pickle.dumps(as_dicts(sections)))
+        for _ in range(args.subjects)
+    ]
+    record_snapshots = [
+        (_dump(Courses(courses)), _dump(Sections(sections)))
+        for _ in range(args.subjects)
+    ]
+
+    (dict_size, _) = retained(lambda: [
+        (Courses(pickle.loads(c)), Sections(pickle.loads(s)))
+        for (c, s) in dict_snapshots
+    ])
+
+    (record_size, _) = retained(lambda: [
+        (_load(Courses, c), _load(Sections, s))
+        for (c, s) in record_snapshots
+    ])
+
+    rows = args.subjects * (len(courses) + len(sections))
+
+    print('%d subjects, %d courses and sections' % (args.subjects, rows))
+    print('%-8s %10s %10s' % ('rows', 'KB', 'bytes/row'))
+    for (name, size) in (('dicts', dict_size), ('records', record_size)):
+        print('%-8s %10.1f %10.1f' % (name, size / 1024.0,
+                                      float(size) / rows))
+    print('saving   %9.0f%%' % (100.0 * (1 - float(record_size) / dict_size)))
+
+
+def _dump(data):
+    fp = BytesIO()
+    data.dump(fp)
+    return fp.getvalue()
+
+
+def _load(type_, snapshot):
+    data = type_.load(BytesIO(snapshot))
+    # Rows are decoded as they are used; use them all.
+    list(data.source)
+    return data
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Pages for the benchmarks: the responses recorded in grouch/tests, and
+synthetic pages made by repeating the rows of those recordings until
+they are about as large as the pages for a big subject.
+"""
+
+import os.path
+
+
+fixture_dir = os.path.join(os.path.dirname(__file__), os.pardir, 'tests')
+
+
+def read_fixture(name):
+    fp = open(os.path.join(fixture_dir, name))
+    try:
+        return fp.read()
+    finally:
+        fp.close()
+
+
+def scale(text, start, end, times):
+    """
+    Makes a larger page by repeating the part of text that runs from
+    the first occurrence of start up to the following occurrence
+    of end.
+    """
+    i = text.index(start)
+    j = text.index(end, i)
+    return text[:i] + text[i:j] * times + text[j:]
+
+
+# Each entry is (name, scrape method, fixture, rows to repeat),
+# where rows to repeat is None or a tuple (start, end, times).
+page_specs = [
+    ('terms', 'scrape_terms_html',
+     'bwckschd.p_disp_dyn_sched.html', None),
+    ('subjects', 'scrape_subjects_html',
+     'bwckgens.p_proc_term_date.html', None),
+    ('subjects x20', 'scrape_subjects_html',
+     'bwckgens.p_proc_term_date.html',
+     ('<OPTION VALUE="AE">', '</SELECT>', 20)),
+    ('courses', 'scrape_courses_html',
+     'bwckctlg.p_display_courses.html', None),
+    ('courses x50', 'scrape_courses_html',
+     'bwckctlg.p_display_courses.html',
+     ('<TR>\n<TD CLASS="nttitle"', '</TABLE>\n<BR>\n<FORM', 50)),
+    ('courses xml', 'scrape_courses_xml',
+     'bwckctlg.p_display_courses.xml', None),
+    ('courses xml x50', 'scrape_courses_xml',
+     'bwckctlg.p_display_courses.xml',
+     ('<CourseInventory>', '</CrseCat:CourseCatalog>', 50)),
+    ('sections', 'scrape_sections_html',
+     'bwckschd.p_get_crse_unsec.html', None),
+    ('sections x50', 'scrape_sections_html',
+     'bwckschd.p_get_crse_unsec.html',
+     ('<TR>\n<TH CLASS="ddtitle"',
+      '</TABLE>\n<BR>\n<TABLE  CLASS="datadisplaytable" summary', 50)),
+    ('section', 'scrape_section_html',
+     'bwckschd.p_disp_detail_sched.html', None),
+]
+
+
+def pages():
+    """
+    :return: A list of tuples (name, scrape method name, text).
+    """
+
+    result = []
+    for (name, method, fixture, rows) in page_specs:
+        text = read_fixture(fixture)
+        if rows is not None:
+            (start, end, times) = rows
+            text = scale(text, start, end, times)
+        result.append((name, method, text))
+    return result
@@ -0,0 +1,83 @@
+"""
+Compares the parsers in Scraper against the implementations they
+replaced, using the pages recorded in grouch/tests. Run from the
+root of the repository:
+
+    python -m grouch.benchmarks.parsers
+"""
+
+import timeit
+
+from grouch import Scraper
+from grouch.benchmarks import reference
+from grouch.benchmarks.pages import read_fixture, scale
+
+
+def parses_per_second(fn, text, number):
+    seconds = min(timeit.repeat(lambda: fn(text),
+                                number=number, repeat=3))
+    return number / seconds
+
+
+def compare(name, text, old, new, number=200):
+
+    if old(text) != new(text):
+        raise AssertionError('%s: parsers disagree' % name)
+
+    old_rate = parses_per_second(old, text, number)
+    new_rate = parses_per_second(new, text, number)
+
+    print('%-12s %12.0f %12.0f %8.1fx' % (
+        name, old_rate, new_rate, new_rate / old_rate))
+
+
+def main():
+    scraper = Scraper(enable_http=False)
+
+    print('%-12s %12s %12s %9s' % (
+        'parser', 'old (/s)', 'new (/s)', 'speedup'))
+
+    compare('section',
+            read_fixture('bwckschd.p_disp_detail_sched.html'),
+            reference.scrape_section_html,
+            scraper.scrape_section_html)
+
+    sections = read_fixture('bwckschd.p_get_crse_unsec.html')
+
+    compare('sections',
+            sections,
+            reference.scrape_sections_html,
+            scraper.scrape_sections_html)
+
+    # About the size of the listing for a large subject such as PHYS.
+    compare('sections x50',
+            scale(sections, '<TR>\n<TH CLASS="ddtitle"',
+                  '</TABLE>\n<BR>\n<TABLE  CLASS="datadisplaytable" '
+                  'summary', 50),
+            reference.scrape_sections_html,
+            scraper.scrape_sections_html,
+            number=10)
+
+    courses = read_fixture('bwckctlg.p_display_courses.html')
+
+    compare('courses',
+            courses,
+            reference.scrape_courses_html,
+            scraper.scrape_courses_html)
+
+    # About the size of the catalog for a subject with 300 courses.
+    compare('courses x50',
+            scale(courses, '<TR>\n<TD CLASS="nttitle"',
+                  '</TABLE>\n<BR>\n<FORM', 50),
+            reference.scrape_courses_html,
+            scraper.scrape_courses_html,
+            number=10)
+
+    compare('courses xml',
+            read_fixture('bwckctlg.p_display_courses.xml'),
+            reference.scrape_courses_xml,
+            scraper.scrape_courses_xml)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+The BeautifulSoup-based parsers that Scraper used before its faster
+replacements, kept so the benchmarks can check that both produce the
+same results and measure the difference.
+"""
+
+from bs4 import BeautifulSoup, BeautifulStoneSoup
+from html2text import unescape
+import re
+
+from grouch import Capacity, Course
+from grouch.scraper import course_number_re_fragment, \
+    section_name_re_fragment
+from grouch.util import grouper
+
+
+def scrape_section_html(html):
+
+    section = {}
+
+    soup = BeautifulSoup(html)
+
+    header = soup.find('th', 'ddlabel')
+    if header is None:
+        return None
+    match = re.match(
+        '(.*) - [0-9]+ - (.*) (' + course_number_re_fragment + ')' +
+        ' - (' + section_name_re_fragment + ')$',
+        header.text.strip())
+    if match is None:
+        return None
+    section['name'] = match.group(1)
+    section['course'] = Course(
+        subject=match.group(2),
+        number=match.group(3),
+    )
+    section['section'] = match.group(4)
+
+    tables = soup.findAll('table', 'datadisplaytable')
+    if len(tables) >= 2:
+        table = tables[1]
+        trs = table.findAll('tr')
+        if len(trs) >= 2:
+            tr = trs[1]
+            tds = tr.findAll('td')
+            if len(tds) > 2:
+                try:
+                    section['capacity'] = Capacity(
+                        max=int(tds[0].text),
+                        current=int(tds[1].text),
+                    )
+                except ValueError:
+                    pass
+
+    return section
+
+
+def scrape_sections_html(html):
+
+    def join(x):
+        return map(lambda y: ''.join(y), x)
+
+    rows = join(grouper(2, re.split(
+        '(<TR>\n<TH CLASS="ddtitle")', html)[1:]))
+
+    title_re = re.compile(
+        '<TH CLASS="ddtitle".*><A .*>' +
+        '.* - ([0-9]+) - .* (' + course_number_re_fragment + ')' +
+        ' - (' + section_name_re_fragment + ')</A></TH>')
+
+    def iter_sections():
+        for row in rows:
+            match = title_re.search(row.replace('\n', ''))
+            if match is None: continue
+            yield {
+                'crn': match.group(1),
+                'course': match.group(2),
+                'name': match.group(3),
+            }
+
+    return list(iter_sections())
+
+
+def scrape_courses_xml(xml):
+
+    # BeautifulStoneSoup keeps the case of tag names when lxml is
+    # installed, and so finds none of these; html.parser lowers them.
+    soup = BeautifulSoup(xml, 'html.parser')
+
+    def text(node):
+        if node is not None:
+            return unescape(node.text)
+
+    number_re = re.compile('^' + course_number_re_fragment + '$')
+
+    def iter_courses():
+        for inventory in soup.findAll('courseinventory'):
+            def inventory_text(name):
+                return text(inventory.find(name))
+
+            number = inventory_text('coursenumber')
+            if number_re.match(number):
+                yield {
+                    'number': number,
+                    'name': inventory_text('courselongtitle'),
+                    'description': inventory_text('coursedescription'),
+                }
+
+    return list(iter_courses())
+
+
+def scrape_courses_html(html):
+
+    def join(x):
+        return map(lambda y: ''.join(y), x)
+
+    rows = join(grouper(2, re.split('(<TR)', html)[1:]))
+
+    title_re = re.compile('CLASS="nttitle".*>[A-Z]+ ('
+                          + course_number_re_fragment + ') - (.*)</A></TD>')
+
+    def iter_courses():
+        for (row1, row2) in grouper(2, rows):
+            course = {}
+            match = title_re.search(row1.replace('\n', ''))
+            if match is None: continue
+            course['number'] = match.group(1)
+            course['name'] = match.group(2)
+            soup = BeautifulSoup(row2)
+            td = soup.find('td')
+            d = td.contents[0].strip().replace('\n', ' ') or None
+            course['description'] = d
+            yield course
+
+    return list(iter_courses())
@@ -0,0 +1,324 @@
+"""
+Measures how long the grouch command takes to start and answer each
+kind of query from a cache filled from the pages recorded in
+grouch/tests, and which imports that time goes to, as reported by
+python -X importtime (Python 3.7 or later).
+
+For each command it reports the median wall time of a run, the time
+spent importing, and the imports which cost the most: those made by
+grouch's own modules, each with the time taken by everything it
+imported in turn.
+
+Run from the root of the repository:
+
+    python -m grouch.benchmarks.startup
+    python -m grouch.benchmarks.startup --save startup.json
+    python -m grouch.benchmarks.startup --baseline startup.json
+
+With --baseline, the run fails if the median wall time for any command
+is worse than the stored median by more than --tolerance.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from grouch import Context, Scraper
+from grouch.benchmarks.pages import read_fixture
+from grouch.store import Courses, Journal, Section, Sections, Subjects, \
+    Terms
+
+
+package_dir = os.path.join(os.path.dirname(__file__), os.pardir)
+root_dir = os.path.join(package_dir, os.pardir)
+script = os.path.join(root_dir, 'scripts', 'grouch')
+
+# Each entry is (name, arguments), for queries about the cached pages.
+commands = [
+    ('none', []),
+    ('terms', ['terms']),
+    ('subjects', ['subjects']),
+    ('courses', ['courses', '--subject', 'CS']),
+    ('sections', ['sections', '--course', 'CS8803']),
+    ('crn', ['crn', '--course', 'CS8803', '--section', 'ACN']),
+    ('section', ['section', '--crn', '90293']),
+]
+
+# Every command is answered from the cache alone.
+common_arguments = ['--offline', '--no-server', '--no-auto-prune',
+                    '--quiet']
+
+
+def fill_cache():
+    """
+    Caches the terms, the subjects of the latest term, and the courses
+    and sections of CS, as if they had just been fetched.
+    """
+
+    scraper = Scraper(enable_http=False)
+    journal = Journal(Context(), force_refresh=False)
+
+    terms = Terms(scraper.scrape_terms_html(
+        read_fixture('bwckschd.p_disp_dyn_sched.html')))
+    journal.child('terms').put(terms)
+
+    term = journal.child('terms', terms.dict[terms.list[0]])
+    term.child('subjects').put(Subjects(scraper.scrape_subjects_html(
+        read_fixture('bwckgens.p_proc_term_date.html'))))
+    term.child('subject', 'CS', 'courses').put(Courses(
+        scraper.scrape_courses_html(
+            read_fixture('bwckctlg.p_display_courses.html'))))
+    term.child('subject', 'CS', 'sections').put(Sections(
+        scraper.scrape_sections_html(
+            read_fixture('bwckschd.p_get_crse_unsec.html'))))
+    term.child('crn', '90293').put(Section(scraper.scrape_section_html(
+        read_fixture('bwckschd.p_disp_detail_sched.html'))))
+
+
+def environment():
+    env = dict(os.environ)
+    path = [os.path.abspath(root_dir)]
+    if env.get('PYTHONPATH'):
+        path.append(env['PYTHONPATH'])
+    env['PYTHONPATH'] = os.pathsep.join(path)
+    return env
+
+
+def run_command(arguments, env, options=()):
+    """
+    Runs grouch once. A command which fails ends the benchmark, rather
+    than being timed.
+
+    :return: A tuple (seconds, standard error).
+    """
+
+    t = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable] + list(options) + [script] + arguments
+        + common_arguments,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    seconds = time.perf_counter() - t
+    stderr = process.stderr.decode('utf-8', 'replace')
+    if process.returncode != 0:
+        sys.exit('grouch %s failed:\n%s' % (' '.join(arguments), stderr))
+    return (seconds, stderr)
+
+
+def parse_importtime(text):
+    """
+    :return: A list of (module, cumulative seconds, depth), in the order
+        python -X importtime reports them, in which each module follows
+        everything it imported.
+    """
+
+    imports = []
+    for line in text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        (_, cumulative, name) = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            # The header.
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(cumulative) / 1e6, depth))
+    return imports
+
+
+def own_modules():
+    names = set(['grouch'])
+    for filename in os.listdir(package_dir):
+        (name, ext) = os.path.splitext(filename)
+        if ext == '.py':
+            names.add(name)
+            names.add('grouch.' + name)
+    return names
+
+
+def breakdown(imports, own):
+    """
+    :return: The total seconds spent importing, and a list of (module,
+        cumulative seconds) for the imports made by grouch's own
+        modules or while it ran, slowest first.
+    """
+
+    total = sum(seconds for (name, seconds, depth) in imports
+                if depth == 0)
+
+    # Read backwards, each module comes before what it imported, and
+    # the modules imported while the command ran (at the top level,
+    # after grouch itself) come first.
+    outer = []
+    parents = []
+    running = True
+    for (name, seconds, depth) in reversed(imports):
+        del parents[depth:]
+        if depth == 0 and name == 'grouch':
+            running = False
+        if name not in own and all(p in own for p in parents) \
+                and (parents or running):
+            outer.append((name, seconds))
+        parents.append(name)
+
+    outer.sort(key=lambda x: -x[1])
+    return (total, outer)
+
+
+def measure(arguments, env, runs, own):
+    """
+    :return: A dict of results.
+    """
+
+    run_command(arguments, env)
+
+    times = sorted(run_command(arguments, env)[0] for _ in range(runs))
+
+    (_, stderr) = run_command(arguments, env, options=['-X', 'importtime'])
+    (total, outer) = breakdown(parse_importtime(stderr), own)
+
+    return {
+        'wall': times[len(times) // 2],
+        'imports': total,
+        'breakdown': outer,
+    }
+
+
+def run(runs, only=None):
+    """
+    :return: A dict mapping command names to results from measure.
+    """
+
+    env = environment()
+    own = own_modules()
+    results = {}
+
+    for (name, arguments) in commands:
+        if only is not None and name not in only:
+            continue
+        results[name] = measure(arguments, env, runs, own)
+
+    return results
+
+
+def report(results, top, out=sys.stdout):
+
+    out.write('%-12s %9s %10s\n' % ('command', 'wall ms', 'import ms'))
+
+    for (name, _) in commands:
+        if name not in results:
+            continue
+        r = results[name]
+        out.write('%-12s %9.1f %10.1f\n' % (
+            name, r['wall'] * 1000, r['imports'] * 1000))
+        for (module, seconds) in r['breakdown'][:top]:
+            out.write('    %-28s %7.1f\n' % (module, seconds * 1000))
+
+
+def regressions(results, baseline, tolerance):
+    """
+    :return: A list of messages, one for each command whose median wall
+        time exceeds its baseline median by more than the tolerance.
+    """
+
+    messages = []
+
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old = baseline[name]['wall']
+        new = results[name]['wall']
+        if new > old * (1 + tolerance):
+            messages.append('%s: median %.1f ms, baseline %.1f ms' % (
+                name, new * 1000, old * 1000))
+
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the startup of the grouch command'
+    )
+
+    parser.add_argument(
+        '--runs',
+        type=int,
+        default=10,
+        help='Number of timed runs of each command (default 10)',
+    )
+
+    parser.add_argument(
+        '--command',
+        action='append',
+        help='Benchmark only this command (may be repeated)',
+    )
+
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=6,
+        help='Number of imports to list for each command (default 6)',
+    )
+
+    parser.add_argument(
+        '--save',
+        metavar='FILE',
+        help='Write the results to FILE for use as a baseline',
+    )
+
+    parser.add_argument(
+        '--baseline',
+        metavar='FILE',
+        help='Fail if any command is slower than in this baseline',
+    )
+
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.25,
+        help='Allowed slowdown relative to the baseline '
+             '(default 0.25, meaning 25%%)',
+    )
+
+    args = parser.parse_args()
+
+    # The cache is made afresh, apart from the user's own.
+    config_home = tempfile.mkdtemp(prefix='grouch-startup-')
+    os.environ['XDG_CONFIG_HOME'] = config_home
+    try:
+        fill_cache()
+        results = run(max(1, args.runs), only=args.command)
+    finally:
+        shutil.rmtree(config_home, ignore_errors=True)
+
+    report(results, args.top)
+
+    if args.save:
+        fp = open(args.save, 'w')
+        try:
+            json.dump(results, fp, indent=2, sort_keys=True)
+        finally:
+            fp.close()
+
+    if args.baseline:
+        fp = open(args.baseline)
+        try:
+            baseline = json.load(fp)
+        finally:
+            fp.close()
+        messages = regressions(results, baseline, args.tolerance)
+        if messages:
+            sys.stderr.write('Slower than baseline:\n')
+            for m in messages:
+                sys.stderr.write('  %s\n' % m)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
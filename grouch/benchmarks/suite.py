@@ -0,0 +1,199 @@
+"""
+Benchmarks every Scraper.scrape_* method over the pages recorded in
+grouch/tests and over synthetic pages scaled up from them. For each
+page it reports throughput, peak memory and latency percentiles.
+
+Run from the root of the repository:
+
+    python -m grouch.benchmarks.suite
+    python -m grouch.benchmarks.suite --save baseline.json
+    python -m grouch.benchmarks.suite --baseline baseline.json
+
+With --baseline, the run fails if the median latency for any page is
+worse than the stored median by more than --tolerance.
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+from grouch import Scraper
+from grouch.benchmarks.pages import pages
+
+
+def percentile(sorted_values, p):
+    """
+    :param sorted_values: A non-empty sorted list.
+    :param p: A percentile between 0 and 100.
+    """
+    i = int(round((len(sorted_values) - 1) * p / 100.0))
+    return sorted_values[i]
+
+
+def measure(fn, text, seconds, min_runs=5):
+    """
+    Calls fn(text) repeatedly for about the given number of seconds.
+
+    :return: A dict of results.
+    """
+
+    fn(text)
+
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < min_runs \
+            or time.perf_counter() - start < seconds:
+        t = time.perf_counter()
+        fn(text)
+        latencies.append(time.perf_counter() - t)
+    total = sum(latencies)
+    latencies.sort()
+
+    tracemalloc.start()
+    try:
+        fn(text)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    size = len(text.encode('utf-8'))
+
+    return {
+        'bytes': size,
+        'runs': len(latencies),
+        'pages_per_second': len(latencies) / total,
+        'mb_per_second': size * len(latencies) / total / 1e6,
+        'peak_memory': peak,
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+    }
+
+
+def run(seconds, only=None):
+    """
+    :return: A dict mapping page names to results from measure.
+    """
+
+    scraper = Scraper(enable_http=False)
+    results = {}
+
+    for (name, method, text) in pages():
+        if only is not None and name not in only:
+            continue
+        results[name] = measure(getattr(scraper, method), text, seconds)
+
+    return results
+
+
+def report(results, out=sys.stdout):
+
+    def ms(x):
+        return x * 1000
+
+    out.write('%-16s %9s %8s %9s %9s %8s %8s %8s\n' % (
+        'page', 'KB', 'pages/s', 'MB/s', 'peak KB',
+        'p50 ms', 'p90 ms', 'p99 ms'))
+
+    for name in sorted(results):
+        r = results[name]
+        out.write('%-16s %9.1f %8.0f %9.2f %9.1f %8.3f %8.3f %8.3f\n' % (
+            name,
+            r['bytes'] / 1024.0,
+            r['pages_per_second'],
+            r['mb_per_second'],
+            r['peak_memory'] / 1024.0,
+            ms(r['p50']),
+            ms(r['p90']),
+            ms(r['p99']),
+        ))
+
+
+def regressions(results, baseline, tolerance):
+    """
+    :return: A list of messages, one for each page whose median latency
+        exceeds its baseline median by more than the tolerance.
+    """
+
+    messages = []
+
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old = baseline[name]['p50']
+        new = results[name]['p50']
+        if new > old * (1 + tolerance):
+            messages.append('%s: median %.3f ms, baseline %.3f ms' % (
+                name, new * 1000, old * 1000))
+
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the Oscar page parsers'
+    )
+
+    parser.add_argument(
+        '--seconds',
+        type=float,
+        default=1.0,
+        help='Approximate time to spend on each page (default 1)',
+    )
+
+    parser.add_argument(
+        '--page',
+        action='append',
+        help='Benchmark only this page (may be repeated)',
+    )
+
+    parser.add_argument(
+        '--save',
+        metavar='FILE',
+        help='Write the results to FILE for use as a baseline',
+    )
+
+    parser.add_argument(
+        '--baseline',
+        metavar='FILE',
+        help='Fail if any page is slower than in this baseline',
+    )
+
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.25,
+        help='Allowed slowdown relative to the baseline '
+             '(default 0.25, meaning 25%%)',
+    )
+
+    args = parser.parse_args()
+
+    results = run(args.seconds, only=args.page)
+    report(results)
+
+    if args.save:
+        fp = open(args.save, 'w')
+        try:
+            json.dump(results, fp, indent=2, sort_keys=True)
+        finally:
+            fp.close()
+
+    if args.baseline:
+        fp = open(args.baseline)
+        try:
+            baseline = json.load(fp)
+        finally:
+            fp.close()
+        messages = regressions(results, baseline, args.tolerance)
+        if messages:
+            sys.stderr.write('Slower than baseline:\n')
+            for m in messages:
+                sys.stderr.write('  %s\n' % m)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,583 @@
+from datetime import datetime, timedelta
+import errno
+from io import BytesIO
+import json
+import os, os.path
+import threading
+import time
+
+from util import makedirs
+
+try:
+    import fcntl
+except ImportError:
+    # Without fcntl, locks only exclude other threads in this process.
+    fcntl = None
+
+
+# Snapshots are identified by the time they were written, formatted
+# so that lexicographical order is chronological order.
+timestamp_format = '%Y-%m-%d-%H-%M-%S-%f'
+
+
+class RetentionPolicy:
+    """
+    Decides which snapshots to delete when the cache is pruned.
+
+    :param keep_last: The number of snapshots to keep for each path.
+        Older ones are deleted.
+    :param max_age: A timedelta, or None. Snapshots older than this
+        are deleted.
+    :param max_bytes: A size in bytes, or None. If the cache is larger
+        than this, the least recently used snapshots are deleted until
+        it is not.
+    :param auto_interval: A timedelta, or None. After a snapshot is
+        written, the cache is pruned in the background if it has not
+        been pruned for this long. None disables automatic pruning.
+    """
+
+    def __init__(self, keep_last=3, max_age=timedelta(days=180),
+                 max_bytes=256 * 1024 * 1024,
+                 auto_interval=timedelta(hours=1)):
+        if keep_last < 1:
+            raise ValueError('keep_last must be at least 1')
+        self.keep_last = keep_last
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.auto_interval = auto_interval
+
+
+class MissingSnapshot(Exception):
+    """
+    Raised by a backend's load when the snapshot no longer exists,
+    because it was pruned after it was found.
+    """
+
+
+class Cache:
+    """
+    Behavior shared by the cache backends. A backend implements
+    describe, latest, put, load, validator and renew for the Journal,
+    plus entries and remove, which are used for pruning.
+
+    Each snapshot may be stored with a validator: a dict describing the
+    response it was scraped from, so that a later fetch can tell
+    whether the page has changed.
+    """
+
+    def __init__(self, context):
+        self.__context = context
+        self.__pruning = threading.Lock()
+        self.__stamp = os.path.join(context.get_config_dir(),
+                                    'cache-pruned')
+        self.__lock_dir = os.path.join(context.get_config_dir(), 'locks')
+
+    def lock(self, path):
+        """
+        :return: A PathLock for a path, which excludes other threads in
+            this process and other processes using the same cache.
+        """
+
+        makedirs(self.__lock_dir)
+        return PathLock(os.path.join(self.__lock_dir,
+                                     '.'.join(path) + '.lock'))
+
+    def prune(self, policy):
+        """
+        Deletes snapshots according to a RetentionPolicy.
+
+        :return: A tuple (number of snapshots deleted, bytes freed).
+        """
+
+        now = datetime.utcnow()
+        doomed = []
+        survivors = []
+
+        by_path = {}
+        for entry in self.entries():
+            by_path.setdefault(tuple(entry[0]), []).append(entry)
+
+        for entries in by_path.values():
+            entries.sort(key=lambda e: e[1], reverse=True)
+            for (i, entry) in enumerate(entries):
+                too_many = i >= policy.keep_last
+                too_old = policy.max_age is not None and \
+                    now - parse_timestamp(entry[1]) > policy.max_age
+                if too_many or too_old:
+                    doomed.append(entry)
+                else:
+                    survivors.append(entry)
+
+        if policy.max_bytes is not None:
+            total = sum(e[2] for e in survivors)
+            # Least recently used first.
+            survivors.sort(key=lambda e: e[3])
+            for entry in survivors:
+                if total <= policy.max_bytes:
+                    break
+                doomed.append(entry)
+                total -= entry[2]
+
+        # Each path is locked while its snapshots are deleted, so that
+        # none is deleted while it is being refreshed or renewed.
+        doomed_by_path = {}
+        for (path, timestamp, size, accessed) in doomed:
+            doomed_by_path.setdefault(tuple(path), []).append(timestamp)
+        for (path, timestamps) in doomed_by_path.items():
+            with self.lock(list(path)):
+                for timestamp in timestamps:
+                    self.remove(list(path), timestamp)
+
+        self.__remove_lock_files()
+        self.__touch_stamp()
+
+        freed = sum(e[2] for e in doomed)
+        self.__context.get_logger().info(
+            'Pruned %d snapshots (%d bytes)' % (len(doomed), freed))
+
+        return (len(doomed), freed)
+
+    def after_put(self, policy):
+        """
+        Starts pruning in a background thread, if the policy calls
+        for it and no other pruning is in progress.
+        """
+
+        if policy is None or policy.auto_interval is None:
+            return
+
+        try:
+            last = os.path.getmtime(self.__stamp)
+        except OSError:
+            last = 0
+        if time.time() - last < policy.auto_interval.total_seconds():
+            return
+
+        if not self.__pruning.acquire(False):
+            return
+
+        # Record the attempt right away so that other processes
+        # writing to the same cache do not start pruning too.
+        self.__touch_stamp()
+
+        def run():
+            try:
+                self.prune(policy)
+            except Exception:
+                self.__context.get_logger().exception('Pruning failed')
+            finally:
+                self.__pruning.release()
+
+        # A daemon, so that a command never waits for pruning to finish
+        # before it exits. Pruning which is cut short is harmless, and
+        # is finished by a later one.
+        thread = threading.Thread(target=run, name='grouch-prune')
+        thread.daemon = True
+        thread.start()
+
+    def __remove_lock_files(self):
+        """
+        Deletes the lock files of paths which are not locked, since one
+        is left behind for every path that has ever been locked.
+        """
+
+        try:
+            names = os.listdir(self.__lock_dir)
+        except OSError:
+            return
+
+        for name in names:
+            if name.endswith('.lock'):
+                PathLock(os.path.join(self.__lock_dir, name)).remove()
+
+    def __touch_stamp(self):
+        makedirs(os.path.dirname(self.__stamp))
+        fp = open(self.__stamp, 'a')
+        fp.close()
+        os.utime(self.__stamp, None)
+
+
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+class PathLock:
+    """
+    A lock that is held by at most one thread of one process at a time:
+    a threading lock, plus an exclusive flock on a file.
+
+    A lock file may be deleted (by remove) while another process waits
+    to lock it, and a third process may then lock a new file of the
+    same name. So once a file is locked, it is checked to be the one
+    which has that name; if it is not, the new file is locked instead.
+    """
+
+    def __init__(self, filename):
+        self.__filename = filename
+        self.__fp = None
+        with _thread_locks_lock:
+            if filename not in _thread_locks:
+                _thread_locks[filename] = threading.Lock()
+            self.__thread_lock = _thread_locks[filename]
+
+    def get_filename(self):
+        return self.__filename
+
+    def acquire(self):
+        self.__thread_lock.acquire()
+        try:
+            while True:
+                fp = open(self.__filename, 'a')
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+                    if self.__is_current(fp):
+                        break
+                except BaseException:
+                    fp.close()
+                    raise
+                fp.close()
+            self.__fp = fp
+        except BaseException:
+            self.__thread_lock.release()
+            raise
+
+    def __is_current(self, fp):
+        """
+        :return: Whether an open lock file is still the file with this
+            lock's name.
+        """
+        try:
+            return os.path.samestat(os.fstat(fp.fileno()),
+                                    os.stat(self.__filename))
+        except OSError:
+            return False
+
+    def remove(self):
+        """
+        Deletes the lock file, unless the lock is held.
+        """
+
+        if not self.__thread_lock.acquire(False):
+            return
+        try:
+            try:
+                fp = open(self.__filename, 'a')
+            except IOError:
+                return
+            try:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(fp.fileno(),
+                                    fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except (IOError, OSError):
+                        return
+                if self.__is_current(fp):
+                    os.remove(self.__filename)
+            finally:
+                fp.close()
+        finally:
+            self.__thread_lock.release()
+
+    def release(self):
+        fp = self.__fp
+        self.__fp = None
+        try:
+            if fcntl is not None:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+            fp.close()
+        finally:
+            self.__thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def parse_timestamp(timestamp):
+    """
+    :return: The datetime of a timestamp in timestamp_format. This is
+        parsed by hand, since datetime.strptime takes several
+        milliseconds to import, which every command would pay.
+    :raise ValueError: If it is not such a timestamp.
+    """
+    fields = timestamp.split('-')
+    if len(fields) != 7 or len(fields[6]) != 6 \
+            or not all(f.isdigit() for f in fields):
+        raise ValueError('not a timestamp: %r' % timestamp)
+    return datetime(*[int(f) for f in fields])
+
+
+def _is_timestamp(name):
+    try:
+        parse_timestamp(name)
+    except ValueError:
+        return False
+    return True
+
+
+class FileCache(Cache):
+    """
+    Stores each snapshot as a file in a directory tree that mirrors
+    the Journal paths, named by the snapshot's timestamp. A file's
+    modification time records when it was last loaded.
+    """
+
+    def __init__(self, context):
+        Cache.__init__(self, context)
+        self.__context = context
+
+    def dir(self, path):
+        d = os.path.join(
+            self.__context.get_config_dir(),
+            'cache',
+            os.path.join(*path)
+        )
+        makedirs(d)
+        return d
+
+    def describe(self, path, timestamp):
+        return os.path.join(self.dir(path), timestamp)
+
+    def latest(self, path):
+        """
+        :return: The timestamp of the most recent snapshot at the
+            path, or None if there is none.
+        """
+
+        d = self.dir(path)
+
+        def is_file(f):
+            return _is_timestamp(f) and os.path.isfile(os.path.join(d, f))
+
+        # List the files in this directory.
+        files = list(filter(is_file, os.listdir(d)))
+
+        # The most recent file has the highest lexicographical name.
+        if len(files) != 0:
+            return max(files)
+
+    def put(self, path, timestamp, dump, validator=None):
+        """
+        :param dump: A function which writes the snapshot to the file
+            object it is given.
+        :param validator: A dict, or None. It is written as JSON to a
+            file beside the snapshot.
+        """
+
+        # Write to a temporary file first, so that a snapshot which is
+        # written again in place is never seen half-written.
+        filename = self.describe(path, timestamp)
+        temp = '%s.%d.tmp' % (filename, os.getpid())
+        fp = open(temp, 'wb')
+        try:
+            dump(fp)
+        finally:
+            fp.close()
+        os.rename(temp, filename)
+
+        if validator is not None:
+            fp = open(self.__validator_file(path, timestamp), 'w')
+            try:
+                json.dump(validator, fp)
+            finally:
+                fp.close()
+
+    def load(self, path, timestamp, load):
+        """
+        :param load: A function which reads the snapshot from the file
+            object it is given.
+        """
+
+        filename = self.describe(path, timestamp)
+        try:
+            fp = open(filename, 'rb')
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                raise MissingSnapshot(filename)
+            raise
+        try:
+            data = load(fp)
+        finally:
+            fp.close()
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return data
+
+    def validator(self, path, timestamp):
+        """
+        :return: The validator stored with a snapshot, or None.
+        """
+
+        try:
+            fp = open(self.__validator_file(path, timestamp))
+        except IOError:
+            return None
+        try:
+            return json.load(fp)
+        except ValueError:
+            return None
+        finally:
+            fp.close()
+
+    def renew(self, path, timestamp, new_timestamp):
+        """
+        Gives a snapshot a new timestamp, keeping its contents.
+        """
+
+        os.rename(self.describe(path, timestamp),
+                  self.describe(path, new_timestamp))
+        try:
+            os.rename(self.__validator_file(path, timestamp),
+                      self.__validator_file(path, new_timestamp))
+        except OSError:
+            pass
+
+    def __validator_file(self, path, timestamp):
+        return self.describe(path, timestamp) + '.validator'
+
+    def entries(self):
+        """
+        :return: An iterator of tuples (path, timestamp, size in bytes,
+            time of last use) for every snapshot.
+        """
+
+        root = os.path.join(self.__context.get_config_dir(), 'cache')
+
+        for (d, dirs, files) in os.walk(root):
+            path = os.path.relpath(d, root).split(os.sep)
+            for f in files:
+                if not _is_timestamp(f):
+                    continue
+                try:
+                    st = os.stat(os.path.join(d, f))
+                except OSError:
+                    continue
+                yield (path, f, st.st_size, st.st_mtime)
+
+    def remove(self, path, timestamp):
+        for f in (self.describe(path, timestamp),
+                  self.__validator_file(path, timestamp)):
+            try:
+                os.remove(f)
+            except OSError:
+                pass
+
+
+class SqliteCache(Cache):
+    """
+    Stores every snapshot as a row in one SQLite database, indexed by
+    path and timestamp, so that finding the latest snapshot for a path
+    is a single indexed query rather than a directory listing.
+    """
+
+    def __init__(self, context):
+        Cache.__init__(self, context)
+        makedirs(context.get_config_dir())
+        self.__filename = os.path.join(context.get_config_dir(),
+                                       'cache.sqlite')
+        self.__lock = threading.Lock()
+        # Imported here, so that only this backend pays for it.
+        import sqlite3
+        self.__db = sqlite3.connect(self.__filename, timeout=30,
+                                    check_same_thread=False)
+        with self.__lock, self.__db:
+            self.__db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                ' path TEXT NOT NULL,'
+                ' timestamp TEXT NOT NULL,'
+                ' data BLOB NOT NULL)')
+            self.__db.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS entries_path_timestamp'
+                ' ON entries (path, timestamp)')
+            columns = [row[1] for row in
+                       self.__db.execute('PRAGMA table_info(entries)')]
+            if 'accessed' not in columns:
+                self.__db.execute(
+                    'ALTER TABLE entries ADD COLUMN accessed REAL')
+            if 'validator' not in columns:
+                self.__db.execute(
+                    'ALTER TABLE entries ADD COLUMN validator TEXT')
+
+    def describe(self, path, timestamp):
+        return '%s#%s@%s' % (self.__filename, _key(path), timestamp)
+
+    def latest(self, path):
+        with self.__lock:
+            row = self.__db.execute(
+                'SELECT timestamp FROM entries WHERE path = ?'
+                ' ORDER BY timestamp DESC LIMIT 1',
+                (_key(path),)).fetchone()
+        if row is not None:
+            return row[0]
+
+    def put(self, path, timestamp, dump, validator=None):
+        fp = BytesIO()
+        dump(fp)
+        if validator is not None:
+            validator = json.dumps(validator)
+        with self.__lock, self.__db:
+            self.__db.execute(
+                'INSERT OR REPLACE INTO entries'
+                ' (path, timestamp, data, accessed, validator)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                (_key(path), timestamp, memoryview(fp.getvalue()),
+                 time.time(), validator))
+
+    def load(self, path, timestamp, load):
+        with self.__lock, self.__db:
+            row = self.__db.execute(
+                'SELECT data FROM entries WHERE path = ? AND timestamp = ?',
+                (_key(path), timestamp)).fetchone()
+            self.__db.execute(
+                'UPDATE entries SET accessed = ?'
+                ' WHERE path = ? AND timestamp = ?',
+                (time.time(), _key(path), timestamp))
+        if row is None:
+            raise MissingSnapshot(self.describe(path, timestamp))
+        return load(BytesIO(bytes(row[0])))
+
+    def validator(self, path, timestamp):
+        with self.__lock:
+            row = self.__db.execute(
+                'SELECT validator FROM entries'
+                ' WHERE path = ? AND timestamp = ?',
+                (_key(path), timestamp)).fetchone()
+        if row is not None and row[0] is not None:
+            return json.loads(row[0])
+
+    def renew(self, path, timestamp, new_timestamp):
+        with self.__lock, self.__db:
+            self.__db.execute(
+                'UPDATE entries SET timestamp = ?, accessed = ?'
+                ' WHERE path = ? AND timestamp = ?',
+                (new_timestamp, time.time(), _key(path), timestamp))
+
+    def entries(self):
+        with self.__lock:
+            rows = self.__db.execute(
+                'SELECT path, timestamp, length(data), accessed'
+                ' FROM entries').fetchall()
+        for (key, timestamp, size, accessed) in rows:
+            yield (key.split('/'), timestamp, size, accessed or 0)
+
+    def remove(self, path, timestamp):
+        with self.__lock, self.__db:
+            self.__db.execute(
+                'DELETE FROM entries WHERE path = ? AND timestamp = ?',
+                (_key(path), timestamp))
+
+
+def _key(path):
+    return '/'.join(path)
+
+
+backends = {
+    'file': FileCache,
+    'sqlite': SqliteCache,
+}
@@ -0,0 +1,357 @@
+"""
+A term catalog: the subjects, courses and sections of a term packed
+into one binary file of columns, which is memory-mapped and read in
+place, so that a lookup decodes only the rows it touches.
+
+The file is a header followed by the columns:
+
+    magic      5 bytes, "GRCAT"
+    version    uint16
+    columns    uint16, the number of columns
+    then for each column:
+        name       16 bytes, NUL-padded
+        typecode   1 byte, as for array (one of 'B', 'H', 'I', 'i')
+        offset     uint64, from the start of the file
+        count      uint64, the number of items
+
+Numbers are little-endian, and each column starts at a multiple of 8
+bytes. A column of strings is stored as two columns: "<name>" holds
+the UTF-8 encoded strings end to end, and "<name>.off" the offsets of
+each string and of the end of the last.
+
+Subjects are sorted by id, courses by subject and number, and
+sections by CRN. Courses and sections refer to subjects by position.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+import mmap
+import os
+import struct
+import sys
+
+from model import Capacity, Course, CourseRecord, Subject
+from util import makedirs
+
+MAGIC = b'GRCAT'
+VERSION = 1
+
+_header = struct.Struct('<5sHH')
+_column = struct.Struct('<16scQQ')
+
+# Columns are stored little-endian, and read in place only on
+# little-endian machines.
+_usable = sys.byteorder == 'little'
+
+
+def catalog_file(context, term_id):
+    return os.path.join(context.get_config_dir(), 'catalogs',
+                        '%s.catalog' % term_id)
+
+
+class _Builder:
+
+    def __init__(self):
+        self.__columns = []
+
+    def numbers(self, name, typecode, values):
+        self.__columns.append((name, typecode, array(typecode, values)))
+
+    def strings(self, name, values):
+        offsets = array('I', [0])
+        data = bytearray()
+        for value in values:
+            data.extend((value or u'').encode('utf-8'))
+            offsets.append(len(data))
+        self.__columns.append((name + '.off', 'I', offsets))
+        self.__columns.append((name, 'B', array('B', bytes(data))))
+
+    def write(self, fp):
+        offset = _align(_header.size + _column.size * len(self.__columns))
+        directory = []
+        for (name, typecode, values) in self.__columns:
+            directory.append((name, typecode, offset, len(values)))
+            offset = _align(offset + len(values) * values.itemsize)
+
+        fp.write(_header.pack(MAGIC, VERSION, len(self.__columns)))
+        for (name, typecode, offset, count) in directory:
+            fp.write(_column.pack(name.encode('ascii'),
+                                  typecode.encode('ascii'), offset, count))
+
+        for ((_, _, offset, _), (_, _, values)) in \
+                zip(directory, self.__columns):
+            fp.write(b'\0' * (offset - fp.tell()))
+            if sys.byteorder != 'little':
+                values = array(values.typecode, values)
+                values.byteswap()
+            values.tofile(fp)
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def write_catalog(filename, subjects, courses, sections, capacities=None):
+    """
+    Writes a catalog, replacing any file of the same name only once it
+    is complete.
+
+    :param subjects: A list of Subjects.
+    :param courses: A dict mapping subject ids to lists of courses, as
+        from Scraper.get_courses.
+    :param sections: A dict mapping subject ids to lists of sections,
+        as from Scraper.get_sections.
+    :param capacities: An optional dict mapping CRNs to Capacities.
+    """
+
+    capacities = capacities or {}
+    subjects = sorted(subjects, key=lambda s: s.get_id())
+    position = dict((s.get_id(), i) for (i, s) in enumerate(subjects))
+
+    course_rows = sorted(
+        (position[subject_id], c['number'], c['name'], c['description'])
+        for (subject_id, cs) in courses.items() if subject_id in position
+        for c in cs
+    )
+
+    # CRNs which are not numbers are left out, as in CrnIndex.
+    section_rows = sorted(
+        (int(s['crn']), position[subject_id], s['course'], s['name'])
+        for (subject_id, ss) in sections.items() if subject_id in position
+        for s in ss if s['crn'].isdigit()
+    )
+
+    def capacity(crn):
+        c = capacities.get(str(crn))
+        if c is None:
+            return (-1, -1)
+        return (c.get_max(), c.get_current())
+
+    section_capacities = [capacity(r[0]) for r in section_rows]
+
+    order = sorted(
+        range(len(section_rows)),
+        key=lambda i: (section_rows[i][1], section_rows[i][2],
+                       section_rows[i][3].upper()),
+    )
+
+    b = _Builder()
+    b.strings('subj.id', [s.get_id() for s in subjects])
+    b.strings('subj.name', [s.get_name() for s in subjects])
+    b.numbers('crs.subject', 'H', [r[0] for r in course_rows])
+    b.strings('crs.number', [r[1] for r in course_rows])
+    b.strings('crs.name', [r[2] for r in course_rows])
+    b.strings('crs.desc', [r[3] for r in course_rows])
+    b.numbers('sec.crn', 'I', [r[0] for r in section_rows])
+    b.numbers('sec.subject', 'H', [r[1] for r in section_rows])
+    b.strings('sec.course', [r[2] for r in section_rows])
+    b.strings('sec.name', [r[3] for r in section_rows])
+    b.numbers('sec.max', 'i', [c[0] for c in section_capacities])
+    b.numbers('sec.current', 'i', [c[1] for c in section_capacities])
+    b.numbers('sec.order', 'I', order)
+
+    makedirs(os.path.dirname(filename))
+    temp = '%s.%d.tmp' % (filename, os.getpid())
+    fp = open(temp, 'wb')
+    try:
+        b.write(fp)
+    finally:
+        fp.close()
+    os.rename(temp, filename)
+
+    return len(section_rows)
+
+
+class _Strings:
+    """
+    A column of strings, decoded one at a time.
+    """
+
+    def __init__(self, offsets, data):
+        self.__offsets = offsets
+        self.__data = data
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.__data[self.__offsets[i]:self.__offsets[i + 1]]) \
+            .decode('utf-8')
+
+
+class _Column:
+    """
+    A view of one field of a sequence of rows, for bisection.
+    """
+
+    def __init__(self, length, fn):
+        self.__length = length
+        self.__fn = fn
+
+    def __len__(self):
+        return self.__length
+
+    def __getitem__(self, i):
+        return self.__fn(i)
+
+
+class Catalog:
+    """
+    A memory-mapped term catalog. Use Catalog.open.
+    """
+
+    def __init__(self, mm):
+        self.__mm = mm
+        view = memoryview(mm)
+
+        (magic, version, count) = _header.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a version %d catalog' % VERSION)
+
+        columns = {}
+        for i in range(count):
+            (name, typecode, offset, n) = _column.unpack_from(
+                mm, _header.size + i * _column.size)
+            typecode = typecode.decode('ascii')
+            size = array(typecode).itemsize
+            columns[name.rstrip(b'\0').decode('ascii')] = \
+                view[offset:offset + n * size].cast(typecode)
+
+        def strings(name):
+            return _Strings(columns[name + '.off'], columns[name])
+
+        self.__subject_ids = strings('subj.id')
+        self.__subject_names = strings('subj.name')
+        self.__course_subjects = columns['crs.subject']
+        self.__course_numbers = strings('crs.number')
+        self.__course_names = strings('crs.name')
+        self.__course_descriptions = strings('crs.desc')
+        self.__crns = columns['sec.crn']
+        self.__section_subjects = columns['sec.subject']
+        self.__section_courses = strings('sec.course')
+        self.__section_names = strings('sec.name')
+        self.__section_max = columns['sec.max']
+        self.__section_current = columns['sec.current']
+        self.__section_order = columns['sec.order']
+
+    @staticmethod
+    def open(filename):
+        """
+        :return: A Catalog, or None if there is no usable catalog file.
+        """
+
+        if not _usable:
+            return None
+
+        try:
+            fp = open(filename, 'rb')
+        except IOError:
+            return None
+        try:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # The file is empty.
+            return None
+        finally:
+            fp.close()
+
+        try:
+            return Catalog(mm)
+        except (ValueError, KeyError, struct.error):
+            return None
+
+    def get_subjects(self):
+        """
+        :return: A list of Subjects, sorted by id.
+        """
+        return list([
+            Subject(self.__subject_ids[i], self.__subject_names[i])
+            for i in range(len(self.__subject_ids))
+        ])
+
+    def __subject_position(self, subject_id):
+        i = bisect_left(self.__subject_ids, subject_id)
+        if i < len(self.__subject_ids) \
+                and self.__subject_ids[i] == subject_id:
+            return i
+
+    def get_courses(self, subject_id):
+        """
+        :return: A list of CourseRecords, as from Scraper.get_courses,
+            or None if the subject is not in the catalog.
+        """
+
+        s = self.__subject_position(subject_id)
+        if s is None:
+            return None
+
+        start = bisect_left(self.__course_subjects, s)
+        end = bisect_right(self.__course_subjects, s)
+
+        return list([
+            CourseRecord(
+                self.__course_numbers[i],
+                self.__course_names[i],
+                self.__course_descriptions[i] or None,
+            )
+            for i in range(start, end)
+        ])
+
+    def find_crn(self, crn):
+        """
+        :return: A dict in the form
+            {
+                'course': Course('CS', '2110'),
+                'name': 'A2',
+                'capacity': Capacity(50, 49),
+            }
+            where capacity is None if it was not known when the catalog
+            was built, or None if the CRN is not in the catalog.
+        """
+
+        if not str(crn).isdigit():
+            return None
+        crn = int(crn)
+
+        i = bisect_left(self.__crns, crn)
+        if i < len(self.__crns) and self.__crns[i] == crn:
+            return self.__section(i)
+
+    def find_section(self, subject_id, number, name):
+        """
+        :return: The CRN of a course's section with a name (which is not
+            case-sensitive), or None if there is not exactly one.
+        """
+
+        s = self.__subject_position(subject_id)
+        if s is None:
+            return None
+
+        order = self.__section_order
+
+        def key(j):
+            i = order[j]
+            return (self.__section_subjects[i], self.__section_courses[i],
+                    self.__section_names[i].upper())
+
+        keys = _Column(len(order), key)
+        target = (s, number, name.upper())
+        start = bisect_left(keys, target)
+        end = bisect_right(keys, target, start)
+
+        if end - start == 1:
+            return str(self.__crns[order[start]])
+
+    def __section(self, i):
+        capacity = None
+        if self.__section_max[i] >= 0:
+            capacity = Capacity(self.__section_max[i],
+                                self.__section_current[i])
+        return {
+            'course': Course(
+                self.__subject_ids[self.__section_subjects[i]],
+                self.__section_courses[i],
+            ),
+            'name': self.__section_names[i],
+            'capacity': capacity,
+        }
@@ -0,0 +1,695 @@
+"""
+A versioned binary encoding for the snapshots that the Journal stores,
+in place of pickle. Unlike pickle, it refers to no classes by name, so
+snapshots survive changes to the model classes and can be shared
+between machines safely.
+
+A snapshot is:
+
+    magic        4 bytes, "GRCH"
+    version      1 byte, the version of this encoding
+    compression  1 byte: 0 for none, 1 for zlib, 2 for lzma
+    body         the rest, compressed as given
+
+and the body is two values: a schema, then the data. The schema is a
+dict in the form
+    {
+        'type': 'Sections',
+        'version': 1,
+        'records': [
+            ('CourseRecord', ['number', 'name', 'description']),
+            ('SectionRecord', ['crn', 'course', 'name']),
+        ],
+    }
+naming the type of the snapshot, the version of that type's layout,
+and the kinds of record, each with its fields in the order they are
+encoded. A record refers to its kind by position in that list.
+Records are decoded by field name, so a field which is added later is
+simply missing (and defaulted) in older snapshots.
+
+Each value begins with a one-byte tag. Integers are zigzag varints,
+and strings are positions in a table of every distinct string, which
+comes first. A lazy list is encoded with the offset of each item, so
+that items are decoded only when they are accessed; a lazy list of
+strings, or of records whose fields are strings (or None), is encoded
+instead as columns of positions in the string table, so that it can
+also be decoded in full at little more than the cost of decoding the
+table.
+
+Snapshots from before this encoding are pickles; load reads them too.
+"""
+
+from array import array
+import struct
+import sys
+
+from model import Capacity, Course, CourseRecord, SectionRecord, Subject, \
+    Term
+
+MAGIC = b'GRCH'
+VERSION = 2
+
+# The versions of this encoding that load reads. Version 1 lacks the
+# columnar lazy lists.
+_readable = (1, 2)
+
+# Compression methods, by name and by their number in the header.
+_compressions = {'none': 0, 'zlib': 1, 'lzma': 2}
+
+# The kinds of record, in the order they are listed in schemas.
+_records = [CourseRecord, SectionRecord]
+_record_positions = dict((r, i) for (i, r) in enumerate(_records))
+
+_float = struct.Struct('<d')
+
+
+class Lazy:
+    """
+    Marks a sequence to be encoded as a lazy list.
+    """
+
+    def __init__(self, items):
+        self.items = items
+
+
+# Encoding
+# -------------------------------------------------------------
+
+def dump(fp, type_name, value, compression='none', version=1):
+    """
+    Writes a snapshot.
+
+    :param type_name: The name of the type of snapshot, checked by load.
+    :param compression: 'none', 'zlib' or 'lzma'.
+    :param version: The version of the type's layout.
+    """
+
+    if compression not in _compressions:
+        raise ValueError('unknown compression: %s' % compression)
+
+    schema = {
+        'type': type_name,
+        'version': version,
+        'records': list([(r.__name__, list(r._fields)) for r in _records]),
+    }
+
+    encoder = _Encoder()
+    encoder.encode(schema)
+    encoder.encode(value)
+    body = encoder.get_bytes()
+
+    if compression == 'zlib':
+        import zlib
+        body = zlib.compress(body)
+    elif compression == 'lzma':
+        import lzma
+        body = lzma.compress(body)
+
+    fp.write(MAGIC + bytes(bytearray([VERSION,
+                                      _compressions[compression]])))
+    fp.write(body)
+
+
+def _varint(out, n):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+class _Encoder:
+    """
+    Encodes values, collecting each distinct string once into a table
+    which is written before them; values refer to strings by their
+    positions in the table.
+    """
+
+    def __init__(self):
+        self.__out = bytearray()
+        self.__strings = {}
+
+    def get_bytes(self):
+        table = bytearray()
+        _varint(table, len(self.__strings))
+        blob = bytearray()
+        offsets = array('I', [0])
+        for s in sorted(self.__strings, key=self.__strings.get):
+            blob.extend(s.encode('utf-8'))
+            offsets.append(len(blob))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        table.extend(offsets.tobytes())
+        return bytes(table + blob + self.__out)
+
+    def encode(self, value):
+        self.__encode(self.__out, value)
+
+    def __int(self, out, n):
+        _varint(out, (n << 1) if n >= 0 else ((-n << 1) - 1))
+
+    def __index(self, s):
+        i = self.__strings.get(s)
+        if i is None:
+            i = self.__strings[s] = len(self.__strings)
+        return i
+
+    def __str(self, out, s):
+        _varint(out, self.__index(s))
+
+    def __encode(self, out, value):
+        t = type(value)
+
+        if value is None:
+            out.append(_N)
+        elif value is True:
+            out.append(_T)
+        elif value is False:
+            out.append(_F)
+        elif t is int:
+            out.append(_i)
+            self.__int(out, value)
+        elif t is float:
+            out.append(_f)
+            out.extend(_float.pack(value))
+        elif isinstance(value, str):
+            out.append(_s)
+            self.__str(out, value)
+        elif isinstance(value, bytes):
+            out.append(_b)
+            _varint(out, len(value))
+            out.extend(value)
+        elif t in _record_positions:
+            out.append(_R)
+            _varint(out, _record_positions[t])
+            for field in value:
+                self.__encode(out, field)
+        elif t is Term:
+            out.append(_Y)
+            self.__int(out, value.get_season())
+            self.__int(out, value.get_year())
+        elif t is Subject:
+            out.append(_S)
+            self.__encode(out, value.get_id())
+            self.__encode(out, value.get_name())
+        elif t is Course:
+            out.append(_C)
+            self.__encode(out, value.get_subject())
+            self.__encode(out, value.get_number())
+        elif t is Capacity:
+            out.append(_P)
+            self.__int(out, value.get_max())
+            self.__int(out, value.get_current())
+        elif t is array:
+            out.append(_A)
+            out.append(ord(value.typecode))
+            if sys.byteorder != 'little':
+                value = array(value.typecode, value)
+                value.byteswap()
+            b = value.tobytes()
+            _varint(out, len(b))
+            out.extend(b)
+        elif t is tuple:
+            out.append(_t)
+            _varint(out, len(value))
+            for item in value:
+                self.__encode(out, item)
+        elif t is dict:
+            out.append(_d)
+            _varint(out, len(value))
+            for (k, v) in value.items():
+                self.__encode(out, k)
+                self.__encode(out, v)
+        elif t is Lazy:
+            self.__encode_lazy(out, list(value.items))
+        else:
+            # Lists, and sequences such as LazyList.
+            out.append(_l)
+            value = list(value)
+            _varint(out, len(value))
+            for item in value:
+                self.__encode(out, item)
+
+    def __positions(self, out, positions):
+        if sys.byteorder != 'little':
+            positions.byteswap()
+        out.extend(positions.tobytes())
+
+    def __encode_lazy(self, out, items):
+
+        if items and all(isinstance(item, str) for item in items):
+            out.append(_W)
+            _varint(out, len(items))
+            self.__positions(out, array('I', [
+                self.__index(item) for item in items]))
+            return
+
+        kind = type(items[0]) if items else None
+        if kind in _record_positions \
+                and all(type(item) is kind for item in items) \
+                and all(isinstance(field, str) or field is None
+                        for item in items for field in item):
+            # Each column holds a position in the string table plus
+            # one, or 0 for None.
+            out.append(_Q)
+            _varint(out, _record_positions[kind])
+            _varint(out, len(items))
+            for column in zip(*items):
+                self.__positions(out, array('I', [
+                    0 if field is None else self.__index(field) + 1
+                    for field in column]))
+            return
+
+        encoded = []
+        for item in items:
+            b = bytearray()
+            self.__encode(b, item)
+            encoded.append(b)
+        out.append(_L)
+        _varint(out, len(encoded))
+        offsets = array('I', [0])
+        for b in encoded:
+            offsets.append(offsets[-1] + len(b))
+        self.__positions(out, offsets)
+        for b in encoded:
+            out.extend(b)
+
+
+# Decoding
+# -------------------------------------------------------------
+
+def load(fp, type_name):
+    """
+    Reads a snapshot.
+
+    :return: A tuple (value, schema version). For a pickle from before
+        this encoding, the value is whatever was pickled and the version
+        is None.
+    """
+
+    data = fp.read()
+
+    if data[:len(MAGIC)] != MAGIC:
+        import pickle
+        return (pickle.loads(data), None)
+
+    (version, compression) = bytearray(data[len(MAGIC):len(MAGIC) + 2])
+    if version not in _readable:
+        raise ValueError('unsupported snapshot version %d' % version)
+
+    body = data[len(MAGIC) + 2:]
+    if compression == _compressions['zlib']:
+        import zlib
+        body = zlib.decompress(body)
+    elif compression == _compressions['lzma']:
+        import lzma
+        body = lzma.decompress(body)
+    elif compression != _compressions['none']:
+        raise ValueError('unknown compression: %d' % compression)
+
+    decoder = _Decoder(memoryview(body))
+    schema = decoder.decode()
+    if schema['type'] != type_name:
+        raise ValueError('expected a %s snapshot, not %s'
+                         % (type_name, schema['type']))
+    decoder.use_schema(schema)
+
+    return (decoder.decode(), schema['version'])
+
+
+def _uint32s(buf, pos, n):
+    """
+    :return: n uint32s from a buffer, starting at pos.
+    """
+    if sys.byteorder == 'little':
+        return buf[pos:pos + 4 * n].cast('I')
+    a = array('I', bytes(buf[pos:pos + 4 * n]))
+    a.byteswap()
+    return a
+
+
+class _Decoder:
+    """
+    Decodes values from a body, starting with its string table. Strings
+    are decoded from the table only when they are first used.
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+        self.records = []
+
+        n = self.varint()
+        self.__offsets = _uint32s(buf, self.pos, n + 1)
+        self.__blob = self.pos + 4 * (n + 1)
+        self.__strings = [None] * n
+        self.pos = self.__blob + self.__offsets[n]
+
+    def use_schema(self, schema):
+        # For each kind of record in the snapshot: its type (or None if
+        # it is no longer known); for each of its fields, the field's
+        # position in the type (or None if the type no longer has it);
+        # and whether those are simply the type's fields in order.
+        types = dict((r.__name__, r) for r in _records)
+        self.records = []
+        for (name, fields) in schema['records']:
+            r = types.get(name)
+            positions = list([
+                r._fields.index(f) if r is not None and f in r._fields
+                else None
+                for f in fields
+            ])
+            in_order = r is not None \
+                and positions == list(range(len(r._fields)))
+            self.records.append((r, positions, in_order))
+
+    def at_position(self, pos):
+        """
+        :return: A new decoder at a position, which shares this one's
+            strings, so that this one is undisturbed.
+        """
+        decoder = _Decoder.__new__(_Decoder)
+        decoder.__dict__.update(self.__dict__)
+        decoder.pos = pos
+        return decoder
+
+    def at(self, pos):
+        """
+        Decodes the value at a position.
+        """
+        return self.at_position(pos).decode()
+
+    def varint(self):
+        buf = self.buf
+        b = buf[self.pos]
+        self.pos += 1
+        if b < 0x80:
+            return b
+        n = b & 0x7f
+        shift = 7
+        while True:
+            b = buf[self.pos]
+            self.pos += 1
+            n |= (b & 0x7f) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    def integer(self):
+        n = self.varint()
+        return (n >> 1) if not n & 1 else -((n + 1) >> 1)
+
+    def string(self):
+        return self.string_at(self.varint())
+
+    def string_at(self, i):
+        """
+        :return: The string at a position in the table.
+        """
+        s = self.__strings[i]
+        if s is None:
+            start = self.__blob + self.__offsets[i]
+            end = self.__blob + self.__offsets[i + 1]
+            # Interned, as the model interns the strings it is given.
+            s = self.__strings[i] = sys.intern(
+                str(self.buf[start:end], 'utf-8'))
+        return s
+
+    def count_strings(self):
+        return len(self.__strings)
+
+    def strings(self):
+        """
+        :return: The table of strings, all decoded. Decoders at other
+            positions share it.
+        """
+
+        table = self.__strings
+        if None not in table:
+            return table
+
+        offsets = self.__offsets
+        raw = self.buf[self.__blob:self.__blob + offsets[len(table)]]
+        text = str(raw, 'utf-8')
+        if len(text) == len(raw):
+            # ASCII, so the offsets of bytes are those of characters.
+            decoded = [text[a:b] for (a, b) in zip(offsets, offsets[1:])]
+        else:
+            decoded = [str(raw[a:b], 'utf-8')
+                       for (a, b) in zip(offsets, offsets[1:])]
+        table[:] = map(sys.intern, decoded)
+        return table
+
+    def decode(self):
+        tag = self.buf[self.pos]
+        self.pos += 1
+        return _decoders[tag](self)
+
+    def decode_record(self):
+        (r, positions, in_order) = self.records[self.varint()]
+        buf = self.buf
+
+        # Most fields are strings, so they are decoded here directly.
+        values = []
+        for _ in positions:
+            if buf[self.pos] == _s:
+                self.pos += 1
+                values.append(self.string())
+            else:
+                values.append(self.decode())
+
+        if r is None:
+            return None
+        if not in_order:
+            ordered = [None] * len(r._fields)
+            for (p, value) in zip(positions, values):
+                if p is not None:
+                    ordered[p] = value
+            values = ordered
+        # The strings are interned already.
+        return tuple.__new__(r, values)
+
+    def decode_bytes(self):
+        n = self.varint()
+        b = bytes(self.buf[self.pos:self.pos + n])
+        self.pos += n
+        return b
+
+    def decode_float(self):
+        x = _float.unpack_from(self.buf, self.pos)[0]
+        self.pos += _float.size
+        return x
+
+    def decode_array(self):
+        typecode = chr(self.buf[self.pos])
+        self.pos += 1
+        a = array(typecode)
+        a.frombytes(self.decode_bytes())
+        if sys.byteorder != 'little':
+            a.byteswap()
+        return a
+
+    def decode_list(self):
+        return list([self.decode() for _ in range(self.varint())])
+
+    def decode_tuple(self):
+        return tuple([self.decode() for _ in range(self.varint())])
+
+    def decode_dict(self):
+        d = {}
+        for _ in range(self.varint()):
+            k = self.decode()
+            d[k] = self.decode()
+        return d
+
+    def decode_lazy(self):
+        n = self.varint()
+        offsets = _uint32s(self.buf, self.pos, n + 1)
+        self.pos += 4 * (n + 1)
+        items = LazyList(self, self.pos, offsets)
+        self.pos += offsets[n]
+        return items
+
+    def decode_lazy_strings(self):
+        n = self.varint()
+        positions = _uint32s(self.buf, self.pos, n)
+        self.pos += 4 * n
+        return _StringList(self, positions)
+
+    def decode_lazy_records(self):
+        (r, positions, _) = self.records[self.varint()]
+        n = self.varint()
+        columns = []
+        for _ in positions:
+            columns.append(_uint32s(self.buf, self.pos, n))
+            self.pos += 4 * n
+        if r is None:
+            return [None] * n
+
+        # The columns in the order of the type's fields (or None for
+        # those missing from the snapshot).
+        ordered = [None] * len(r._fields)
+        for (p, column) in zip(positions, columns):
+            if p is not None:
+                ordered[p] = column
+        return _RecordList(self, r, n, ordered)
+
+
+# Tags, and the functions that decode the values they begin.
+_tags = {
+    'N': lambda d: None,
+    'T': lambda d: True,
+    'F': lambda d: False,
+    'i': _Decoder.integer,
+    'f': _Decoder.decode_float,
+    's': _Decoder.string,
+    'b': _Decoder.decode_bytes,
+    'R': _Decoder.decode_record,
+    'Y': lambda d: Term(d.integer(), d.integer()),
+    'S': lambda d: Subject(d.decode(), d.decode()),
+    'C': lambda d: Course(d.decode(), d.decode()),
+    'P': lambda d: Capacity(d.integer(), d.integer()),
+    'A': _Decoder.decode_array,
+    'l': _Decoder.decode_list,
+    't': _Decoder.decode_tuple,
+    'd': _Decoder.decode_dict,
+    'L': _Decoder.decode_lazy,
+    'W': _Decoder.decode_lazy_strings,
+    'Q': _Decoder.decode_lazy_records,
+}
+
+(_N, _T, _F, _i, _f, _s, _b, _R, _Y, _S, _C, _P, _A, _l, _t, _d, _L, _W,
+ _Q) = [ord(c) for c in 'NTFifsbRYSCPAltdLWQ']
+
+_decoders = [None] * 256
+for (_c, _fn) in _tags.items():
+    _decoders[ord(_c)] = _fn
+
+
+class _LazySequence:
+    """
+    A read-only list whose items are decoded from a snapshot when they
+    are first accessed.
+    """
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list([self[j] for j in range(*i.indices(len(self)))])
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._item(i)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, list(self))
+
+
+class LazyList(_LazySequence):
+    """
+    A lazy list of any values, each encoded apart.
+    """
+
+    def __init__(self, decoder, start, offsets):
+        """
+        :param offsets: The offset of each item from start, and of the
+            end of the last.
+        """
+        self.__decoder = decoder
+        self.__start = start
+        self.__offsets = offsets
+        self.__items = [None] * (len(offsets) - 1)
+        self.__decoded = [False] * (len(offsets) - 1)
+
+    def __len__(self):
+        return len(self.__items)
+
+    def _item(self, i):
+        if not self.__decoded[i]:
+            self.__items[i] = self.__decoder.at(
+                self.__start + self.__offsets[i])
+            self.__decoded[i] = True
+        return self.__items[i]
+
+    def __iter__(self):
+        # Decode in order with one decoder, rather than one per item.
+        decoder = None
+        for i in range(len(self)):
+            if not self.__decoded[i]:
+                if decoder is None:
+                    decoder = self.__decoder.at_position(self.__start)
+                decoder.pos = self.__start + self.__offsets[i]
+                self.__items[i] = decoder.decode()
+                self.__decoded[i] = True
+            yield self.__items[i]
+
+
+class _StringList(_LazySequence):
+    """
+    A lazy list of strings, kept as their positions in the table.
+    """
+
+    def __init__(self, decoder, positions):
+        self.__decoder = decoder
+        self.__positions = positions
+
+    def __len__(self):
+        return len(self.__positions)
+
+    def _item(self, i):
+        return self.__decoder.string_at(self.__positions[i])
+
+    def __iter__(self):
+        decoder = self.__decoder
+        # Decoding the whole table at once is quicker, unless this list
+        # holds only a small part of it.
+        if 4 * len(self) < decoder.count_strings():
+            get = decoder.string_at
+        else:
+            get = decoder.strings().__getitem__
+        return iter(list(map(get, self.__positions)))
+
+
+class _RecordList(_LazySequence):
+    """
+    A lazy list of records, kept as a column for each field of
+    positions in the table (plus one, or 0 for None).
+    """
+
+    def __init__(self, decoder, type_, n, columns):
+        self.__decoder = decoder
+        self.__type = type_
+        self.__n = n
+        self.__columns = columns
+        self.__items = None
+
+    def __len__(self):
+        return self.__n
+
+    def _item(self, i):
+        if self.__items is not None:
+            return self.__items[i]
+        string_at = self.__decoder.string_at
+        return tuple.__new__(self.__type, [
+            None if c is None or c[i] == 0 else string_at(c[i] - 1)
+            for c in self.__columns
+        ])
+
+    def __iter__(self):
+        if self.__items is None:
+            table = [None] + self.__decoder.strings()
+            columns = list([
+                map(table.__getitem__, c) if c is not None
+                else [None] * self.__n
+                for c in self.__columns
+            ])
+            # The strings are interned already.
+            self.__items = list(map(tuple.__new__,
+                                    [self.__type] * self.__n,
+                                    zip(*columns)))
+        return iter(self.__items)
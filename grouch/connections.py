@@ -0,0 +1,431 @@
+"""
+The HTTP connection pools that scrapers send their requests through,
+blocking and asyncio, and the judgement of which of the errors they
+raise are worth retrying. Unlike transport, this imports asyncio,
+http.client and urllib, so it is imported only once something is to
+be fetched.
+"""
+
+import asyncio
+from http.client import HTTPConnection, HTTPException, HTTPSConnection, \
+    parse_headers
+from io import BytesIO
+import threading
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+
+def retry_delay(policy, error, retry):
+    """
+    :param policy: The RetryPolicy.
+    :param error: The exception that the request failed with.
+    :param retry: The number of this retry, starting at 1.
+    :return: The number of seconds to wait before the retry, or None if
+        the request should not be retried.
+    """
+
+    if retry > policy.retries:
+        return None
+
+    if isinstance(error, HTTPError):
+        if error.code not in policy.statuses:
+            return None
+        after = None
+        if error.headers:
+            after = error.headers.get('Retry-After')
+        if after is not None and after.strip().isdigit():
+            return min(policy.max_delay, float(after))
+    elif not isinstance(error, (HTTPException, OSError,
+                                asyncio.TimeoutError,
+                                asyncio.IncompleteReadError)):
+        return None
+
+    return policy.backoff(retry)
+
+
+def _split_request(request):
+    """
+    :return: A tuple (key, path, method, data, headers) describing
+        a urllib Request, where key is (scheme, netloc).
+    """
+
+    (scheme, netloc, path, query, fragment) = \
+        urlsplit(request.get_full_url())
+
+    if query:
+        path = '%s?%s' % (path, query)
+
+    data = request.data
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    headers = dict(request.header_items())
+    if data is not None:
+        headers.setdefault('Content-Type',
+                           'application/x-www-form-urlencoded')
+
+    return ((scheme, netloc), path or '/', request.get_method(),
+            data, headers)
+
+
+class ConnectionPool:
+    """
+    Keeps HTTP connections open between requests so that consecutive
+    fetches from the same host do not each pay for a new TCP and TLS
+    handshake.
+
+    At most max_per_host connections to any one host are open at
+    once; a request for a host that is already at its limit waits for
+    one of the other connections to be released.
+
+    :param timeout: The number of seconds that connecting, or waiting
+        for any part of a response, may take before the request fails.
+    """
+
+    def __init__(self, context, max_per_host=4, timeout=30):
+        self.__context = context
+        self.__max_per_host = max_per_host
+        self.__timeout = timeout
+        self.__lock = threading.Lock()
+        self.__idle = {}
+        self.__slots = {}
+        self.__hits = 0
+        self.__misses = 0
+
+    def get_hits(self):
+        return self.__hits
+
+    def get_misses(self):
+        return self.__misses
+
+    def open(self, request):
+        """
+        Sends a urllib Request and reads the entire response.
+
+        :return: A tuple (response, body).
+        """
+
+        (key, path, method, data, headers) = _split_request(request)
+        netloc = key[1]
+
+        slot = self.__slot(key)
+        slot.acquire()
+        try:
+            (conn, reused) = self.__checkout(key)
+            try:
+                (response, body) = self.__exchange(
+                    conn, method, path, data, headers)
+            except (HTTPException, OSError):
+                conn.close()
+                if not reused:
+                    raise
+                # An idle connection may have been closed by the server
+                # since we last used it. Try once more on a new one.
+                (conn, reused) = self.__new_connection(key), False
+                (response, body) = self.__exchange(
+                    conn, method, path, data, headers)
+            self.__checkin(key, conn, response)
+        finally:
+            slot.release()
+
+        self.__log(netloc, reused)
+
+        if not 200 <= response.status < 300:
+            raise HTTPError(request.get_full_url(), response.status,
+                            response.reason, response.msg, None)
+
+        return (response, body)
+
+    def stream(self, request, chunk_size=65536, on_response=None):
+        """
+        Sends a urllib Request, and yields the response body in chunks
+        as it arrives rather than reading it all into memory first.
+
+        :param on_response: An optional function which is called with
+            the response (whose body has not yet been read) before the
+            first chunk is yielded.
+        """
+
+        (key, path, method, data, headers) = _split_request(request)
+        netloc = key[1]
+
+        slot = self.__slot(key)
+        slot.acquire()
+        try:
+            (conn, reused) = self.__checkout(key)
+            try:
+                response = self.__send(conn, method, path, data, headers)
+            except (HTTPException, OSError):
+                conn.close()
+                if not reused:
+                    raise
+                (conn, reused) = self.__new_connection(key), False
+                response = self.__send(conn, method, path, data, headers)
+
+            self.__log(netloc, reused)
+
+            try:
+                if not 200 <= response.status < 300:
+                    raise HTTPError(request.get_full_url(),
+                                    response.status, response.reason,
+                                    response.msg, None)
+                if on_response is not None:
+                    on_response(response)
+                while True:
+                    chunk = response.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+            except BaseException:
+                # The rest of the response is unread, so this
+                # connection cannot be used for another request.
+                conn.close()
+                raise
+
+            self.__checkin(key, conn, response)
+        finally:
+            slot.release()
+
+    def close(self):
+        with self.__lock:
+            for conns in self.__idle.values():
+                for conn in conns:
+                    conn.close()
+            self.__idle = {}
+
+    def __slot(self, key):
+        with self.__lock:
+            if key not in self.__slots:
+                self.__slots[key] = threading.BoundedSemaphore(
+                    self.__max_per_host)
+            return self.__slots[key]
+
+    def __checkout(self, key):
+        with self.__lock:
+            conns = self.__idle.get(key)
+            if conns:
+                self.__hits += 1
+                return (conns.pop(), True)
+            self.__misses += 1
+        return (self.__new_connection(key), False)
+
+    def __checkin(self, key, conn, response):
+        if response.will_close:
+            conn.close()
+            return
+        with self.__lock:
+            self.__idle.setdefault(key, []).append(conn)
+
+    def __new_connection(self, key):
+        (scheme, netloc) = key
+        if scheme == 'https':
+            return HTTPSConnection(netloc, timeout=self.__timeout)
+        return HTTPConnection(netloc, timeout=self.__timeout)
+
+    def __send(self, conn, method, path, data, headers):
+        conn.request(method, path, body=data, headers=headers)
+        return conn.getresponse()
+
+    def __exchange(self, conn, method, path, data, headers):
+        response = self.__send(conn, method, path, data, headers)
+        body = response.read()
+        return (response, body)
+
+    def __log(self, netloc, reused):
+        self.__context.get_logger().info(
+            'HTTP pool %s: %s (hits: %d, misses: %d)' % (
+                netloc,
+                'hit' if reused else 'miss',
+                self.__hits,
+                self.__misses,
+            ))
+
+
+class AsyncResponse:
+    """
+    The status line and headers of a response read by
+    AsyncConnectionPool.
+    """
+
+    def __init__(self, status, reason, msg, will_close):
+        self.status = status
+        self.reason = reason
+        self.msg = msg
+        self.will_close = will_close
+
+    def getheader(self, name, default=None):
+        return self.msg.get(name, default)
+
+
+class AsyncConnectionPool:
+    """
+    The asyncio counterpart of ConnectionPool. Connections are asyncio
+    streams speaking HTTP/1.1, kept open between requests and capped
+    at max_per_host per host. All methods must be called from the same
+    event loop.
+
+    :param timeout: The number of seconds that a whole request may take
+        before it fails.
+    """
+
+    def __init__(self, context, max_per_host=4, timeout=30):
+        self.__context = context
+        self.__max_per_host = max_per_host
+        self.__timeout = timeout
+        self.__idle = {}
+        self.__slots = {}
+        self.__hits = 0
+        self.__misses = 0
+
+    def get_hits(self):
+        return self.__hits
+
+    def get_misses(self):
+        return self.__misses
+
+    async def open(self, request):
+        """
+        Sends a urllib Request and reads the entire response.
+
+        :return: A tuple (response, body).
+        """
+        return await asyncio.wait_for(self.__open(request), self.__timeout)
+
+    async def __open(self, request):
+
+        (key, path, method, data, headers) = _split_request(request)
+        netloc = key[1]
+        headers.setdefault('Host', netloc)
+
+        if key not in self.__slots:
+            self.__slots[key] = asyncio.Semaphore(self.__max_per_host)
+
+        async with self.__slots[key]:
+            (stream, reused) = await self.__checkout(key)
+            try:
+                (response, body) = await self.__exchange(
+                    stream, method, path, data, headers)
+            except (HTTPException, OSError, asyncio.IncompleteReadError):
+                stream[1].close()
+                if not reused:
+                    raise
+                stream = await self.__new_connection(key)
+                reused = False
+                try:
+                    (response, body) = await self.__exchange(
+                        stream, method, path, data, headers)
+                except BaseException:
+                    stream[1].close()
+                    raise
+            except asyncio.CancelledError:
+                # Timed out partway through a response, so this
+                # connection cannot be used for another request.
+                stream[1].close()
+                raise
+            self.__checkin(key, stream, response)
+
+        self.__context.get_logger().info(
+            'Async HTTP pool %s: %s (hits: %d, misses: %d)' % (
+                netloc,
+                'hit' if reused else 'miss',
+                self.__hits,
+                self.__misses,
+            ))
+
+        if not 200 <= response.status < 300:
+            raise HTTPError(request.get_full_url(), response.status,
+                            response.reason, response.msg, None)
+
+        return (response, body)
+
+    def close(self):
+        for streams in self.__idle.values():
+            for (reader, writer) in streams:
+                writer.close()
+        self.__idle = {}
+
+    async def __checkout(self, key):
+        streams = self.__idle.get(key)
+        if streams:
+            self.__hits += 1
+            return (streams.pop(), True)
+        self.__misses += 1
+        return (await self.__new_connection(key), False)
+
+    def __checkin(self, key, stream, response):
+        if response.will_close:
+            stream[1].close()
+            return
+        self.__idle.setdefault(key, []).append(stream)
+
+    async def __new_connection(self, key):
+        (scheme, netloc) = key
+        (host, sep, port) = netloc.rpartition(':')
+        if not sep:
+            (host, port) = (netloc, None)
+        if port is None:
+            port = 443 if scheme == 'https' else 80
+        return await asyncio.open_connection(
+            host, int(port), ssl=(scheme == 'https'))
+
+    async def __exchange(self, stream, method, path, data, headers):
+        (reader, writer) = stream
+
+        if data is not None:
+            headers['Content-Length'] = str(len(data))
+
+        head = ['%s %s HTTP/1.1' % (method, path)]
+        head.extend('%s: %s' % item for item in headers.items())
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        if data is not None:
+            writer.write(data)
+        await writer.drain()
+
+        status_line = (await reader.readline()).decode('latin-1')
+        try:
+            (version, status, reason) = \
+                (status_line.rstrip('\r\n').split(' ', 2) + [''])[:3]
+            status = int(status)
+        except ValueError:
+            raise HTTPException('bad status line: %r' % status_line)
+
+        lines = []
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise asyncio.IncompleteReadError(b''.join(lines), None)
+            lines.append(line)
+            if line in (b'\r\n', b'\n'):
+                break
+        msg = parse_headers(BytesIO(b''.join(lines)))
+
+        will_close = msg.get('Connection', '').lower() == 'close' \
+            or version == 'HTTP/1.0'
+
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            body = b''
+        elif 'chunked' in msg.get('Transfer-Encoding', '').lower():
+            body = await self.__read_chunked(reader)
+        elif msg.get('Content-Length') is not None:
+            body = await reader.readexactly(int(msg['Content-Length']))
+        else:
+            body = await reader.read()
+            will_close = True
+
+        return (AsyncResponse(status, reason, msg, will_close), body)
+
+    async def __read_chunked(self, reader):
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        # Discard any trailers, up to the terminating blank line.
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+        return b''.join(chunks)
@@ -1,6 +1,8 @@
 import logging
 import os
+import threading
 
+from cache import RetentionPolicy, backends
 from util import makedirs
 
 
@@ -9,20 +11,55 @@ def config_home():
            or ('%s/.config' % os.getenv('HOME'))
 
 
+class _LogHandler(logging.FileHandler):
+    """
+    A FileHandler which creates its file, and the directory it is in,
+    only when the first record is logged.
+    """
+
+    def __init__(self, filename):
+        logging.FileHandler.__init__(self, filename, delay=True)
+
+    def _open(self):
+        makedirs(os.path.dirname(self.baseFilename))
+        return logging.FileHandler._open(self)
+
+
 class Context:
-    def __init__(self):
+    def __init__(self, cache='file', retention=None, compression='none'):
+        """
+        :param cache: The name of the cache backend, either 'file' (one
+            file per snapshot in a directory tree) or 'sqlite' (a single
+            database file).
+        :param retention: The RetentionPolicy for pruning the cache.
+            Defaults to RetentionPolicy().
+        :param compression: How snapshots are compressed when they are
+            written: 'none', 'zlib' or 'lzma'.
+        """
+
+        if cache not in backends:
+            raise ValueError('unknown cache backend: %s' % cache)
+
+        if retention is None:
+            retention = RetentionPolicy()
+
+        self.__retention = retention
+        self.__compression = compression
+        self.__cache_name = cache
+        self.__cache = None
+        self.__cache_lock = threading.Lock()
+
         self.init_config_dir()
         self.init_logger()
 
     def init_config_dir(self):
+        # The directory is created by whatever first writes to it.
         self.__config_dir = '%s/grouch' % config_home()
-        makedirs(self.__config_dir)
 
     def init_logger(self):
         logger = logging.getLogger(__name__)
 
-        handler = logging.FileHandler(
-            '%s/log' % self.__config_dir)
+        handler = _LogHandler('%s/log' % self.__config_dir)
 
         formatter = logging.Formatter(
             '%(asctime)s %(levelname)s - %(message)s\n')
@@ -38,3 +75,18 @@ class Context:
 
     def get_logger(self):
         return self.__logger
+
+    def get_cache_name(self):
+        return self.__cache_name
+
+    def get_cache(self):
+        with self.__cache_lock:
+            if self.__cache is None:
+                self.__cache = backends[self.__cache_name](self)
+            return self.__cache
+
+    def get_retention(self):
+        return self.__retention
+
+    def get_compression(self):
+        return self.__compression
@@ -0,0 +1,533 @@
+from array import array
+from bisect import bisect_left
+import difflib
+import heapq
+import math
+import re
+
+import codec
+
+
+def _bigrams(s):
+    return set(s[i:i + 2] for i in range(len(s) - 1))
+
+
+_stop_words = frozenset([
+    'a', 'an', 'and', 'for', 'in', 'of', 'on', 'or', 'the', 'to', 'with',
+])
+
+
+def _words(s):
+    """
+    :return: The lowercase words of a string, less stop words.
+    """
+    return [w for w in re.findall(r'[a-z0-9]+', (s or '').lower())
+            if w not in _stop_words]
+
+
+class SubjectIndex:
+    """
+    Finds subjects by id, by name, or by abbreviated or misspelled name,
+    without scanning every subject for each query. Subjects are referred
+    to by their positions in the list the index was built from, so the
+    index can be stored apart from the subjects themselves.
+
+    For a query, in order of preference:
+    - the first subject whose id is the query;
+    - the first subject whose name is the query;
+    - the only subject whose name's words each begin with the
+      corresponding word of the query, e.g. "comp sci" for "Computer
+      Science";
+    - the subject whose name is closest to the query (as measured by
+      difflib), considering only names that share a pair of letters
+      with it.
+
+    Queries are not case-sensitive.
+    """
+
+    def __init__(self, subjects):
+        self.__names = [s.get_name().upper() for s in subjects]
+        self.__ids = {}
+        self.__by_name = {}
+        self.__prefixes = {}
+        self.__bigrams = {}
+
+        for (i, subject) in enumerate(subjects):
+            self.__ids.setdefault(subject.get_id().upper(), i)
+            name = self.__names[i]
+            self.__by_name.setdefault(name, i)
+
+            words = name.split()
+            if words:
+                first = words[0]
+                for j in range(1, len(first) + 1):
+                    self.__prefixes.setdefault(first[:j], []).append(i)
+
+            for bigram in _bigrams(name):
+                self.__bigrams.setdefault(bigram, []).append(i)
+
+    def get_state(self):
+        """
+        :return: A tuple (names, ids, names by position, prefixes,
+            bigrams), where the positions which a prefix or bigram maps
+            to are arrays.
+        """
+
+        def packed(d):
+            return dict((k, array('I', v)) for (k, v) in d.items())
+
+        return (self.__names, self.__ids, self.__by_name,
+                packed(self.__prefixes), packed(self.__bigrams))
+
+    @staticmethod
+    def from_state(state):
+        """
+        :param state: As from get_state.
+        :return: A SubjectIndex.
+        """
+        index = SubjectIndex([])
+        (index.__names, index.__ids, index.__by_name, index.__prefixes,
+         index.__bigrams) = state
+        return index
+
+    def find(self, s):
+        """
+        :return: The position of the subject that best matches the
+            query, or None if there is none.
+        """
+
+        s = s.upper()
+
+        if s in self.__ids:
+            return self.__ids[s]
+
+        if s in self.__by_name:
+            return self.__by_name[s]
+
+        i = self.__find_abbreviation(s)
+        if i is not None:
+            return i
+
+        return self.__find_close(s)
+
+    def __find_abbreviation(self, s):
+        words = s.split()
+        if not words:
+            return None
+
+        matches = []
+        for i in self.__prefixes.get(words[0], []):
+            name_words = self.__names[i].split()
+            if len(name_words) >= len(words) and all(
+                    n.startswith(w) for (n, w) in zip(name_words, words)):
+                matches.append(i)
+
+        if len(matches) == 1:
+            return matches[0]
+
+    def __find_close(self, s):
+        candidates = set()
+        for bigram in _bigrams(s):
+            candidates.update(self.__bigrams.get(bigram, ()))
+
+        names = [self.__names[i] for i in sorted(candidates)]
+        matches = difflib.get_close_matches(s, names, n=1)
+
+        if matches:
+            return self.__by_name[matches[0]]
+
+
+class SectionIndex:
+    """
+    Groups the sections of a subject by course. Sections are referred
+    to by their positions in the list the index was built from.
+    """
+
+    def __init__(self, sections):
+        self.__by_course = {}
+        self.__crns = {}
+
+        for (i, section) in enumerate(sections):
+            course = section['course']
+            self.__by_course.setdefault(course, []).append(i)
+            key = (course, section['name'].upper())
+            self.__crns.setdefault(key, []).append(section['crn'])
+
+    def get_state(self):
+        """
+        :return: A tuple (course numbers, offsets, positions): the
+            numbers sorted, and the positions of each course's sections
+            in an array, from its offset up to the next course's.
+        """
+
+        if self.__by_course is None:
+            return (list(self.__numbers), self.__offsets, self.__positions)
+
+        numbers = sorted(self.__by_course)
+        offsets = array('I', [0])
+        positions = array('I')
+        for number in numbers:
+            positions.extend(self.__by_course[number])
+            offsets.append(len(positions))
+        return (numbers, offsets, positions)
+
+    @staticmethod
+    def from_state(state, sections):
+        """
+        :param state: As from get_state, or a dict of the positions of
+            each course's sections as arrays, as it once was.
+        :param sections: The sections the index was built from. The
+            CRNs of a course's sections are found from them when they
+            are first needed.
+        :return: A SectionIndex.
+        """
+        index = SectionIndex([])
+        if isinstance(state, dict):
+            index.__by_course = state
+        else:
+            index.__by_course = None
+            (index.__numbers, index.__offsets, index.__positions) = state
+        index.__crns = None
+        index.__sections = sections
+        return index
+
+    def course(self, number):
+        """
+        :return: The positions of a course's sections, in order.
+        """
+
+        if self.__by_course is not None:
+            return list(self.__by_course.get(number, []))
+
+        i = bisect_left(self.__numbers, number)
+        if i < len(self.__numbers) and self.__numbers[i] == number:
+            return list(self.__positions[
+                self.__offsets[i]:self.__offsets[i + 1]])
+        return []
+
+    def crns(self, number, name):
+        """
+        :return: The CRNs of the sections of a course with a name (which
+            is not case-sensitive). There is usually one.
+        """
+        if self.__crns is None:
+            return list([
+                self.__sections[i]['crn'] for i in self.course(number)
+                if self.__sections[i]['name'].upper() == name.upper()
+            ])
+        return self.__crns.get((number, name.upper()), [])
+
+
+def _crn_rows(subject_position, sections):
+    return list([
+        (int(s['crn']), subject_position, s['course'], s['name'])
+        for s in sections if s['crn'].isdigit()
+    ])
+
+
+class CrnIndex:
+    """
+    Maps each CRN of a term to the subject, course number and section
+    name it belongs to. It is kept as columns sorted by CRN (arrays of
+    the CRNs and of positions in the list of subjects, and lists of
+    course numbers and section names), which are stored compactly,
+    load without decoding every row, and are searched by bisection.
+
+    CRNs which are not numbers are left out.
+    """
+
+    def __init__(self, subjects=None, crns=None, subject_positions=None,
+                 courses=None, names=None):
+        self.__subjects = subjects or []
+        self.__crns = crns or array('I')
+        self.__subject_positions = subject_positions or array('H')
+        self.__courses = courses or []
+        self.__names = names or []
+
+    def get_subjects(self):
+        """
+        :return: The ids of the subjects whose sections are indexed.
+        """
+        return list(self.__subjects)
+
+    def find(self, crn):
+        """
+        :return: A tuple (subject id, course number, section name), or
+            None if the CRN is not in the index.
+        """
+
+        if not str(crn).isdigit():
+            return None
+        crn = int(crn)
+
+        i = bisect_left(self.__crns, crn)
+        if i < len(self.__crns) and self.__crns[i] == crn:
+            return (
+                self.__subjects[self.__subject_positions[i]],
+                self.__courses[i],
+                self.__names[i],
+            )
+
+    def update(self, subject_id, sections):
+        """
+        :param sections: All of the sections of a subject, as from
+            Scraper.get_sections. They replace any indexed before.
+        :return: A new CrnIndex.
+        """
+
+        subjects = [s for s in self.__subjects if s != subject_id]
+        subjects.append(subject_id)
+        subjects.sort()
+        position = dict((s, i) for (i, s) in enumerate(subjects))
+
+        rows = list([
+            (crn, position[self.__subjects[p]], course, name)
+            for (crn, p, course, name) in zip(
+                self.__crns, self.__subject_positions,
+                self.__courses, self.__names)
+            if self.__subjects[p] != subject_id
+        ])
+        rows.extend(_crn_rows(position[subject_id], sections))
+        return CrnIndex.__from_rows(subjects, rows)
+
+    @staticmethod
+    def build(sections):
+        """
+        :param sections: A dict of all of the sections of each subject
+            to index, by subject id.
+        :return: A CrnIndex.
+        """
+
+        subjects = sorted(sections)
+        rows = []
+        for (p, subject_id) in enumerate(subjects):
+            rows.extend(_crn_rows(p, sections[subject_id]))
+        return CrnIndex.__from_rows(subjects, rows)
+
+    @staticmethod
+    def __from_rows(subjects, rows):
+        rows.sort()
+        return CrnIndex(
+            subjects=subjects,
+            crns=array('I', [r[0] for r in rows]),
+            subject_positions=array('H', [r[1] for r in rows]),
+            courses=list([r[2] for r in rows]),
+            names=list([r[3] for r in rows]),
+        )
+
+    def dump(self, fp, compression='none'):
+        # Version 1 held the subjects, course numbers and section names
+        # as plain lists, which are decoded in full on loading.
+        codec.dump(fp, 'CrnIndex', (
+            codec.Lazy(self.__subjects),
+            self.__crns,
+            self.__subject_positions,
+            codec.Lazy(self.__courses),
+            codec.Lazy(self.__names),
+        ), compression, version=2)
+
+    @staticmethod
+    def load(fp):
+        (columns, version) = codec.load(fp, 'CrnIndex')
+        index = CrnIndex(*columns)
+        index.migrated = version != 2
+        return index
+
+
+class SearchIndex:
+    """
+    An inverted index of the courses of a term, for finding courses by
+    the words in their names and descriptions. Each word maps to the
+    positions of the courses which contain it, each with a weight,
+    where a word counts three times as much in a course's name as in
+    its description.
+
+    Courses are ranked first by how many of the query's words they
+    contain, then by the sum over those words of their weight (which
+    saturates, so repeating a word helps little) times their inverse
+    document frequency (so rare words count for more).
+
+    Like CrnIndex, it is kept as columns: the courses' subjects (as
+    positions in a list of subjects), numbers and names; and the words,
+    sorted to be searched by bisection, with arrays of the positions
+    and weights of each word's courses, from its offset up to the next
+    word's. So it loads without building a dict of every word.
+    """
+
+    name_weight = 3
+    saturation = 1.2
+
+    def __init__(self, courses=None, postings=None):
+        """
+        :param courses: A list of (subject id, course number, course
+            name).
+        :param postings: A dict of a list of (course position, weight)
+            for each word.
+        """
+
+        courses = courses or []
+        postings = postings or {}
+
+        self.__subjects = sorted(set(c[0] for c in courses))
+        position = dict((s, i) for (i, s) in enumerate(self.__subjects))
+        self.__course_subjects = array('H', [position[c[0]] for c in courses])
+        self.__numbers = list([c[1] for c in courses])
+        self.__names = list([c[2] for c in courses])
+
+        self.__words = sorted(postings)
+        self.__offsets = array('I', [0])
+        self.__positions = array('I')
+        self.__weights = array('H')
+        for word in self.__words:
+            for (i, weight) in postings[word]:
+                self.__positions.append(i)
+                self.__weights.append(min(weight, 0xffff))
+            self.__offsets.append(len(self.__positions))
+
+    def get_subjects(self):
+        """
+        :return: The ids of the subjects whose courses are indexed.
+        """
+        return list(self.__subjects)
+
+    def search(self, query, limit=None):
+        """
+        :return: A list of (subject id, course number, course name,
+            score) for the courses which contain any of the query's
+            words, best first.
+        """
+
+        words = set(_words(query))
+        n = len(self.__numbers)
+        k = self.saturation
+
+        scores = {}
+        matched = {}
+        for word in words:
+            (start, end) = self.__span(word)
+            if start == end:
+                continue
+            idf = math.log(1.0 + float(n) / (end - start))
+            for (i, weight) in zip(self.__positions[start:end],
+                                   self.__weights[start:end]):
+                scores[i] = scores.get(i, 0.0) + \
+                    idf * weight * (k + 1) / (weight + k)
+                matched[i] = matched.get(i, 0) + 1
+
+        def key(i):
+            return (-matched[i], -scores[i], i)
+
+        if limit is None:
+            ranked = sorted(scores, key=key)
+        else:
+            ranked = heapq.nsmallest(limit, scores, key=key)
+
+        return list([
+            self.__course(i) + (scores[i],)
+            for i in ranked
+        ])
+
+    def __span(self, word):
+        """
+        :return: The (start, end) of a word's postings, which are equal
+            if it has none.
+        """
+        w = bisect_left(self.__words, word)
+        if w < len(self.__words) and self.__words[w] == word:
+            return (self.__offsets[w], self.__offsets[w + 1])
+        return (0, 0)
+
+    def __course(self, i):
+        return (
+            self.__subjects[self.__course_subjects[i]],
+            self.__numbers[i],
+            self.__names[i],
+        )
+
+    def update(self, subject_id, courses):
+        """
+        :param courses: All of the courses of a subject, as from
+            Scraper.get_courses. They replace any indexed before.
+        :return: A new SearchIndex.
+        """
+
+        # Positions of the courses which are kept, old to new.
+        kept = {}
+        new_courses = []
+        for i in range(len(self.__numbers)):
+            course = self.__course(i)
+            if course[0] != subject_id:
+                kept[i] = len(new_courses)
+                new_courses.append(course)
+
+        postings = {}
+        for (w, word) in enumerate(self.__words):
+            (start, end) = (self.__offsets[w], self.__offsets[w + 1])
+            new = list([
+                (kept[i], weight) for (i, weight) in zip(
+                    self.__positions[start:end], self.__weights[start:end])
+                if i in kept
+            ])
+            if new:
+                postings[word] = new
+
+        SearchIndex.__add(new_courses, postings, subject_id, courses)
+        return SearchIndex(new_courses, postings)
+
+    @staticmethod
+    def build(courses):
+        """
+        :param courses: A dict of all of the courses of each subject to
+            index, by subject id.
+        :return: A SearchIndex.
+        """
+
+        new_courses = []
+        postings = {}
+        for subject_id in sorted(courses):
+            SearchIndex.__add(new_courses, postings, subject_id,
+                              courses[subject_id])
+        return SearchIndex(new_courses, postings)
+
+    @staticmethod
+    def __add(new_courses, postings, subject_id, courses):
+        for course in courses:
+            i = len(new_courses)
+            new_courses.append(
+                (subject_id, course['number'], course['name']))
+
+            weights = {}
+            for word in _words(course['name']):
+                weights[word] = weights.get(word, 0) + SearchIndex.name_weight
+            for word in _words(course.get('description')):
+                weights[word] = weights.get(word, 0) + 1
+
+            for (word, weight) in weights.items():
+                postings.setdefault(word, []).append((i, weight))
+
+    def dump(self, fp, compression='none'):
+        codec.dump(fp, 'SearchIndex', (
+            codec.Lazy(self.__subjects),
+            self.__course_subjects,
+            codec.Lazy(self.__numbers),
+            codec.Lazy(self.__names),
+            codec.Lazy(self.__words),
+            self.__offsets,
+            self.__positions,
+            self.__weights,
+        ), compression, version=2)
+
+    @staticmethod
+    def load(fp):
+        (x, version) = codec.load(fp, 'SearchIndex')
+        if version == 2:
+            index = SearchIndex()
+            (index.__subjects, index.__course_subjects, index.__numbers,
+             index.__names, index.__words, index.__offsets,
+             index.__positions, index.__weights) = x
+        else:
+            # Version 1 held the courses as a list, and a dict of each
+            # word's postings, which is slow to load; it is rewritten.
+            index = SearchIndex(*x)
+        index.migrated = version != 2
+        return index
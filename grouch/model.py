@@ -1,11 +1,76 @@
+from collections import namedtuple
+from functools import total_ordering
 import re
+import sys
 
 _season_names = [u'spring', u'summer', u'fall']
 
 _term_pattern = re.compile('^([a-z]+)[ ]*([0-9]{4})$')
 
 
-class Term:
+def _intern(s):
+    """
+    Interns strings, so that the many copies of e.g. a subject id in a
+    term's catalog share one object.
+    """
+    if type(s) is str:
+        return sys.intern(s)
+    return s
+
+
+@total_ordering
+class _Slotted(object):
+    """
+    A base for classes whose attributes are all private and listed in
+    __slots__, so that their instances have no per-instance dict. They
+    pickle to the same dict of attributes as before they had slots, so
+    that snapshots from either load into either. They compare and sort
+    by their keys.
+    """
+
+    __slots__ = ()
+
+    def __attributes(self):
+        cls = type(self)
+        return ['_%s%s' % (cls.__name__, name) for name in cls.__slots__]
+
+    def __getstate__(self):
+        return dict((a, getattr(self, a)) for a in self.__attributes())
+
+    def __setstate__(self, state):
+        for (a, value) in state.items():
+            setattr(self, a, _intern(value))
+
+    def _key(self):
+        """
+        :return: A tuple of the values which identify this object, by
+            which it is compared.
+        """
+        raise NotImplementedError
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return self._key() < other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __str__(self):
+        if sys.version_info[0] >= 3:
+            return self.__unicode__()
+        return self.__unicode__().encode('utf-8')
+
+
+class Term(_Slotted):
+    __slots__ = ('__season', '__year')
+
     SPRING = 1
     SUMMER = 2
     FALL = 3
@@ -37,26 +102,22 @@ class Term:
             self.__year
         )
 
-    def __str__(self):
-        return unicode(self).encode('utf-8')
-
     def __repr__(self):
         return u'<Term season=%d year=%d>' % \
                (self.__season, self.__year)
 
-    def __key(self):
+    def _key(self):
         return (self.__year, self.__season)
 
     def __cmp__(self, other):
-        return cmp(self.__key(), other.__key())
+        return cmp(self._key(), other._key())
 
-    def __hash__(self):
-        return hash(self.__key())
 
+class Subject(_Slotted):
+    __slots__ = ('__id', '__name')
 
-class Subject:
     def __init__(self, id, name):
-        self.__id = id
+        self.__id = _intern(id)
         self.__name = name
 
     def get_id(self):
@@ -68,27 +129,23 @@ class Subject:
     def __unicode__(self):
         return u'%s %s' % (self.__id, self.__name)
 
-    def __str__(self):
-        return unicode(self).encode('utf-8')
-
     def __repr__(self):
         return u'<Subject id="%s" name="%s">' % \
                (self.__id, self.__name)
 
-    def __key(self):
+    def _key(self):
         return (self.__id, self.__name)
 
     def __cmp__(self, other):
-        return cmp(self.__key(), other.__key())
-
-    def __hash__(self):
-        return hash(self.__key())
+        return cmp(self._key(), other._key())
 
 
 _course_pattern = re.compile('^([A-Z ]+)([0-9]{4})$')
 
 
-class Course:
+class Course(_Slotted):
+    __slots__ = ('__subject', '__number')
+
     @staticmethod
     def parse(s):
         m = re.match(_course_pattern, s.strip().upper())
@@ -98,8 +155,8 @@ class Course:
             return Course(subject, number)
 
     def __init__(self, subject, number):
-        self.__subject = subject
-        self.__number = number
+        self.__subject = _intern(subject)
+        self.__number = _intern(number)
 
     def get_subject(self):
         return self.__subject
@@ -113,32 +170,28 @@ class Course:
             self.__number
         )
 
-    def __str__(self):
-        return unicode(self).encode('utf-8')
-
     def __repr__(self):
         return u'<Course subject="%s" number="%s">' % \
                (self.__subject, self.__number)
 
-    def __key(self):
+    def _key(self):
         return (self.__subject, self.__number)
 
     def __cmp__(self, other):
-        return cmp(self.__key(), other.__key())
+        return cmp(self._key(), other._key())
 
-    def __hash__(self):
-        return hash(self.__key())
 
+class Capacity(_Slotted):
+    __slots__ = ('__max', '__current')
 
-class Capacity:
     def __init__(self, max, current):
         self.__max = max
         self.__current = current
 
-    def get_max():
+    def get_max(self):
         return self.__max
 
-    def get_current():
+    def get_current(self):
         return self.__current
 
     def __unicode__(self):
@@ -147,16 +200,83 @@ class Capacity:
             self.__max
         )
 
-    def __str__(self):
-        return unicode(self).encode('utf-8')
-
     def __repr__(self):
         return u'<Capacity max="%d" current="%d">' % \
                (self.__max, self.__current)
 
-    def __key(self):
+    def _key(self):
         return (self.__max, self.__current)
 
     def __cmp__(self, other):
-        return cmp(self.__key(), other.__key())
+        return cmp(self._key(), other._key())
+
+
+class _Record(tuple):
+    """
+    A base for the rows of scraped listings: tuples, so they have no
+    per-row dict, whose fields can also be read like a dict's items
+    (row['crn'], row.get('crn')), as rows once were dicts. A record is
+    equal to a dict with the same items.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            # Only fields, not the tuple's methods (row['count']).
+            if key not in self._fields:
+                raise KeyError(key)
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._fields)
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return dict(zip(self._fields, self)) == other
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return self._key() < other._key()
+
+    __hash__ = tuple.__hash__
+
+
+class CourseRecord(_Record,
+                   namedtuple('CourseRecord', 'number name description')):
+    """
+    A course in a subject's catalog, e.g.
+    CourseRecord('1050', 'Constructing Proofs', 'Techniques of ...')
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, number, name, description=None):
+        return super(CourseRecord, cls).__new__(
+            cls, _intern(number), name, description)
+
+
+class SectionRecord(_Record,
+                    namedtuple('SectionRecord', 'crn course name')):
+    """
+    A section in a subject's listing, e.g.
+    SectionRecord('87134', '2110', 'A2')
+    """
+
+    __slots__ = ()
 
+    def __new__(cls, crn, course, name):
+        return super(SectionRecord, cls).__new__(
+            cls, crn, _intern(course), _intern(name))
@@ -0,0 +1,165 @@
+import json
+import os
+
+from model import Capacity, Course, CourseRecord, Subject, Term
+from util import map_distinct, maybe
+
+
+def address_file(context):
+    """
+    :return: The file in which a running server records its address,
+        so that clients can find it.
+    """
+    return os.path.join(context.get_config_dir(), 'server')
+
+
+# JSON decoding of model objects
+# -------------------------------------------------------------
+
+def _decode_term(x):
+    return Term(x['season'], x['year'])
+
+
+def _decode_subject(x):
+    return Subject(id=x['id'], name=x['name'])
+
+
+def _decode_course(x):
+    return Course(x['subject'], x['number'])
+
+
+def _decode_section(x):
+    capacity = x['capacity']
+    return {
+        'course': _decode_course(x['course']),
+        'section': x['section'],
+        'name': x['name'],
+        'capacity': None if capacity is None
+        else Capacity(capacity['max'], capacity['current']),
+    }
+
+
+# Client
+# -------------------------------------------------------------
+
+class RemoteStore:
+    """
+    Has the same lookup methods as Store, but answers them by querying
+    a running Server.
+    """
+
+    def __init__(self, address, timeout=30):
+        self.__address = address
+        self.__timeout = timeout
+
+    @staticmethod
+    def find(context):
+        """
+        :return: A RemoteStore for the server recorded in the address
+            file, or None if no server is running.
+        """
+
+        try:
+            fp = open(address_file(context))
+        except IOError:
+            return None
+        try:
+            address = fp.read().strip()
+        finally:
+            fp.close()
+
+        from urllib.error import URLError
+
+        store = RemoteStore(address, timeout=2)
+        try:
+            store.__query('ping')
+        except (URLError, OSError, ValueError):
+            return None
+        return RemoteStore(address)
+
+    def __query(self, name, term=None, **params):
+        # urllib is slow to import, so it is imported only once a server
+        # has been found.
+        from urllib.parse import urlencode
+        from urllib.request import urlopen
+
+        if term is not None:
+            params['season'] = term.get_season()
+            params['year'] = term.get_year()
+        url = 'http://%s/%s?%s' % (self.__address, name, urlencode(params))
+        fp = urlopen(url, timeout=self.__timeout)
+        try:
+            return json.loads(fp.read().decode('utf-8'))['result']
+        finally:
+            fp.close()
+
+    def get_terms(self):
+        terms = self.__query('terms')
+        if terms is not None:
+            return [_decode_term(t) for t in terms]
+
+    def get_subjects(self, term=None):
+        subjects = self.__query('subjects', term=term)
+        if subjects is not None:
+            return [_decode_subject(s) for s in subjects]
+
+    def find_subject(self, s, term=None):
+        return maybe(_decode_subject)(
+            self.__query('subject', term=term, subject=s))
+
+    def get_courses(self, subject, term=None):
+        courses = self.__query('courses', term=term,
+                               subject=_subject_id(subject))
+        if courses is not None:
+            return [CourseRecord(**c) for c in courses]
+
+    def get_sections(self, course, term=None):
+        return self.__query('sections', term=term,
+                            subject=_subject_id(course.get_subject()),
+                            number=course.get_number())
+
+    def get_crn(self, course, section, term=None):
+        return self.__query('crn', term=term,
+                            subject=_subject_id(course.get_subject()),
+                            number=course.get_number(),
+                            section=section)
+
+    def find_crn(self, crn, term=None):
+        found = self.__query('find_crn', term=term, crn=crn)
+        if found is not None:
+            return {
+                'course': _decode_course(found['course']),
+                'name': found['name'],
+            }
+
+    def is_crn(self, crn, term=None):
+        return self.__query('is_crn', term=term, crn=crn)
+
+    def are_crns(self, crns, term=None):
+        return self.__query('are_crns', term=term, crns=','.join(crns))
+
+    def search(self, query, term=None, limit=20):
+        results = self.__query('search', term=term, query=query, limit=limit)
+        if results is not None:
+            return [
+                {
+                    'course': _decode_course(x['course']),
+                    'name': x['name'],
+                    'score': x['score'],
+                }
+                for x in results
+            ]
+
+    def get_section(self, crn, term=None):
+        return maybe(_decode_section)(
+            self.__query('section', term=term, crn=crn))
+
+    def get_sections_capacity(self, crns, term=None, workers=8):
+        return map_distinct(lambda crn: self.get_section(crn, term), crns,
+                            workers)
+
+
+def _subject_id(subject):
+    if isinstance(subject, Subject):
+        return subject.get_id()
+    return subject
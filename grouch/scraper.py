@@ -1,18 +1,23 @@
-from bs4 import BeautifulSoup, BeautifulStoneSoup
+import asyncio
+import codecs
 from datetime import datetime, timedelta
-from html2text import unescape
+from html import unescape
+from html.parser import HTMLParser
 from operator import itemgetter
 import os.path
 import re
 import string
 import time
-from urllib.parse import urlencode
-from urllib.request import Request, OpenerDirector, \
-    HTTPDefaultErrorHandler, HTTPSHandler
+from urllib.error import HTTPError
+from urllib.parse import urlencode, urlsplit
+from xml.parsers import expat
 
 from context import Context
-from model import Capacity, Course, Subject, Term
-from util import character_whitelist, grouper, makedirs
+from model import Capacity, Course, CourseRecord, SectionRecord, \
+    Subject, Term
+from connections import AsyncConnectionPool, ConnectionPool, retry_delay
+from transport import NotModified, RetryPolicy, new_digest, shared_limiter
+from util import character_whitelist, makedirs
 
 
 def oscar_url(procedure):
@@ -35,78 +40,273 @@ def _safe_str(x):
     )
 
 
+# BeautifulSoup and urllib.request take longer to import than the rest
+# of grouch, and are needed only when pages are fetched or parsed, so
+# they are imported then instead of whenever grouch starts.
+
+def _soup(html):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html)
+
+
+def _request(*args, **kwargs):
+    from urllib.request import Request
+    return Request(*args, **kwargs)
+
+
+def _bytes(x):
+    if isinstance(x, bytes):
+        return x
+    return x.encode('utf-8')
+
+
+def _host(request):
+    return urlsplit(request.get_full_url()).netloc
+
+
+def _log_wait(context, host, wait):
+    if wait > 0:
+        context.get_logger().info(
+            'HTTP rate limit: waited %.3f s for %s' % (wait, host))
+
+
+def _retry_delay(context, retry_policy, request, error, retry):
+    """
+    :return: The number of seconds to wait before retrying a failed
+        request, or None if it should not be retried.
+    """
+
+    delay = retry_delay(retry_policy, error, retry)
+    if delay is not None:
+        context.get_logger().info(
+            'HTTP retry %d of %d in %.3f s after %r\n%s' % (
+                retry, retry_policy.retries, delay, error,
+                request.get_full_url()))
+    return delay
+
+
 class Scraper:
+    """
+    :param limiter: The RateLimiter which requests wait for. Defaults to
+        one shared by every Scraper in the process.
+    :param retry_policy: The RetryPolicy for failed requests.
+    """
+
     def __init__(self, context=None, enable_http=True,
-                 log_http=False):
+                 log_http=False, pool=None, limiter=None,
+                 retry_policy=None):
 
         if context is None:
             context = Context()
 
+        if pool is None:
+            pool = ConnectionPool(context=context)
+
+        if limiter is None:
+            limiter = shared_limiter()
+
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+
         self.__context = context
         self.__enable_http = enable_http
         self.__log_http = log_http
+        self.__pool = pool
+        self.__limiter = limiter
+        self.__retry_policy = retry_policy
 
-    def fetch(self, request, opener=None, summary=None):
+    def get_pool(self):
+        return self.__pool
+
+    def fetch(self, request, opener=None, summary=None, validator=None):
+        """
+        Requests go through this Scraper's ConnectionPool unless an
+        opener is given, in which case that opener is used instead.
+
+        :param validator: An optional Validator describing a version of
+            the resource that is already known. If the response is that
+            same version, NotModified is raised. Otherwise the Validator
+            is updated to describe the response.
+        """
 
         if not self.__enable_http:
             return (None, None)
 
-        if opener is None:
-            opener = OpenerDirector()
-            opener.add_handler(HTTPDefaultErrorHandler())
-            opener.add_handler(HTTPSHandler())
-
-        t = time.clock()
-        response = opener.open(request)
-        body = response.read()
-        t = timedelta(seconds=time.clock() - t)
+        if validator is not None:
+            validator.prepare(request)
+
+        t = time.perf_counter()
+        try:
+            (response, body) = self.__open(request, opener)
+        except HTTPError as e:
+            if e.code == 304 and validator is not None:
+                self.__context.get_logger().info(
+                    'HTTP not modified\n%s' % request.get_full_url())
+                raise NotModified()
+            raise
+        t = timedelta(seconds=time.perf_counter() - t)
         url = request.get_full_url()
         self.__context.get_logger().info('HTTP time: %s\n%s' % (t, url))
 
         if self.__log_http:
-            log_dir = os.path.join(self.__context.get_config_dir(), 'http-log')
-            makedirs(log_dir)
-            log_file = os.path.join(log_dir,
-                                    datetime.utcnow().strftime(
-                                        '%Y-%m-%d-%H-%M-%S-%f'))
-            if summary is not None:
-                log_file += '-' + _safe_str(summary)
-            fp = open(log_file, 'w')
-            fp.write('\n\n'.join([
-                request.get_full_url(),
-                request.get_data() or 'No request data',
-                body or 'No response body',
-            ]))
-            fp.close()
+            self.write_http_log(request, body, summary)
+
+        if validator is not None:
+            validator.check(response, body)
 
         return (response, body)
 
+    def __open(self, request, opener):
+        """
+        Sends a request once the rate limiter allows, retrying failures
+        as the RetryPolicy allows.
+        """
+
+        host = _host(request)
+        retry = 0
+
+        while True:
+            _log_wait(self.__context, host, self.__limiter.acquire(host))
+            try:
+                if opener is None:
+                    return self.__pool.open(request)
+                response = opener.open(request)
+                return (response, response.read())
+            except Exception as e:
+                retry += 1
+                delay = _retry_delay(self.__context, self.__retry_policy,
+                                     request, e, retry)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def write_http_log(self, request, body, summary=None):
+        fp = self.__open_http_log(request, summary)
+        fp.write(_bytes(body or 'No response body'))
+        fp.close()
+
+    def __open_http_log(self, request, summary):
+        log_dir = os.path.join(self.__context.get_config_dir(), 'http-log')
+        makedirs(log_dir)
+        log_file = os.path.join(log_dir,
+                                datetime.utcnow().strftime(
+                                    '%Y-%m-%d-%H-%M-%S-%f'))
+        if summary is not None:
+            log_file += '-' + _safe_str(summary)
+        # Response bodies are written as they were received.
+        fp = open(log_file, 'wb')
+        fp.write(b'\n\n'.join([
+            _bytes(request.get_full_url()),
+            _bytes(request.data or 'No request data'),
+            b'',
+        ]))
+        return fp
+
     def fetch_body(self, *args, **kwargs):
         (response, body) = self.fetch(*args, **kwargs)
         return body
 
+    def fetch_chunks(self, request, summary=None, validator=None):
+        """
+        Like fetch_body, but returns an iterator over pieces of the
+        response body as they arrive, decoded as UTF-8.
+
+        With a validator, the body's digest is only known once the
+        last chunk has arrived, so NotModified (if the body turns out
+        to be unchanged) is raised by the iterator at its end.
+        """
+
+        if not self.__enable_http:
+            return None
+
+        if validator is not None:
+            validator.prepare(request)
+
+        return self.__iter_chunks(request, summary, validator)
+
+    def __iter_chunks(self, request, summary, validator):
+
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        digest = new_digest()
+        responses = []
+
+        log = None
+        if self.__log_http:
+            log = self.__open_http_log(request, summary)
+
+        host = _host(request)
+        t = time.perf_counter()
+        try:
+            retry = 0
+            while True:
+                _log_wait(self.__context, host,
+                          self.__limiter.acquire(host))
+                started = False
+                try:
+                    for chunk in self.__pool.stream(
+                            request, on_response=responses.append):
+                        started = True
+                        if log is not None:
+                            log.write(chunk)
+                        digest.update(chunk)
+                        yield decoder.decode(chunk)
+                    break
+                except Exception as e:
+                    # Once part of the body has been passed on, the
+                    # request can no longer be retried.
+                    retry += 1
+                    delay = None if started else _retry_delay(
+                        self.__context, self.__retry_policy,
+                        request, e, retry)
+                    if delay is None:
+                        raise
+                    del responses[:]
+                    time.sleep(delay)
+            final = decoder.decode(b'', True)
+        except HTTPError as e:
+            if e.code == 304 and validator is not None:
+                self.__context.get_logger().info(
+                    'HTTP not modified\n%s' % request.get_full_url())
+                raise NotModified()
+            raise
+        finally:
+            if log is not None:
+                log.close()
+
+        t = timedelta(seconds=time.perf_counter() - t)
+        url = request.get_full_url()
+        self.__context.get_logger().info('HTTP time: %s\n%s' % (t, url))
+
+        if validator is not None:
+            validator.check(responses[0], digest=digest.hexdigest())
+
+        yield final
+
     # Terms
     # -------------------------------------------------------------
 
-    def get_terms(self):
+    def get_terms(self, validator=None):
         """
         :return: A list of tuples in the form
             ( Term(Term.FALL, 2012), u'201208' )
         """
-        html = self.fetch_terms_html()
+        html = self.fetch_terms_html(validator)
         if html is not None:
             return self.scrape_terms_html(html)
 
-    def fetch_terms_html(self):
-        url = oscar_url('bwckschd.p_disp_dyn_sched')
+    def fetch_terms_html(self, validator=None):
         return self.fetch_body(
-            request=Request(url),
+            request=self.terms_request(),
             summary='fetch-terms-html',
+            validator=validator,
         )
 
+    def terms_request(self):
+        return _request(oscar_url('bwckschd.p_disp_dyn_sched'))
+
     def scrape_terms_html(self, html):
 
-        soup = BeautifulSoup(html)
+        soup = _soup(html)
         select = soup.find('select', {'id': 'term_input_id'})
 
         def iter_options():
@@ -121,29 +321,33 @@ class Scraper:
     # Subjects
     # -------------------------------------------------------------
 
-    def get_subjects(self, term_id):
+    def get_subjects(self, term_id, validator=None):
         """
         :return: A list of Subject objects.
         """
-        html = self.fetch_subjects_html(term_id)
+        html = self.fetch_subjects_html(term_id, validator)
         if html is not None:
             return self.scrape_subjects_html(html)
 
-    def fetch_subjects_html(self, term_id):
+    def fetch_subjects_html(self, term_id, validator=None):
         return self.fetch_body(
-            request=Request(
-                url=oscar_url('bwckgens.p_proc_term_date'),
-                data=urlencode([
-                    ('p_calling_proc', 'bwckschd.p_disp_dyn_sched'),
-                    ('p_term', str(term_id)),
-                ]),
-            ),
+            request=self.subjects_request(term_id),
             summary='fetch-subjects-html',
+            validator=validator,
+        )
+
+    def subjects_request(self, term_id):
+        return _request(
+            url=oscar_url('bwckgens.p_proc_term_date'),
+            data=urlencode([
+                ('p_calling_proc', 'bwckschd.p_disp_dyn_sched'),
+                ('p_term', str(term_id)),
+            ]),
         )
 
     def scrape_subjects_html(self, html):
 
-        soup = BeautifulSoup(html)
+        soup = _soup(html)
         select = soup.find('select', {'id': 'subj_id'})
 
         def iter_options():
@@ -159,7 +363,8 @@ class Scraper:
     # Courses
     # -------------------------------------------------------------
 
-    def get_courses(self, term_id=None, subject_id=None, methods=None):
+    def get_courses(self, term_id=None, subject_id=None, methods=None,
+                    validator=None):
         """
         This scrape has two methods: 'html', and 'xml' as a fallback.
         Defaults to html first because I have observed that the XML
@@ -167,7 +372,8 @@ class Scraper:
         For example, the course description for CS 4911 is missing
         from the XML but present in the HTML.
 
-        :return: A list of dicts in the form
+        :return: A list of CourseRecords, which read like dicts in the
+            form
             {
                 'number': u'1050',
                 'name': u'Constructing Proofs',
@@ -179,12 +385,15 @@ class Scraper:
             methods = ['html', 'xml']
 
         def use_html():
-            html = self.fetch_courses_html(term_id, subject_id)
+            html = self.fetch_courses_html(term_id, subject_id, validator)
             return self.scrape_courses_html(html)
 
         def use_xml():
-            xml = self.fetch_courses_xml(term_id, subject_id)
-            return self.scrape_courses_xml(xml)
+            chunks = self.fetch_courses_xml_chunks(
+                term_id, subject_id, validator)
+            if chunks is None:
+                return []
+            return list(self.iter_courses_xml(chunks))
 
         method_dict = {'html': use_html, 'xml': use_xml}
 
@@ -196,34 +405,38 @@ class Scraper:
                 self.__context.get_logger().error(
                     'get_courses (%s) failed' % method)
 
-    def fetch_courses_html(self, term_id, subject_id):
+    def fetch_courses_html(self, term_id, subject_id, validator=None):
         return self.fetch_body(
-            request=Request(
-                url=oscar_url('bwckctlg.p_display_courses'),
-                data=urlencode([
-                    ('term_in', term_id),
-                    ('sel_subj', 'dummy'),
-                    ('sel_levl', 'dummy'),
-                    ('sel_schd', 'dummy'),
-                    ('sel_coll', 'dummy'),
-                    ('sel_divs', 'dummy'),
-                    ('sel_dept', 'dummy'),
-                    ('sel_attr', 'dummy'),
-                    ('sel_subj', subject_id),
-                    ('sel_crse_strt', ''),
-                    ('sel_crse_end', ''),
-                    ('sel_title', ''),
-                    ('sel_levl', '%'),
-                    ('sel_schd', '%'),
-                    ('sel_coll', '%'),
-                    ('sel_divs', '%'),
-                    ('sel_dept', '%'),
-                    ('sel_from_cred', ''),
-                    ('sel_to_cred', ''),
-                    ('sel_attr', '%'),
-                ]),
-            ),
+            request=self.courses_html_request(term_id, subject_id),
             summary='fetch-courses-html',
+            validator=validator,
+        )
+
+    def courses_html_request(self, term_id, subject_id):
+        return _request(
+            url=oscar_url('bwckctlg.p_display_courses'),
+            data=urlencode([
+                ('term_in', term_id),
+                ('sel_subj', 'dummy'),
+                ('sel_levl', 'dummy'),
+                ('sel_schd', 'dummy'),
+                ('sel_coll', 'dummy'),
+                ('sel_divs', 'dummy'),
+                ('sel_dept', 'dummy'),
+                ('sel_attr', 'dummy'),
+                ('sel_subj', subject_id),
+                ('sel_crse_strt', ''),
+                ('sel_crse_end', ''),
+                ('sel_title', ''),
+                ('sel_levl', '%'),
+                ('sel_schd', '%'),
+                ('sel_coll', '%'),
+                ('sel_divs', '%'),
+                ('sel_dept', '%'),
+                ('sel_from_cred', ''),
+                ('sel_to_cred', ''),
+                ('sel_attr', '%'),
+            ]),
         )
 
     def scrape_courses_html(self, html):
@@ -236,163 +449,210 @@ class Scraper:
         Each course is represented by two consecutive rows.
         The first row contains the course number and title.
         The second row contains the description, plus some other things.
-        """
-
-        def join(x):
-            return map(lambda y: ''.join(y), x)
 
-        rows = join(grouper(2, re.split('(<TR)', html)[1:]))
-
-        title_re = re.compile('CLASS="nttitle".*>[A-Z]+ ('
-                              + course_number_re_fragment + ') - (.*)</A></TD>')
+        One regex pass over the page finds both kinds of row; each
+        title cell is paired with the description cell that follows
+        it. The description is the text before the first tag in that
+        cell, with its entities decoded.
+        """
 
         def iter_courses():
-            for (row1, row2) in grouper(2, rows):
-                course = {}
-                match = title_re.search(row1.replace('\n', ''))
-                if match is None: continue
-                course['number'] = match.group(1)
-                course['name'] = match.group(2)
-                soup = BeautifulSoup(row2)
-                td = soup.find('td')
-                d = td.contents[0].strip().replace('\n', ' ') or None
-                course['description'] = d
-                yield course
+            # The (number, name) of a course whose description is next.
+            course = None
+            for match in _course_cell_re.finditer(html):
+                (title, description) = match.groups()
+                if title is not None:
+                    m = _course_title_re.search(title.replace('\n', ''))
+                    if course is not None:
+                        yield CourseRecord(*course)
+                    course = None
+                    if m is not None:
+                        course = m.groups()
+                elif course is not None:
+                    d = unescape(description).strip() \
+                        .replace('\n', ' ') or None
+                    yield CourseRecord(course[0], course[1], d)
+                    course = None
+            if course is not None:
+                yield CourseRecord(*course)
 
         return list(iter_courses())
 
     def fetch_courses_xml(self, term_id, subject_id):
         return self.fetch_body(
-            request=Request(
-                url=oscar_url('bwckctlg.xml'),
-                data=urlencode([
-                    ('term_in', term_id),
-                    ('subj_in', '\t%s\t' % subject_id),
-                    ('title_in', '%%'),
-                    ('divs_in', '%'),
-                    ('dept_in', '%'),
-                    ('coll_in', '%'),
-                    ('schd_in', '%'),
-                    ('levl_in', '%'),
-                    ('attr_in', '%'),
-                    ('crse_strt_in', ''),
-                    ('crse_end_in', ''),
-                    ('cred_from_in', ''),
-                    ('cred_to_in', ''),
-                    ('last_updated', ''),
-                ]),
-            ),
+            request=self.courses_xml_request(term_id, subject_id),
             summary='fetch-courses-xml',
         )
 
+    def fetch_courses_xml_chunks(self, term_id, subject_id,
+                                 validator=None):
+        return self.fetch_chunks(
+            request=self.courses_xml_request(term_id, subject_id),
+            summary='fetch-courses-xml',
+            validator=validator,
+        )
+
+    def courses_xml_request(self, term_id, subject_id):
+        return _request(
+            url=oscar_url('bwckctlg.xml'),
+            data=urlencode([
+                ('term_in', term_id),
+                ('subj_in', '\t%s\t' % subject_id),
+                ('title_in', '%%'),
+                ('divs_in', '%'),
+                ('dept_in', '%'),
+                ('coll_in', '%'),
+                ('schd_in', '%'),
+                ('levl_in', '%'),
+                ('attr_in', '%'),
+                ('crse_strt_in', ''),
+                ('crse_end_in', ''),
+                ('cred_from_in', ''),
+                ('cred_to_in', ''),
+                ('last_updated', ''),
+            ]),
+        )
+
     def scrape_courses_xml(self, xml):
+        return list(self.iter_courses_xml([xml]))
 
-        soup = BeautifulStoneSoup(xml)
+    def iter_courses_xml(self, chunks):
+        """
+        Parses the catalog incrementally with expat. A course is
+        yielded as soon as its CourseInventory element closes, and
+        nothing else of the document is retained, so memory use does
+        not grow with the size of the catalog.
 
-        def text(node):
-            if node is not None:
-                return unescape(node.text)
+        The root element uses a namespace prefix that the document
+        never declares, so namespace processing must stay off.
 
-        number_re = re.compile('^' + course_number_re_fragment + '$')
+        :param chunks: An iterable of strings which, concatenated,
+            form the document.
+        """
 
-        def iter_courses():
-            for inventory in soup.findAll('courseinventory'):
-                def inventory_text(name):
-                    return text(inventory.find(name))
-
-                number = inventory_text('coursenumber')
-                if number_re.match(number):
-                    yield {
-                        'number': number,
-                        'name': inventory_text('courselongtitle'),
-                        'description': inventory_text('coursedescription'),
-                    }
+        parser = _CoursesXmlParser()
 
-        return list(iter_courses())
+        for chunk in chunks:
+            parser.feed(chunk)
+            for course in parser.drain():
+                yield course
+
+        parser.close()
+        for course in parser.drain():
+            yield course
 
     # Sections
     # -------------------------------------------------------------
 
-    def get_sections(self, term_id, subject_id):
+    def get_sections(self, term_id, subject_id, validator=None):
         """
-        :return: A list of dicts in the form
+        :return: A list of SectionRecords, which read like dicts in the
+            form
             {
                 'crn': '87134',
                 'course': '2110',
                 'name': 'A2',
             }
         """
-        html = self.fetch_sections_html(term_id, subject_id)
-        if html is not None:
-            return self.scrape_sections_html(html)
+        chunks = self.fetch_sections_chunks(term_id, subject_id, validator)
+        if chunks is not None:
+            return list(self.iter_sections_html(chunks))
 
     def fetch_sections_html(self, term_id, subject_id):
         return self.fetch_body(
-            request=Request(
-                url=oscar_url('bwckschd.p_get_crse_unsec'),
-                data=urlencode([
-                    ('term_in', term_id),
-                    ('sel_subj', 'dummy'),
-                    ('sel_day', 'dummy'),
-                    ('sel_schd', 'dummy'),
-                    ('sel_insm', 'dummy'),
-                    ('sel_camp', 'dummy'),
-                    ('sel_levl', 'dummy'),
-                    ('sel_sess', 'dummy'),
-                    ('sel_instr', 'dummy'),
-                    ('sel_ptrm', 'dummy'),
-                    ('sel_attr', 'dummy'),
-                    ('sel_subj', subject_id),
-                    ('sel_crse', ''),
-                    ('sel_title', ''),
-                    ('sel_schd', '%'),
-                    ('sel_from_cred', ''),
-                    ('sel_to_cred', ''),
-                    ('sel_camp', '%'),
-                    ('sel_ptrm', '%'),
-                    ('sel_instr', '%'),
-                    ('sel_attr', '%'),
-                    ('begin_hh', '0'),
-                    ('begin_mi', '0'),
-                    ('begin_ap', 'a'),
-                    ('end_hh', '0'),
-                    ('end_mi', '0'),
-                    ('end_ap', 'a'),
-                ]),
-            ),
+            request=self.sections_request(term_id, subject_id),
             summary='fetch-sections-html',
         )
 
-    def scrape_sections_html(self, html):
-
-        def join(x):
-            return map(lambda y: ''.join(y), x)
+    def fetch_sections_chunks(self, term_id, subject_id, validator=None):
+        return self.fetch_chunks(
+            request=self.sections_request(term_id, subject_id),
+            summary='fetch-sections-html',
+            validator=validator,
+        )
 
-        rows = join(grouper(2, re.split(
-            '(<TR>\n<TH CLASS="ddtitle")', html)[1:]))
+    def sections_request(self, term_id, subject_id):
+        return _request(
+            url=oscar_url('bwckschd.p_get_crse_unsec'),
+            data=urlencode([
+                ('term_in', term_id),
+                ('sel_subj', 'dummy'),
+                ('sel_day', 'dummy'),
+                ('sel_schd', 'dummy'),
+                ('sel_insm', 'dummy'),
+                ('sel_camp', 'dummy'),
+                ('sel_levl', 'dummy'),
+                ('sel_sess', 'dummy'),
+                ('sel_instr', 'dummy'),
+                ('sel_ptrm', 'dummy'),
+                ('sel_attr', 'dummy'),
+                ('sel_subj', subject_id),
+                ('sel_crse', ''),
+                ('sel_title', ''),
+                ('sel_schd', '%'),
+                ('sel_from_cred', ''),
+                ('sel_to_cred', ''),
+                ('sel_camp', '%'),
+                ('sel_ptrm', '%'),
+                ('sel_instr', '%'),
+                ('sel_attr', '%'),
+                ('begin_hh', '0'),
+                ('begin_mi', '0'),
+                ('begin_ap', 'a'),
+                ('end_hh', '0'),
+                ('end_mi', '0'),
+                ('end_ap', 'a'),
+            ]),
+        )
 
-        title_re = re.compile(
-            '<TH CLASS="ddtitle".*><A .*>' +
-            '.* - ([0-9]+) - .* (' + course_number_re_fragment + ')' +
-            ' - (' + section_name_re_fragment + ')</A></TH>')
+    def scrape_sections_html(self, html):
+        return list(self.iter_sections_html([html]))
 
-        def iter_sections():
-            for row in rows:
-                section = {}
-                match = title_re.search(row.replace('\n', ''))
-                if match is None: continue
-                yield {
-                    'crn': match.group(1),
-                    'course': match.group(2),
-                    'name': match.group(3),
-                }
+    def iter_sections_html(self, chunks):
+        """
+        Each section on this page begins with a th.ddtitle whose link
+        text has the form "Title - CRN - Subject Number - Section".
+        Only those headers are read, so the page can be consumed one
+        chunk at a time; memory use depends on the size of a chunk,
+        not the size of the page.
+
+        :param chunks: An iterable of strings which, concatenated,
+            form the page.
+        :return: A generator of SectionRecords, as from get_sections.
+        """
 
-        return list(iter_sections())
+        marker = '<TH CLASS="ddtitle"'
+        end_marker = '</TH>'
+        buf = ''
+
+        for chunk in chunks:
+            buf += chunk
+            pos = 0
+            while True:
+                start = buf.find(marker, pos)
+                if start == -1:
+                    # Keep just enough to detect a marker that is
+                    # split across two chunks.
+                    buf = buf[max(pos, len(buf) - len(marker)):]
+                    break
+                end = buf.find(end_marker, start)
+                if end == -1:
+                    if len(buf) - start > _section_title_limit:
+                        # No real header is this long; skip it.
+                        pos = start + len(marker)
+                        continue
+                    buf = buf[start:]
+                    break
+                match = _section_title_re.search(
+                    buf[start:end].replace('\n', ''))
+                pos = end + len(end_marker)
+                if match is not None:
+                    yield SectionRecord(*match.groups())
 
     # Section
     # -------------------------------------------------------------
 
-    def get_section(self, term_id, crn):
+    def get_section(self, term_id, crn, validator=None):
         """
         :return: A dict in the form
             {
@@ -402,37 +662,50 @@ class Scraper:
                 'capacity': Capacity(20, 9),
             }
         """
-        html = self.fetch_section_html(term_id, crn)
+        html = self.fetch_section_html(term_id, crn, validator)
         if html is not None:
             return self.scrape_section_html(html)
 
-    def fetch_section_html(self, term_id, crn):
+    def fetch_section_html(self, term_id, crn, validator=None):
         return self.fetch_body(
-            request=Request('%s?%s' % (
-                oscar_url('bwckschd.p_disp_detail_sched'),
-                urlencode([
-                    ('term_in', term_id),
-                    ('crn_in', crn),
-                ]),
-            )),
+            request=self.section_request(term_id, crn),
             summary='fetch-section-html',
+            validator=validator,
         )
 
-    def scrape_section_html(self, html):
+    def section_request(self, term_id, crn):
+        return _request('%s?%s' % (
+            oscar_url('bwckschd.p_disp_detail_sched'),
+            urlencode([
+                ('term_in', term_id),
+                ('crn_in', crn),
+            ]),
+        ))
 
-        section = {}
+    def scrape_section_html(self, html):
+        """
+        Only two things are read from this page: the header of the
+        first table, and the first row of seating numbers in the second
+        table. Rather than build a tree of the whole document, this
+        follows the parser's events and stops as soon as the seating
+        row has been read.
+        """
 
-        soup = BeautifulSoup(html)
+        parser = _SectionParser()
+        try:
+            parser.feed(html)
+            parser.close()
+        except _SectionParser.Done:
+            pass
 
-        header = soup.find('th', 'ddlabel')
-        if header is None:
+        if parser.header is None:
             return None
-        match = re.match(
-            '(.*) - [0-9]+ - (.*) (' + course_number_re_fragment + ')' +
-            ' - (' + section_name_re_fragment + ')$',
-            header.text.strip())
+
+        match = _section_header_re.match(''.join(parser.header).strip())
         if match is None:
             return None
+
+        section = {}
         section['name'] = match.group(1)
         section['course'] = Course(
             subject=match.group(2),
@@ -440,20 +713,319 @@ class Scraper:
         )
         section['section'] = match.group(4)
 
-        tables = soup.findAll('table', 'datadisplaytable')
-        if len(tables) >= 2:
-            table = tables[1]
-            trs = table.findAll('tr')
-            if len(trs) >= 2:
-                tr = trs[1]
-                tds = tr.findAll('td')
-                if len(tds) > 2:
-                    try:
-                        section['capacity'] = Capacity(
-                            max=int(tds[0].text),
-                            current=int(tds[1].text),
-                        )
-                    except ValueError:
-                        pass
+        cells = [''.join(cell) for cell in parser.cells]
+        if len(cells) > 2:
+            try:
+                section['capacity'] = Capacity(
+                    max=int(cells[0]),
+                    current=int(cells[1]),
+                )
+            except ValueError:
+                pass
 
         return section
+
+
+class _CoursesXmlParser:
+    """
+    Receives expat events for the course catalog XML, and accumulates
+    the courses that have been completely read until they are drained.
+    """
+
+    fields = {
+        'coursenumber': 'number',
+        'courselongtitle': 'name',
+        'coursedescription': 'description',
+    }
+
+    number_re = re.compile('^' + course_number_re_fragment + '$')
+
+    def __init__(self):
+        self.__parser = expat.ParserCreate()
+        self.__parser.StartElementHandler = self.__start
+        self.__parser.EndElementHandler = self.__end
+        self.__parser.CharacterDataHandler = self.__data
+        self.__course = None
+        self.__field = None
+        self.__text = None
+        self.__done = []
+
+    def feed(self, chunk):
+        self.__parser.Parse(chunk, False)
+
+    def close(self):
+        self.__parser.Parse('', True)
+
+    def drain(self):
+        done = self.__done
+        self.__done = []
+        return done
+
+    def __start(self, name, attrs):
+        name = name.lower()
+        if name == 'courseinventory':
+            self.__course = {}
+        elif self.__course is not None and self.__field is None:
+            field = self.fields.get(name)
+            if field is not None and field not in self.__course:
+                self.__field = (name, field)
+                self.__text = []
+
+    def __end(self, name):
+        name = name.lower()
+        if self.__field is not None and name == self.__field[0]:
+            self.__course[self.__field[1]] = ''.join(self.__text)
+            self.__field = None
+            self.__text = None
+        elif name == 'courseinventory' and self.__course is not None:
+            course = self.__course
+            self.__course = None
+            number = course.get('number')
+            if number is not None and self.number_re.match(number):
+                self.__done.append(CourseRecord(
+                    number,
+                    course.get('name'),
+                    course.get('description'),
+                ))
+
+    def __data(self, data):
+        if self.__text is not None:
+            self.__text.append(data)
+
+
+# Matches either a course title cell or a course description cell
+# in the course catalog listing. A title cell may span lines.
+_course_cell_re = re.compile(
+    '<TD CLASS="nttitle"((?s:.*?)</TD>)|<TD CLASS="ntdefault">([^<]*)')
+
+# Matches the rest of a course title cell.
+_course_title_re = re.compile(
+    '>[A-Z]+ (' + course_number_re_fragment + ') - (.*)</A></TD>$')
+
+# Matches the text of a section's header in the sections listing.
+_section_title_re = re.compile(
+    '<A [^>]*>.* - ([0-9]+) - .* (' + course_number_re_fragment + ')' +
+    ' - (' + section_name_re_fragment + ')</A>$')
+
+# The longest th.ddtitle element that iter_sections_html will look for.
+_section_title_limit = 4096
+
+_section_header_re = re.compile(
+    '(.*) - [0-9]+ - (.*) (' + course_number_re_fragment + ')' +
+    ' - (' + section_name_re_fragment + ')$')
+
+
+def _has_class(attrs, name):
+    for (key, value) in attrs:
+        if key == 'class' and value is not None:
+            return name in value.split()
+    return False
+
+
+class _SectionParser(HTMLParser):
+    """
+    Collects the text of the first th.ddlabel, and the text of each td
+    in the second row of the second table.datadisplaytable.
+    """
+
+    class Done(Exception):
+        pass
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.header = None
+        self.cells = []
+        self.__in_header = False
+        self.__in_cell = False
+        self.__tables = 0
+        self.__rows = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'th' and self.header is None \
+                and _has_class(attrs, 'ddlabel'):
+            self.header = []
+            self.__in_header = True
+        elif tag == 'table' and _has_class(attrs, 'datadisplaytable'):
+            self.__tables += 1
+        elif self.__tables >= 2:
+            if tag == 'tr':
+                self.__rows += 1
+                if self.__rows > 2:
+                    raise _SectionParser.Done()
+            elif tag == 'td' and self.__rows == 2:
+                self.cells.append([])
+                self.__in_cell = True
+
+    def handle_endtag(self, tag):
+        if tag == 'th':
+            self.__in_header = False
+        elif tag == 'td':
+            self.__in_cell = False
+        elif tag in ('tr', 'table') and self.__rows == 2:
+            raise _SectionParser.Done()
+
+    def handle_data(self, data):
+        if self.__in_header:
+            self.header.append(data)
+        elif self.__in_cell:
+            self.cells[-1].append(data)
+
+
+class AsyncScraper:
+    """
+    An asyncio version of Scraper's get_* methods. Each one is a
+    coroutine, so many requests can be in flight on one event loop.
+    Requests and parsing are delegated to a Scraper; only the
+    transport differs.
+    """
+
+    def __init__(self, context=None, enable_http=True,
+                 log_http=False, pool=None, limiter=None,
+                 retry_policy=None):
+
+        if context is None:
+            context = Context()
+
+        if pool is None:
+            pool = AsyncConnectionPool(context=context)
+
+        if limiter is None:
+            limiter = shared_limiter()
+
+        if retry_policy is None:
+            retry_policy = RetryPolicy()
+
+        self.__context = context
+        self.__enable_http = enable_http
+        self.__log_http = log_http
+        self.__pool = pool
+        self.__limiter = limiter
+        self.__retry_policy = retry_policy
+        self.__scraper = Scraper(context=context, enable_http=False)
+
+    def get_pool(self):
+        return self.__pool
+
+    async def fetch(self, request, summary=None, validator=None):
+
+        if not self.__enable_http:
+            return (None, None)
+
+        if validator is not None:
+            validator.prepare(request)
+
+        t = time.time()
+        try:
+            (response, body) = await self.__open(request)
+        except HTTPError as e:
+            if e.code == 304 and validator is not None:
+                self.__context.get_logger().info(
+                    'HTTP not modified\n%s' % request.get_full_url())
+                raise NotModified()
+            raise
+        t = timedelta(seconds=time.time() - t)
+        url = request.get_full_url()
+        self.__context.get_logger().info('HTTP time: %s\n%s' % (t, url))
+
+        if self.__log_http:
+            self.__scraper.write_http_log(request, body, summary)
+
+        if validator is not None:
+            validator.check(response, body)
+
+        return (response, body)
+
+    async def __open(self, request):
+        host = _host(request)
+        retry = 0
+
+        while True:
+            # Reserve a slot from the limiter without blocking the
+            # event loop, then wait for it.
+            wait = self.__limiter.reserve(host)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            _log_wait(self.__context, host, wait)
+            try:
+                return await self.__pool.open(request)
+            except Exception as e:
+                retry += 1
+                delay = _retry_delay(self.__context, self.__retry_policy,
+                                     request, e, retry)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def fetch_body(self, *args, **kwargs):
+        (response, body) = await self.fetch(*args, **kwargs)
+        return body
+
+    async def get_terms(self, validator=None):
+        html = await self.fetch_body(
+            request=self.__scraper.terms_request(),
+            summary='fetch-terms-html',
+            validator=validator,
+        )
+        if html is not None:
+            return self.__scraper.scrape_terms_html(html)
+
+    async def get_subjects(self, term_id, validator=None):
+        html = await self.fetch_body(
+            request=self.__scraper.subjects_request(term_id),
+            summary='fetch-subjects-html',
+            validator=validator,
+        )
+        if html is not None:
+            return self.__scraper.scrape_subjects_html(html)
+
+    async def get_courses(self, term_id=None, subject_id=None,
+                          methods=None, validator=None):
+
+        if methods is None:
+            methods = ['html', 'xml']
+
+        async def use_html():
+            html = await self.fetch_body(
+                request=self.__scraper.courses_html_request(
+                    term_id, subject_id),
+                summary='fetch-courses-html',
+                validator=validator,
+            )
+            return self.__scraper.scrape_courses_html(html)
+
+        async def use_xml():
+            xml = await self.fetch_body(
+                request=self.__scraper.courses_xml_request(
+                    term_id, subject_id),
+                summary='fetch-courses-xml',
+                validator=validator,
+            )
+            return self.__scraper.scrape_courses_xml(xml)
+
+        method_dict = {'html': use_html, 'xml': use_xml}
+
+        for method in methods:
+            courses = await method_dict[method]()
+            if len(courses) != 0:
+                return courses
+            else:
+                self.__context.get_logger().error(
+                    'get_courses (%s) failed' % method)
+
+    async def get_sections(self, term_id, subject_id, validator=None):
+        html = await self.fetch_body(
+            request=self.__scraper.sections_request(term_id, subject_id),
+            summary='fetch-sections-html',
+            validator=validator,
+        )
+        if html is not None:
+            return self.__scraper.scrape_sections_html(html)
+
+    async def get_section(self, term_id, crn, validator=None):
+        html = await self.fetch_body(
+            request=self.__scraper.section_request(term_id, crn),
+            summary='fetch-section-html',
+            validator=validator,
+        )
+        if html is not None:
+            return self.__scraper.scrape_section_html(html)
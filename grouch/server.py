@@ -0,0 +1,241 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl, urlsplit
+
+from model import Course, Term
+from remote import address_file
+from util import makedirs, maybe
+
+
+# JSON encoding of model objects
+# -------------------------------------------------------------
+
+def _encode_term(term):
+    return {'season': term.get_season(), 'year': term.get_year()}
+
+
+def _encode_subject(subject):
+    return {'id': subject.get_id(), 'name': subject.get_name()}
+
+
+def _encode_course(course):
+    return {'subject': course.get_subject(), 'number': course.get_number()}
+
+
+def _encode_section(section):
+    capacity = section.get('capacity')
+    return {
+        'course': _encode_course(section['course']),
+        'section': section['section'],
+        'name': section['name'],
+        'capacity': None if capacity is None else {
+            'max': capacity.get_max(),
+            'current': capacity.get_current(),
+        },
+    }
+
+
+def _encode_record(record):
+    return dict(zip(record._fields, record))
+
+
+# Server
+# -------------------------------------------------------------
+
+class Server(ThreadingMixIn, HTTPServer):
+    """
+    Answers queries from a single long-lived Store over HTTP, with
+    JSON responses. Since the Store stays in memory, what it has looked
+    up once is answered from memory until it expires, instead of every
+    query reloading it from the cache.
+
+    Each query is a GET request whose path names a Store method and
+    whose parameters are its arguments, e.g.
+
+        /sections?subject=CS&number=2110&season=3&year=2012
+
+    The response is an object whose "result" is the method's return
+    value, or null if the information is not available.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, store, port=0, host='127.0.0.1'):
+        HTTPServer.__init__(self, (host, port), _Handler)
+        self.store = store
+
+    def get_address(self):
+        (host, port) = self.server_address[:2]
+        return '%s:%d' % (host, port)
+
+    def run(self):
+        """
+        Serves until interrupted, advertising this server's address
+        in the address file for as long as it runs.
+        """
+
+        context = self.store.get_context()
+        filename = address_file(context)
+        makedirs(os.path.dirname(filename))
+
+        fp = open(filename, 'w')
+        try:
+            fp.write(self.get_address())
+        finally:
+            fp.close()
+
+        context.get_logger().info('Serving on %s' % self.get_address())
+
+        try:
+            self.serve_forever()
+        finally:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            self.server_close()
+
+
+def _query_term(q):
+    if 'season' in q and 'year' in q:
+        return Term(int(q['season']), int(q['year']))
+
+
+def _query_course(q):
+    return Course(q['subject'], q['number'])
+
+
+def _query_terms(store, q):
+    terms = store.get_terms()
+    if terms is not None:
+        return [_encode_term(t) for t in terms]
+
+
+def _query_subjects(store, q):
+    subjects = store.get_subjects(term=_query_term(q))
+    if subjects is not None:
+        return [_encode_subject(s) for s in subjects]
+
+
+def _query_subject(store, q):
+    return maybe(_encode_subject)(
+        store.find_subject(q['subject'], term=_query_term(q)))
+
+
+def _query_courses(store, q):
+    courses = store.get_courses(q['subject'], term=_query_term(q))
+    if courses is not None:
+        return [_encode_record(c) for c in courses]
+
+
+def _query_sections(store, q):
+    return store.get_sections(_query_course(q), term=_query_term(q))
+
+
+def _query_crn(store, q):
+    return store.get_crn(_query_course(q), q['section'],
+                         term=_query_term(q))
+
+
+def _query_find_crn(store, q):
+    found = store.find_crn(q['crn'], term=_query_term(q))
+    if found is not None:
+        return {
+            'course': _encode_course(found['course']),
+            'name': found['name'],
+        }
+
+
+def _query_is_crn(store, q):
+    return store.is_crn(q['crn'], term=_query_term(q))
+
+
+def _query_are_crns(store, q):
+    return store.are_crns(q['crns'].split(','), term=_query_term(q))
+
+
+def _query_search(store, q):
+    results = store.search(q['query'], term=_query_term(q),
+                           limit=int(q.get('limit', 20)))
+    if results is not None:
+        return [
+            {
+                'course': _encode_course(x['course']),
+                'name': x['name'],
+                'score': x['score'],
+            }
+            for x in results
+        ]
+
+
+def _query_section(store, q):
+    return maybe(_encode_section)(
+        store.get_section(q['crn'], term=_query_term(q)))
+
+
+_queries = {
+    'ping': lambda store, q: True,
+    'terms': _query_terms,
+    'subjects': _query_subjects,
+    'subject': _query_subject,
+    'courses': _query_courses,
+    'sections': _query_sections,
+    'crn': _query_crn,
+    'find_crn': _query_find_crn,
+    'is_crn': _query_is_crn,
+    'are_crns': _query_are_crns,
+    'section': _query_section,
+    'search': _query_search,
+}
+
+# The parameters each query cannot do without.
+_required = {
+    'subject': ('subject',),
+    'courses': ('subject',),
+    'sections': ('subject', 'number'),
+    'crn': ('subject', 'number', 'section'),
+    'find_crn': ('crn',),
+    'is_crn': ('crn',),
+    'are_crns': ('crns',),
+    'section': ('crn',),
+    'search': ('query',),
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        name = url.path.strip('/')
+        q = dict(parse_qsl(url.query))
+
+        if name not in _queries:
+            return self.__respond(404, {'error': 'unknown query'})
+
+        missing = [p for p in _required.get(name, ()) if p not in q]
+        if missing:
+            return self.__respond(400, {'error': 'missing %s' % ', '.join(
+                repr(p) for p in missing)})
+
+        try:
+            result = _queries[name](self.server.store, q)
+        except Exception:
+            self.server.store.get_context().get_logger().exception(
+                'Query failed: %s' % self.path)
+            return self.__respond(500, {'error': 'query failed'})
+
+        self.__respond(200, {'result': result})
+
+    def __respond(self, status, obj):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.store.get_context().get_logger().info(
+            'Query %s' % (format % args))
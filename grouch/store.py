@@ -1,245 +1,884 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-import difflib
+import json
 import os, os.path
-import pickle
 import string
+import sys
+import threading
 
+from cache import MissingSnapshot, RetentionPolicy, parse_timestamp, \
+    timestamp_format
+from catalog import Catalog, catalog_file, write_catalog
+import codec
 from context import Context
-from model import Subject
-from scraper import Scraper
-from util import character_whitelist, makedirs
+from index import CrnIndex, SearchIndex, SectionIndex, SubjectIndex
+from model import Course, CourseRecord, SectionRecord, Subject
+from transport import NotModified, Validator
+from util import character_whitelist, map_distinct
 
 
-class Store:
-    def __init__(self, context=None, enable_http=True,
-                 log_http=False, force_refresh=False):
+class _Snapshot:
+    """
+    A snapshot that a lookup needs: where it is in the Journal, how long
+    it keeps, and the scraper method (and its arguments) which fetches
+    it when it is not in the cache.
+    """
+
+    def __init__(self, path, type_, shelf_life, method, **arguments):
+        self.path = path
+        self.type = type_
+        self.shelf_life = shelf_life
+        self.method = method
+        self.arguments = arguments
 
-        if context is None:
-            context = Context()
+
+class _Lookups:
+    """
+    The lookups shared by Store and AsyncStore. Each is a generator
+    which yields a _Snapshot for every snapshot it needs, and is sent the
+    snapshot in return (or None if it is not available). Store gets the
+    snapshots by blocking, and AsyncStore by awaiting.
+    """
+
+    def __init__(self, context, force_refresh, stale_grace=None,
+                 ephemeral=True):
 
         self.__context = context
-        self.__enable_http = enable_http
-        self.__log_http = log_http
-        self.__private_scrapers = {}
+        self.__force_refresh = force_refresh
 
-        self.__public_scraper = Scraper(
-            context=context,
-            enable_http=enable_http,
-            log_http=log_http,
-        )
+        # Open term catalogs (or None where there is none), with the
+        # modification times of their files, by term id.
+        self.__catalogs = {}
 
         self.__journal = Journal(
             context=context,
             force_refresh=force_refresh,
+            stale_grace=stale_grace,
+            ephemeral=ephemeral,
         )
+        self.__indexes = _TermIndexes(self.__journal)
+        self.__journal.add_listener(self.__indexes.on_put)
 
-    def add_private_scraper(self, username, password):
-        self.__private_scrapers[username] = Scraper(
-            context=self.__context,
-            enable_http=self.__enable_http,
-            log_http=self.__log_http,
-            username=username,
-            password=password,
-        )
+    def get_context(self):
+        return self.__context
 
-    def get_scraper(self, username=None):
-        if username is not None:
-            if username in self.__private_scrapers:
-                return self.__private_scrapers[username]
-        else:
-            return self.__public_scraper
+    def _journal(self, *path):
+        return self.__journal.child(*path)
 
-    def get_terms(self):
-        """
-        :return: A list of Terms, sorted by chronology in reverse.
-        """
-
-        terms = self.__get_terms()
-
-        if terms is not None:
-            return terms.list
+    def _indexes(self):
+        return self.__indexes
 
-    def __get_terms(self):
+    def prune_cache(self):
+        """
+        Deletes old cached snapshots according to the Context's
+        RetentionPolicy.
 
-        def scrape():
-            source = self.get_scraper().get_terms()
-            if source is not None:
-                return Terms(source)
+        :return: A tuple (number of snapshots deleted, bytes freed).
+        """
 
-        journal = self.__journal.child('terms')
+        return self.__context.get_cache().prune(
+            self.__context.get_retention())
 
-        return journal.get(Terms,
-                           shelf_life=timedelta(days=1),
-                           alternative=scrape)
+    def _terms(self):
+        return (yield _Snapshot(['terms'], Terms, timedelta(days=1),
+                                'get_terms'))
 
-    def __get_term_id(self, term=None):
-        terms = self.__get_terms()
+    def _term_id(self, term=None):
+        terms = yield from self._terms()
         if terms is None:
             return None
         if term is None:
             term = terms.list[0]
         return terms.dict[term]
 
-    def get_subjects(self, term=None):
-        """
-        :return: A list of Subjects, sorted by name.
-        """
-
-        subjects = self.__get_subjects(term)
-
-        if subjects is not None:
-            return subjects.list
+    def _get_terms(self):
+        terms = yield from self._terms()
+        if terms is not None:
+            return terms.list
 
-    def __get_subjects(self, term=None):
+    def _subjects(self, term=None):
 
-        term_id = self.__get_term_id(term)
+        term_id = yield from self._term_id(term)
 
         if term_id is None:
             return None
 
-        def scrape():
-            source = self.get_scraper().get_subjects(term_id=term_id)
-            if source is not None:
-                return Subjects(source)
+        return (yield _Snapshot(['terms', term_id, 'subjects'], Subjects,
+                                timedelta(days=1), 'get_subjects',
+                                term_id=term_id))
 
-        journal = self.__journal.child('terms', term_id, 'subjects')
-
-        return journal.get(Subjects,
-                           shelf_life=timedelta(days=1),
-                           alternative=scrape)
-
-    def find_subject(self, s, term=None):
-
-        subjects = self.__get_subjects(term)
+    def _get_subjects(self, term=None):
+        subjects = yield from self._subjects(term)
+        if subjects is not None:
+            return subjects.list
 
+    def _find_subject(self, s, term=None):
+        subjects = yield from self._subjects(term)
         if subjects is not None:
             return subjects.find(s)
 
-    def __subject_id(self, s, term=None):
+    def _subject_id(self, s, term=None):
         if not isinstance(s, Subject):
-            s = self.find_subject(s, term)
+            s = yield from self._find_subject(s, term)
         if s is not None:
             return s.get_id()
 
-    def get_courses(self, subject, term=None):
+    def _courses(self, subject, term=None):
+
+        term_id = yield from self._term_id(term)
+
+        if term_id is None:
+            return None
+
+        subject_id = yield from self._subject_id(subject, term)
+
+        if subject_id is None:
+            return None
 
-        courses = self.__get_courses(subject, term)
+        return (yield _Snapshot(
+            ['terms', term_id, 'subject', subject_id, 'courses'], Courses,
+            timedelta(hours=6), 'get_courses',
+            subject_id=subject_id, term_id=term_id))
 
+    def _get_courses(self, subject, term=None):
+        courses = yield from self._courses(subject, term)
         if courses is not None:
             return courses.source
 
-    def __get_courses(self, subject, term=None):
+    def _sections(self, subject, term=None):
 
-        term_id = self.__get_term_id(term)
+        term_id = yield from self._term_id(term)
 
         if term_id is None:
             return None
 
-        subject_id = self.__subject_id(subject)
+        subject_id = yield from self._subject_id(subject, term)
 
         if subject_id is None:
             return None
 
-        def scrape():
-            source = self.get_scraper().get_courses(
-                subject_id=subject_id,
-                term_id=term_id,
-            )
-            if source is not None:
-                return Courses(source)
+        return (yield _Snapshot(
+            ['terms', term_id, 'subject', subject_id, 'sections'], Sections,
+            timedelta(hours=6), 'get_sections',
+            subject_id=subject_id, term_id=term_id))
 
-        journal = self.__journal.child('terms', term_id,
-                                       'subject', subject_id, 'courses')
+    def _get_sections(self, course, term=None):
+        sections = yield from self._sections(course.get_subject(), term)
+        if sections is not None:
+            return sections.for_course(course.get_number())
 
-        return journal.get(Courses,
-                           shelf_life=timedelta(hours=6),
-                           alternative=scrape)
+    def _get_crn(self, course, section, term=None):
 
-    def get_sections(self, course, term=None):
+        catalog = yield from self._catalog(term)
 
-        return list([
-            {
-                'name': section['name'],
-                'crn': section['crn'],
-            }
-            for section in self.__get_sections(
-                subject=course.get_subject(),
-                term=term,
-            ).source
-            if section['course'] == course.get_number()
-        ])
+        if catalog is not None:
+            subject = course.get_subject()
+            if isinstance(subject, Subject):
+                subject = subject.get_id()
+            crn = catalog.find_section(subject.upper(), course.get_number(),
+                                       section)
+            if crn is not None:
+                return crn
+
+        sections = yield from self._sections(course.get_subject(), term)
+
+        if sections is not None:
+            return sections.find_crn(course.get_number(), section)
+
+    def _find_crn(self, crn, term=None):
+
+        catalog = yield from self._catalog(term)
+
+        if catalog is not None:
+            found = catalog.find_crn(crn)
+            if found is not None:
+                return {
+                    'course': found['course'],
+                    'name': found['name'],
+                }
+
+        index = yield from self._crn_index(term)
+
+        if index is not None:
+            found = index.find(crn)
+            if found is not None:
+                (subject_id, number, name) = found
+                return {
+                    'course': Course(subject_id, number),
+                    'name': name,
+                }
+
+    def _is_crn(self, crn, term=None):
+        found = yield from self._are_crns([crn], term)
+        return found[crn]
+
+    def _are_crns(self, crns, term=None):
+        """
+        Looks up the term's catalog, CRN index, and subjects at most once
+        for all of the CRNs.
+        """
+
+        found = dict.fromkeys(crns)
+
+        catalog = yield from self._catalog(term)
+
+        if catalog is not None:
+            for crn in found:
+                if catalog.find_crn(crn) is not None:
+                    found[crn] = True
+
+        index = yield from self._crn_index(term)
+
+        if index is not None:
+            for crn in found:
+                if found[crn] is None and index.find(crn) is not None:
+                    found[crn] = True
+
+        unknown = [crn for crn in found if found[crn] is None]
+        if not unknown:
+            return found
+
+        # A catalog lists every section of the term.
+        if catalog is None:
+            subjects = yield from self._get_subjects(term)
+
+            if index is None or subjects is None:
+                return found
+
+            indexed = set(index.get_subjects())
+            if not all(_safe_str(s.get_id()) in indexed for s in subjects):
+                return found
+
+        for crn in unknown:
+            found[crn] = False
+        return found
+
+    def _write_catalog(self, term=None):
+        """
+        Packs the cached courses and sections of every subject in a
+        term into the term's catalog, along with the capacities of any
+        sections that have been cached.
+        """
+
+        term_id = yield from self._term_id(term)
+        subjects = yield from self._get_subjects(term)
+
+        if term_id is None or subjects is None:
+            return None
+
+        courses = {}
+        sections = {}
+        capacities = {}
+
+        for subject in subjects:
+            subject_id = subject.get_id()
+
+            c = yield from self._courses(subject, term)
+            if c is not None:
+                courses[subject_id] = c.source
+
+            # A catalog is taken to list every section of the term.
+            s = yield from self._sections(subject, term)
+            if s is None:
+                return None
+            sections[subject_id] = s.source
+            for row in s.source:
+                section = self._journal(
+                    'terms', term_id, 'crn', row['crn']).latest(Section)
+                if section is not None \
+                        and section.source.get('capacity') is not None:
+                    capacities[row['crn']] = section.source['capacity']
+
+        count = write_catalog(
+            catalog_file(self.__context, term_id),
+            subjects, courses, sections, capacities,
+        )
+
+        self.__catalogs.pop(term_id, None)
 
-    def __get_sections(self, subject, term=None):
+        return count
 
-        term_id = self.__get_term_id(term)
+    def _catalog(self, term=None):
+        """
+        :return: The term's catalog, or None if there is none or it is
+            older than sections which have been put since.
+        """
+
+        if self.__force_refresh:
+            return None
+
+        term_id = yield from self._term_id(term)
 
         if term_id is None:
             return None
 
-        subject_id = self.__subject_id(subject)
+        filename = catalog_file(self.__context, term_id)
+        try:
+            mtime = os.path.getmtime(filename)
+        except OSError:
+            return None
 
-        if subject_id is None:
+        # A catalog rebuilt since it was opened (perhaps by another
+        # process) is opened again.
+        (opened, catalog) = self.__catalogs.get(term_id, (None, None))
+        if opened != mtime:
+            catalog = Catalog.open(filename)
+            self.__catalogs[term_id] = (mtime, catalog)
+
+        if catalog is None or self.__is_stale(term_id, mtime):
             return None
 
-        def scrape():
-            source = self.get_scraper().get_sections(
-                subject_id=subject_id,
-                term_id=term_id,
-            )
-            if source is not None:
-                return Sections(source)
+        return catalog
 
-        journal = self.__journal.child('terms', term_id,
-                                       'subject', subject_id, 'sections')
+    def __is_stale(self, term_id, mtime):
+        # Every put of a subject's sections updates the term's CRN
+        # index, so an index newer than the catalog has sections which
+        # the catalog lacks.
+        latest = self.__context.get_cache().latest(
+            ['terms', _safe_str(term_id), _index_kinds['sections'][0]])
+        return latest is not None \
+            and parse_timestamp(latest) > datetime.utcfromtimestamp(mtime)
 
-        return journal.get(Sections,
-                           shelf_life=timedelta(hours=6),
-                           alternative=scrape)
+    def _crn_index(self, term=None):
 
-    def get_crn(self, course, section, term=None):
+        term_id = yield from self._term_id(term)
+
+        if term_id is None:
+            return None
+
+        return self.__indexes.get(term_id, 'sections')
+
+    def _search(self, query, term=None, limit=20):
 
-        term_id = self.__get_term_id(term)
+        term_id = yield from self._term_id(term)
 
         if term_id is None:
             return None
 
-        sections = self.get_sections(course, term)
-        matches = list([s['crn'] for s in sections
-                        if s['name'].upper() == section.upper()])
+        index = self.__indexes.get(term_id, 'courses')
 
-        if len(matches) == 1:
-            return matches[0]
+        if index is not None:
+            return list([
+                {
+                    'course': Course(subject_id, number),
+                    'name': name,
+                    'score': score,
+                }
+                for (subject_id, number, name, score)
+                in index.search(query, limit=limit)
+            ])
 
-    def get_section(self, crn, term=None):
+    def _section(self, crn, term=None, shelf_life=None):
 
-        section = self.__get_section(crn, term)
+        if shelf_life is None:
+            shelf_life = timedelta(minutes=10)
 
+        term_id = yield from self._term_id(term)
+
+        if term_id is None:
+            return None
+
+        return (yield _Snapshot(['terms', term_id, 'crn', crn], Section,
+                                shelf_life, 'get_section',
+                                crn=crn, term_id=term_id))
+
+    def _get_section(self, crn, term=None, shelf_life=None):
+        section = yield from self._section(crn, term, shelf_life)
         if section is not None:
             return section.source
 
-    def __get_section(self, crn, term=None):
+    def _get(self, snapshot):
+        return (yield snapshot)
 
-        term_id = self.__get_term_id(term)
 
-        if term_id is None:
+class Store(_Lookups):
+    """
+    :param stale_grace: A timedelta, or None. If given, a cached
+        snapshot that has expired by no more than this is returned
+        immediately, and refreshed in the background.
+    :param ephemeral: Whether this Store is used for only a short time,
+        such as a single command. An ephemeral Store looks each thing
+        up at most once and keeps it in memory for good. Otherwise,
+        what is kept in memory expires just as the cache does.
+    :param limiter: The RateLimiter for requests. Defaults to the one
+        shared by every Scraper in the process.
+    :param retry_policy: The RetryPolicy for failed requests.
+    :param timeout: The number of seconds a request may stall before
+        it fails.
+    :param detach_refreshes: Whether stale snapshots are refreshed by
+        a separate process, which this one does not wait for, rather
+        than by a thread, which it must wait for before it exits. This
+        suits a Store used for a single command.
+    """
+
+    def __init__(self, context=None, enable_http=True,
+                 log_http=False, force_refresh=False,
+                 max_connections_per_host=4, stale_grace=None,
+                 ephemeral=True, limiter=None, retry_policy=None,
+                 timeout=30, detach_refreshes=False):
+
+        if context is None:
+            context = Context()
+
+        _Lookups.__init__(self, context, force_refresh,
+                        stale_grace=stale_grace, ephemeral=ephemeral)
+
+        self.__context = context
+        self.__enable_http = enable_http
+        self.__log_http = log_http
+        self.__limiter = limiter
+        self.__retry_policy = retry_policy
+        self.__max_connections_per_host = max_connections_per_host
+        self.__timeout = timeout
+        self.__detach_refreshes = detach_refreshes
+        self.__private_scrapers = {}
+
+        # The connection pool and the public scraper are made when
+        # something is first fetched, so that a command answered from
+        # the cache does not pay for them.
+        self.__scraper_lock = threading.Lock()
+        self.__pool = None
+        self.__public_scraper = None
+
+    def __new_scraper(self, **kwargs):
+        # The scraper, its parsers and the connection pool are imported
+        # only once something needs to be fetched.
+        from connections import ConnectionPool
+        from scraper import Scraper
+
+        # All of this Store's scrapers share one pool of connections.
+        with self.__scraper_lock:
+            if self.__pool is None:
+                self.__pool = ConnectionPool(
+                    context=self.__context,
+                    max_per_host=self.__max_connections_per_host,
+                    timeout=self.__timeout,
+                )
+        return Scraper(
+            context=self.__context,
+            enable_http=self.__enable_http,
+            log_http=self.__log_http,
+            pool=self.__pool,
+            limiter=self.__limiter,
+            retry_policy=self.__retry_policy,
+            **kwargs
+        )
+
+    def add_private_scraper(self, username, password):
+        self.__private_scrapers[username] = self.__new_scraper(
+            username=username,
+            password=password,
+        )
+
+    def get_scraper(self, username=None):
+        if username is not None:
+            if username in self.__private_scrapers:
+                return self.__private_scrapers[username]
+        else:
+            if self.__public_scraper is None:
+                scraper = self.__new_scraper()
+                with self.__scraper_lock:
+                    if self.__public_scraper is None:
+                        self.__public_scraper = scraper
+            return self.__public_scraper
+
+    def __run(self, lookups):
+        """
+        Runs a lookup from _Lookups, getting each snapshot it needs from
+        the Journal, or else fetching it.
+        """
+
+        data = None
+        while True:
+            try:
+                lookup = lookups.send(data)
+            except StopIteration as stop:
+                return stop.value
+
+            def scrape(validator=None, lookup=lookup):
+                method = getattr(self.get_scraper(), lookup.method)
+                source = method(validator=validator, **lookup.arguments)
+                if source is not None:
+                    return lookup.type(source)
+
+            detach = None
+            if self.__detach_refreshes and self.__enable_http:
+                detach = lambda lookup=lookup: self.__detach(lookup)
+
+            data = self._journal(*lookup.path).get(
+                lookup.type,
+                shelf_life=lookup.shelf_life,
+                alternative=scrape,
+                detach=detach,
+            )
+
+    def __detach(self, lookup):
+        """
+        Starts a process which refreshes a snapshot. It has a session of
+        its own and none of this process's standard streams, so neither
+        this process nor anything reading its output waits for it.
+        """
+
+        # Only a detached refresh needs subprocess.
+        import subprocess
+
+        context = self.get_context()
+        job = json.dumps({
+            'path': lookup.path,
+            'type': lookup.type.__name__,
+            'shelf_life': lookup.shelf_life.total_seconds(),
+            'method': lookup.method,
+            'arguments': lookup.arguments,
+            'cache': context.get_cache_name(),
+            'compression': context.get_compression(),
+            'log_http': self.__log_http,
+            'timeout': self.__timeout,
+        })
+
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [_package_root] + list(filter(None, [env.get('PYTHONPATH')])))
+
+        subprocess.Popen(
+            [sys.executable, '-c',
+             'import sys, grouch.store; '
+             'grouch.store.refresh_snapshot(sys.argv[1])', job],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            close_fds=True,
+            start_new_session=True,
+            env=env,
+        )
+
+    def run_detached_refresh(self, job):
+        """
+        Refreshes a snapshot, as a process started by another Store's
+        detached refresh, unless it has been refreshed already.
+
+        :param job: A dict, as written by that Store.
+        """
+
+        lookup = _Snapshot(
+            job['path'],
+            _snapshot_types[job['type']],
+            timedelta(seconds=job['shelf_life']),
+            job['method'],
+            **job['arguments']
+        )
+        return self.__run(self._get(lookup))
+
+    def get_terms(self):
+        """
+        :return: A list of Terms, sorted by chronology in reverse.
+        """
+        return self.__run(self._get_terms())
+
+    def get_subjects(self, term=None):
+        """
+        :return: A list of Subjects, sorted by name.
+        """
+        return self.__run(self._get_subjects(term))
+
+    def find_subject(self, s, term=None):
+        return self.__run(self._find_subject(s, term))
+
+    def get_courses(self, subject, term=None):
+        return self.__run(self._get_courses(subject, term))
+
+    def get_sections(self, course, term=None):
+        return self.__run(self._get_sections(course, term))
+
+    def get_crn(self, course, section, term=None):
+        return self.__run(self._get_crn(course, section, term))
+
+    def find_crn(self, crn, term=None):
+        """
+        Finds the section that a CRN belongs to, from the term's
+        catalog if it has one, or else from the term's index of the
+        sections that have been cached. This never fetches anything.
+
+        :return: A dict in the form
+            {
+                'course': Course('CS', '2110'),
+                'name': 'A2',
+            }
+            or None if the CRN is not in the index.
+        """
+        return self.__run(self._find_crn(crn, term))
+
+    def is_crn(self, crn, term=None):
+        """
+        :return: True if the CRN belongs to a section in the term, False
+            if it does not, or None if that is not known because not
+            every subject's sections have been cached.
+        """
+        return self.__run(self._is_crn(crn, term))
+
+    def are_crns(self, crns, term=None):
+        """
+        Does what is_crn does for many CRNs at once.
+
+        :return: A dict from each CRN to True, False, or None, as is_crn
+            would return for it.
+        """
+        return self.__run(self._are_crns(crns, term))
+
+    def search(self, query, term=None, limit=20):
+        """
+        Finds courses by the words in their names and descriptions, from
+        the term's index of the courses that have been cached. This
+        never fetches anything.
+
+        :return: A list of dicts in the form
+            {
+                'course': Course('CS', '4780'),
+                'name': 'Machine Learning',
+                'score': 4.2,
+            }
+            best first, or None if no courses have been indexed.
+        """
+        return self.__run(self._search(query, term, limit))
+
+    def get_section(self, crn, term=None, shelf_life=None):
+        """
+        :param shelf_life: How old a cached snapshot may be and still be
+            used, as a timedelta. Defaults to ten minutes.
+        """
+        return self.__run(self._get_section(crn, term, shelf_life))
+
+    def build_catalog(self, term=None, workers=8, progress=None):
+        """
+        Fills the cache with the courses and sections of every subject
+        in a term, as prefetch does, then packs them into the term's
+        catalog, along with the capacities of any sections that have
+        been cached. From then on, lookups by CRN and by section name
+        are answered from the catalog.
+
+        :return: The number of sections in the catalog, or None if the
+            list of subjects or any subject's sections are not
+            available, in which case no catalog is written.
+        """
+
+        if self.prefetch(term, workers, progress) is None:
+            return None
+
+        return self.__run(self._write_catalog(term))
+
+    def get_sections_capacity(self, crns, term=None, workers=8):
+        """
+        Looks up many sections at once. Each CRN is looked up only once,
+        however many times it is given. Sections that are fresh in the
+        cache are read from it; the rest are fetched concurrently on a
+        pool of worker threads.
+
+        :return: A generator of tuples (crn, section), in the order in
+            which the lookups complete, where section is as returned by
+            get_section (and so includes the capacity), or None if it is
+            not available.
+        """
+
+        # Look up the term once, rather than in every worker at once.
+        if self.__run(self._term_id(term)) is None:
+            return
+
+        for result in map_distinct(
+                lambda crn: self.get_section(crn, term), crns, workers,
+                logger=self.__context.get_logger()):
+            yield result
+
+    def prefetch(self, term=None, workers=8, progress=None):
+        """
+        Fills the cache with the courses and sections of every subject
+        in a term. Fetches run concurrently on a pool of worker threads;
+        the number of simultaneous requests to Oscar is still bounded
+        by the Store's max_connections_per_host.
+
+        :param progress: An optional function, called after each fetch
+            as progress(done, total, subject, kind), where kind is
+            'courses' or 'sections'.
+        :return: The number of fetches that failed, or None if the
+            list of subjects is not available.
+        """
+
+        subjects = self.get_subjects(term)
+
+        if subjects is None:
             return None
 
-        def scrape():
-            source = self.get_scraper().get_section(
-                crn=crn,
-                term_id=term_id,
+        jobs = []
+        for subject in subjects:
+            jobs.append((subject, 'courses', self._courses))
+            jobs.append((subject, 'sections', self._sections))
+
+        # Rather than update the term's indexes once for each subject,
+        # rebuild each once at the end.
+        self._indexes().defer()
+
+        try:
+            return self.__prefetch(jobs, term, workers, progress)
+        finally:
+            self._indexes().resume()
+
+    def __prefetch(self, jobs, term, workers, progress):
+
+        logger = self.__context.get_logger()
+        failures = 0
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = dict(
+                (executor.submit(self.__run, lookups(subject, term)),
+                 (subject, kind))
+                for (subject, kind, lookups) in jobs
+            )
+            for (done, future) in enumerate(as_completed(futures), 1):
+                (subject, kind) = futures[future]
+                try:
+                    result = future.result()
+                except Exception:
+                    logger.exception('prefetch %s %s failed'
+                                     % (subject.get_id(), kind))
+                    result = None
+                if result is None:
+                    failures += 1
+                if progress is not None:
+                    progress(done, len(jobs), subject, kind)
+
+        return failures
+
+
+def refresh_snapshot(job):
+    """
+    The main function of a process started by Store's detached refresh.
+
+    :param job: The refresh to do, as JSON.
+    """
+
+    job = json.loads(job)
+    context = Context(
+        cache=job['cache'],
+        compression=job['compression'],
+        # Pruning is left to the processes people are waiting on.
+        retention=RetentionPolicy(auto_interval=None),
+    )
+    store = Store(
+        context=context,
+        log_http=job['log_http'],
+        timeout=job['timeout'],
+    )
+    try:
+        store.run_detached_refresh(job)
+    except Exception:
+        context.get_logger().exception('Detached refresh failed')
+
+
+# The directory which holds the grouch package, so that a process
+# started by a detached refresh can import it.
+_package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class AsyncStore(_Lookups):
+    """
+    A Store whose lookups are coroutines. Cache misses are fetched
+    with an AsyncScraper, so any number of lookups can be in flight
+    on one event loop. The cache is shared with the blocking Store.
+    """
+
+    def __init__(self, context=None, enable_http=True,
+                 log_http=False, force_refresh=False,
+                 max_connections_per_host=4, limiter=None,
+                 retry_policy=None, timeout=30):
+
+        if context is None:
+            context = Context()
+
+        _Lookups.__init__(self, context, force_refresh)
+
+        from connections import AsyncConnectionPool
+        from scraper import AsyncScraper
+
+        self.__scraper = AsyncScraper(
+            context=context,
+            enable_http=enable_http,
+            log_http=log_http,
+            pool=AsyncConnectionPool(
+                context=context,
+                max_per_host=max_connections_per_host,
+                timeout=timeout,
+            ),
+            limiter=limiter,
+            retry_policy=retry_policy,
+        )
+
+    def get_scraper(self):
+        return self.__scraper
+
+    async def __run(self, lookups):
+        """
+        The same as Store's, except that fetches are awaited.
+        """
+
+        data = None
+        while True:
+            try:
+                lookup = lookups.send(data)
+            except StopIteration as stop:
+                return stop.value
+
+            async def scrape(validator=None, lookup=lookup):
+                method = getattr(self.__scraper, lookup.method)
+                source = await method(validator=validator,
+                                      **lookup.arguments)
+                if source is not None:
+                    return lookup.type(source)
+
+            data = await self._journal(*lookup.path).get_async(
+                lookup.type,
+                shelf_life=lookup.shelf_life,
+                alternative=scrape,
             )
-            if source is not None:
-                return Section(source)
 
-        journal = self.__journal.child('terms', term_id, 'crn', crn)
+    async def get_terms(self):
+        return await self.__run(self._get_terms())
+
+    async def get_subjects(self, term=None):
+        return await self.__run(self._get_subjects(term))
+
+    async def find_subject(self, s, term=None):
+        return await self.__run(self._find_subject(s, term))
 
-        return journal.get(Section,
-                           shelf_life=timedelta(minutes=10),
-                           alternative=scrape)
+    async def get_courses(self, subject, term=None):
+        return await self.__run(self._get_courses(subject, term))
 
+    async def get_sections(self, course, term=None):
+        return await self.__run(self._get_sections(course, term))
 
-_timestamp_format = '%Y-%m-%d-%H-%M-%S-%f'
+    async def get_crn(self, course, section, term=None):
+        return await self.__run(self._get_crn(course, section, term))
+
+    async def find_crn(self, crn, term=None):
+        return await self.__run(self._find_crn(crn, term))
+
+    async def is_crn(self, crn, term=None):
+        return await self.__run(self._is_crn(crn, term))
+
+    async def are_crns(self, crns, term=None):
+        return await self.__run(self._are_crns(crns, term))
+
+    async def search(self, query, term=None, limit=20):
+        return await self.__run(self._search(query, term, limit))
+
+    async def get_section(self, crn, term=None, shelf_life=None):
+        return await self.__run(self._get_section(crn, term, shelf_life))
+
+
+# Each kind of snapshot is written with codec.dump. Loading one which
+# was pickled before the codec marks it as migrated, and the Journal
+# then writes it again with the codec.
+
+def _loaded(data, version):
+    data.migrated = version is None
+    return data
 
 
 class Terms:
@@ -249,79 +888,146 @@ class Terms:
         self.list.sort(reverse=True)
         self.dict = dict(source)
 
-    def dump(self, fp):
-        pickle.dump(self.source, fp)
+    def dump(self, fp, compression='none'):
+        codec.dump(fp, 'Terms', self.source, compression)
 
     @staticmethod
     def load(fp):
-        return Terms(pickle.load(fp))
+        (source, version) = codec.load(fp, 'Terms')
+        return _loaded(Terms(source), version)
 
 
 class Subjects:
-    def __init__(self, source):
+    def __init__(self, source, index=None):
         self.source = source
         self.list = list(source)
         self.list.sort(key=lambda x: x.get_name())
-
-    def dump(self, fp):
-        pickle.dump(self.source, fp)
+        if index is None:
+            index = SubjectIndex(self.list)
+        self.index = index
+
+    def dump(self, fp, compression='none'):
+        # The index is stored too, so that it is built only once.
+        # Version 1 held only the list of subjects.
+        codec.dump(fp, 'Subjects', {
+            'source': self.source,
+            'index': self.index.get_state(),
+        }, compression, version=2)
 
     @staticmethod
     def load(fp):
-        return Subjects(pickle.load(fp))
+        (x, version) = codec.load(fp, 'Subjects')
+        if version is not None and version >= 2:
+            index = SubjectIndex.from_state(x['index'])
+            return _loaded(Subjects(x['source'], index), version)
+        # Pickles hold the list of subjects, and later its index too.
+        if isinstance(x, dict):
+            return _loaded(Subjects(x['source'], x['index']), version)
+        return _loaded(Subjects(x), version)
 
     def find(self, s):
-        s = s.upper()
+        i = self.index.find(s)
+        if i is not None:
+            return self.list[i]
 
-        for subject in self.list:
-            if s == subject.get_id():
-                return subject
 
-        subject_names = list([subject.get_name().upper()
-                              for subject in self.list])
-        matches = difflib.get_close_matches(s, subject_names, n=1)
-
-        if len(matches) != 0:
-            subject_name = matches[0]
-            for subject in self.list:
-                if subject_name == subject.get_name().upper():
-                    return subject
+def _records(type_, rows):
+    """
+    :return: The rows as records of a type. Older snapshots hold dicts.
+    """
+    return list([
+        row if isinstance(row, type_) else type_(**row)
+        for row in rows
+    ])
 
 
 class Courses:
     def __init__(self, source):
         self.source = source
 
-    def dump(self, fp):
-        pickle.dump(self.source, fp)
+    def dump(self, fp, compression='none'):
+        # Each course is decoded only when it is used.
+        codec.dump(fp, 'Courses', codec.Lazy(self.source), compression)
 
     @staticmethod
     def load(fp):
-        return Courses(pickle.load(fp))
+        (source, version) = codec.load(fp, 'Courses')
+        if version is None:
+            source = _records(CourseRecord, source)
+        return _loaded(Courses(source), version)
 
 
 class Sections:
-    def __init__(self, source):
+    def __init__(self, source, index=None):
         self.source = source
-
-    def dump(self, fp):
-        pickle.dump(self.source, fp)
+        if index is None:
+            index = SectionIndex(source)
+        self.index = index
+
+    def dump(self, fp, compression='none'):
+        # The index is stored too, so that it is built only once, and
+        # each section is decoded only when it is used. Version 1 held
+        # the index as a dict of each course's positions.
+        (numbers, offsets, positions) = self.index.get_state()
+        codec.dump(fp, 'Sections', {
+            'source': codec.Lazy(self.source),
+            'index': (codec.Lazy(numbers), offsets, positions),
+        }, compression, version=2)
 
     @staticmethod
     def load(fp):
-        return Sections(pickle.load(fp))
+        (x, version) = codec.load(fp, 'Sections')
+        if version is not None:
+            index = SectionIndex.from_state(x['index'], x['source'])
+            return _loaded(Sections(x['source'], index), version)
+        # Pickles hold the list of sections, and later its index too.
+        if isinstance(x, list):
+            return _loaded(Sections(_records(SectionRecord, x)), version)
+        return _loaded(Sections(_records(SectionRecord, x['source']),
+                                x['index']), version)
+
+    def for_course(self, number):
+        """
+        :return: A list of dicts in the form
+            {
+                'name': 'A2',
+                'crn': '87134',
+            }
+            for the sections of a course.
+        """
+        return list([
+            {
+                'name': self.source[i]['name'],
+                'crn': self.source[i]['crn'],
+            }
+            for i in self.index.course(number)
+        ])
+
+    def find_crn(self, number, name):
+        """
+        :return: The CRN of a course's section with a name, or None if
+            there is not exactly one.
+        """
+        crns = self.index.crns(number, name)
+        if len(crns) == 1:
+            return crns[0]
 
 
 class Section:
     def __init__(self, source):
         self.source = source
 
-    def dump(self, fp):
-        pickle.dump(self.source, fp)
+    def dump(self, fp, compression='none'):
+        codec.dump(fp, 'Section', self.source, compression)
 
     @staticmethod
     def load(fp):
-        return Section(pickle.load(fp))
+        (source, version) = codec.load(fp, 'Section')
+        return _loaded(Section(source), version)
+
+
+_snapshot_types = dict(
+    (t.__name__, t) for t in (Terms, Subjects, Courses, Sections, Section))
 
 
 def _safe_str(x):
@@ -331,14 +1037,166 @@ def _safe_str(x):
     )
 
 
+# For each kind of subject snapshot, the term-wide index which is kept
+# of them: its name in the Journal, its type, and the type of the
+# snapshots.
+_index_kinds = {
+    'sections': ('crns', CrnIndex, Sections),
+    'courses': ('search', SearchIndex, Courses),
+}
+
+
+class _TermIndexes:
+    """
+    Keeps each term's indexes of its subjects' sections (by CRN) and
+    courses (for search) as their snapshots are put in a Journal.
+
+    A put updates its term's index with that one subject. While updates
+    are deferred (as during a prefetch), the indexes a put would update
+    are only noted, and each is rebuilt once when the deferral ends. An
+    index which does not exist yet is built from every snapshot in the
+    cache, so that snapshots cached before the index are not left out.
+    Finding nothing to index is remembered until the next put, rather
+    than scanning the cache again on every lookup.
+    """
+
+    def __init__(self, journal):
+        self.__journal = journal
+        self.__lock = threading.Lock()
+        self.__deferrals = 0
+        self.__pending = set()
+        self.__empty = set()
+
+    def get(self, term_id, kind):
+        """
+        :param kind: 'sections' or 'courses'.
+        :return: The term's index, or None if there is nothing to
+            index.
+        """
+
+        (name, type_, _) = _index_kinds[kind]
+        index = self.__journal.child('terms', term_id, name).latest(type_)
+
+        if index is None \
+                and (_safe_str(term_id), kind) not in self.__empty:
+            index = self.rebuild(term_id, kind)
+
+        return index
+
+    def defer(self):
+        with self.__lock:
+            self.__deferrals += 1
+
+    def resume(self):
+        """
+        Ends a deferral, and rebuilds the indexes noted during it.
+        """
+
+        with self.__lock:
+            self.__deferrals -= 1
+            if self.__deferrals:
+                return
+            (pending, self.__pending) = (self.__pending, set())
+
+        for (term_id, kind) in sorted(pending):
+            self.rebuild(term_id, kind)
+
+    def rebuild(self, term_id, kind):
+        """
+        Builds the term's index from every subject snapshot in the
+        cache, and puts it.
+
+        :return: The index, or None if there is nothing to index.
+        """
+
+        with self.__index_lock(term_id, kind):
+            return self.__rebuild(term_id, kind)
+
+    def on_put(self, path, data):
+        """
+        The Journal listener.
+        """
+
+        if len(path) != 5 or path[0] != 'terms' or path[2] != 'subject' \
+                or path[4] not in _index_kinds:
+            return
+
+        (term_id, subject_id, kind) = (path[1], path[3], path[4])
+
+        with self.__lock:
+            self.__empty.discard((term_id, kind))
+            if self.__deferrals:
+                self.__pending.add((term_id, kind))
+                return
+
+        (name, type_, _) = _index_kinds[kind]
+        journal = self.__journal.child('terms', term_id, name)
+
+        with self.__index_lock(term_id, kind):
+            index = journal.latest(type_)
+            if index is None:
+                self.__rebuild(term_id, kind, {subject_id: data.source})
+            else:
+                journal.put(index.update(subject_id, data.source))
+
+    def __index_lock(self, term_id, kind):
+        # Other threads and processes may be updating the same index.
+        return self.__journal.get_context().get_cache().lock(
+            ['terms', term_id, _index_kinds[kind][0]])
+
+    def __rebuild(self, term_id, kind, sources=None):
+        """
+        :param sources: The snapshot sources to index, by subject id,
+            along with those of any other subject in the cache.
+        """
+
+        (name, type_, snapshot_type) = _index_kinds[kind]
+        term = self.__journal.child('terms', term_id)
+        sources = dict(sources or {})
+
+        subjects = term.child('subjects').latest(Subjects)
+        for subject in (subjects.list if subjects is not None else []):
+            subject_id = _safe_str(subject.get_id())
+            if subject_id in sources:
+                continue
+            snapshot = term.child('subject', subject_id, kind) \
+                .latest(snapshot_type)
+            if snapshot is not None:
+                sources[subject_id] = snapshot.source
+
+        if not sources:
+            with self.__lock:
+                self.__empty.add((_safe_str(term_id), kind))
+            return None
+
+        index = type_.build(sources)
+        term.child(name).put(index)
+        return index
+
+
+# Paths of the Journals being refreshed in the background, so that
+# there is at most one refresh for each.
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+# Futures for the refreshes in progress in get_async, so that tasks
+# which miss the cache at the same time wait for a single fetch.
+_async_flights = {}
+
+
 class Journal:
-    def __init__(self, context, force_refresh, path=None):
+    def __init__(self, context, force_refresh, path=None,
+                 stale_grace=None, ephemeral=True, listeners=None):
         self.__context = context
         self.__force_refresh = force_refresh
+        self.__stale_grace = stale_grace
+        self.__ephemeral = ephemeral
+        self.__listeners = listeners if listeners is not None else []
         self.__path = path or []
         self.__children = {}
         self.__known = False
         self.__data = None
+        self.__timestamp = None
 
     def child(self, *path):
         if len(path) == 0:
@@ -351,116 +1209,331 @@ class Journal:
                 context=self.__context,
                 force_refresh=self.__force_refresh,
                 path=self.__path + [head],
+                stale_grace=self.__stale_grace,
+                ephemeral=self.__ephemeral,
+                listeners=self.__listeners,
             )
         return self.__children[path[0]].child(*path[1:])
 
-    def dir(self):
-        d = os.path.join(
-            self.__context.get_config_dir(),
-            'cache',
-            os.path.join(*self.__path)
-        )
-        makedirs(d)
-        return d
+    def get_context(self):
+        return self.__context
 
-    def __filename(self):
-
-        def is_file(f):
-            full_filename = os.path.join(self.dir(), f)
-            return os.path.isfile(full_filename)
-
-        # List the files in this Journal's directory.
-        files = filter(is_file, os.listdir(self.dir()))
+    def add_listener(self, listener):
+        """
+        :param listener: A function which is called as listener(path,
+            data) whenever data is put in this Journal or any of its
+            descendants.
+        """
+        self.__listeners.append(listener)
 
-        # The most recent file has the highest lexicographical name.
-        if len(files) != 0:
-            return max(files)
+    def __cache(self):
+        return self.__context.get_cache()
 
-    def __know(self, data):
+    def __know(self, data, timestamp):
         self.__data = data
+        self.__timestamp = timestamp
         self.__known = True
 
-    def put(self, data):
+    def put(self, data, validator=None):
 
-        self.__know(data)
-        now = datetime.utcnow()
-        filename = os.path.join(self.dir(), now.strftime(_timestamp_format))
+        timestamp = datetime.utcnow().strftime(timestamp_format)
+        self.__know(data, timestamp)
 
-        self.__context.get_logger().info('Dump\n%s' % filename)
+        self.__context.get_logger().info(
+            'Dump\n%s' % self.__cache().describe(self.__path, timestamp))
 
-        fp = open(filename, 'w')
-        try:
-            data.dump(fp)
-        finally:
-            fp.close()
+        if validator is not None:
+            validator = validator.to_dict()
 
-    def get(self, type_, shelf_life, alternative):
+        self.__cache().put(self.__path, timestamp, self.__dumper(data),
+                           validator)
+        self.__cache().after_put(self.__context.get_retention())
 
-        # If data is cached in memory, always use that. Store objects
-        # are intended to be used ephemerally, so we do not anticipate
-        # any need to look up the same information more than once.
-        if self.__known:
+        for listener in self.__listeners:
+            try:
+                listener(list(self.__path), data)
+            except Exception:
+                self.__context.get_logger().exception(
+                    'Journal listener failed')
+
+    def latest(self, type_):
+        """
+        :return: The latest snapshot, however old, or None if there is
+            none. This never fetches anything.
+        """
+
+        timestamp = self.__cache().latest(self.__path)
+        if timestamp is not None:
+            return self.__load(type_, timestamp)
+
+    def get(self, type_, shelf_life, alternative, detach=None):
+        """
+        :param alternative: A function which fetches fresh data. It is
+            given a Validator describing the latest snapshot, and may
+            raise NotModified if the data has not changed, in which case
+            that snapshot is renewed instead of a new one being written.
+        :param detach: A function which starts refreshing this path in
+            another process, or None. If given, it is used to refresh a
+            stale snapshot, instead of a background thread.
+        """
+
+        # If data is cached in memory, use that. Ephemeral Store objects
+        # do not anticipate any need to look up the same information
+        # more than once; long-lived ones do so once it has expired.
+        if self.__known and (self.__ephemeral or
+                             self.__is_fresh(self.__timestamp, shelf_life)):
             return self.__data
 
-        # Memoize the alternative function; we might call it twice.
-        alternative = Memo(alternative)
+        # Look in the cache to find a sufficiently recent snapshot.
+        timestamp = self.__cache().latest(self.__path)
+
+        # A snapshot that has only just expired may be used while it
+        # is refreshed in the background.
+        if not self.__force_refresh \
+                and not self.__is_fresh(timestamp, shelf_life) \
+                and self.__stale_grace is not None \
+                and self.__is_fresh(timestamp,
+                                    shelf_life + self.__stale_grace):
+            data = self.__load(type_, timestamp)
+            self.__refresh_in_background(timestamp, shelf_life,
+                                         alternative, detach)
+            return data
 
-        # If refresh is forced, immediately attempt to use the alternate.
-        if self.__force_refresh:
-            a = alternative()
+        # If refresh is forced or a recent snapshot does not exist,
+        # attempt to use the alternate.
+        if self.__force_refresh \
+                or not self.__is_fresh(timestamp, shelf_life):
+            with self.__cache().lock(self.__path):
+                (a, timestamp) = self.__refresh(timestamp, shelf_life,
+                                                alternative)
             if a is not None:
-                self.put(a)
                 return a
 
-        # Look in the directory to find a sufficiently recent file.
-        filename = self.__filename()
+        return self.__load(type_, timestamp)
+
+    async def get_async(self, type_, shelf_life, alternative):
+        """
+        The same as get, except that alternative is a coroutine
+        function, and so this is a coroutine as well.
+        """
+
+        if self.__known and (self.__ephemeral or
+                             self.__is_fresh(self.__timestamp, shelf_life)):
+            return self.__data
 
-        def fresh_file_exists():
-            if filename is None:
-                return False
-            then = datetime.strptime(filename, _timestamp_format)
-            age = datetime.utcnow() - then
-            return age < shelf_life
+        timestamp = self.__cache().latest(self.__path)
 
-        # If a recent file does not exist, attempt to use the alternate.
-        if not fresh_file_exists():
-            a = alternative()
+        if self.__force_refresh \
+                or not self.__is_fresh(timestamp, shelf_life):
+            (a, timestamp) = await self.__refresh_async(
+                timestamp, shelf_life, alternative)
             if a is not None:
-                self.put(a)
                 return a
 
-        # If some file exists, use it.
-        if filename is not None:
-            full_filename = os.path.join(self.dir(), filename)
-            self.__context.get_logger().info('Load\n%s' % full_filename)
-            fp = open(full_filename, 'r')
+        return self.__load(type_, timestamp)
+
+    async def __refresh_async(self, timestamp, shelf_life, alternative):
+        """
+        The same as __refresh, for get_async. Only one task at a time
+        refreshes a path; the others wait for it and then use the
+        snapshot it wrote.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        key = (loop, self.__context.get_config_dir(), tuple(self.__path))
+
+        flight = _async_flights.get(key)
+        if flight is not None:
+            await asyncio.shield(flight)
+            return (None, self.__cache().latest(self.__path))
+
+        flight = loop.create_future()
+        _async_flights[key] = flight
+        try:
+            # Wait for other threads and processes without blocking
+            # the event loop.
+            lock = self.__cache().lock(self.__path)
+            acquiring = loop.run_in_executor(None, lock.acquire)
+            try:
+                await asyncio.shield(acquiring)
+            except asyncio.CancelledError:
+                # The executor thread may still take the lock, after
+                # this task has given up on it. Release it then.
+                def release(f):
+                    if not f.cancelled() and f.exception() is None:
+                        lock.release()
+                acquiring.add_done_callback(release)
+                raise
             try:
-                data = type_.load(fp)
+                latest = self.__coalesced(timestamp, shelf_life)
+                if latest is not None:
+                    return (None, latest)
+                validator = self.__validator(timestamp)
+                try:
+                    a = await alternative(validator)
+                except NotModified:
+                    return (None, self.__renew(timestamp))
+                if a is not None:
+                    self.put(a, validator)
+                return (a, timestamp)
             finally:
-                fp.close()
-            self.__know(data)
-            return data
+                lock.release()
+        finally:
+            del _async_flights[key]
+            flight.set_result(None)
 
-        # Alternate and file approaches have both failed.
-        self.__know(None)
+    def __refresh(self, timestamp, shelf_life, alternative):
+        """
+        Calls the alternative and stores what it returns, unless a fresh
+        snapshot has been written since the one at the timestamp. The
+        caller must hold the cache's lock for this path.
+
+        :return: A tuple (data, timestamp). data is the fresh data, or
+            None if it is unchanged, could not be fetched, or was
+            fetched by someone else, and timestamp is that of the latest
+            snapshot.
+        """
 
+        latest = self.__coalesced(timestamp, shelf_life)
+        if latest is not None:
+            return (None, latest)
 
-class Memo:
-    """
-    Memoizes a value function.
-    """
+        validator = self.__validator(timestamp)
+        try:
+            a = alternative(validator)
+        except NotModified:
+            return (None, self.__renew(timestamp))
+        if a is not None:
+            self.put(a, validator)
+        return (a, timestamp)
+
+    def __coalesced(self, timestamp, shelf_life):
+        """
+        Checks whether another thread or process wrote a fresh snapshot
+        while this one was waiting for the lock.
+
+        :return: The timestamp of that snapshot, or None.
+        """
 
-    def __init__(self, fn):
-        self.__fn = fn
-        self.__value = None
-        self.__executed = False
+        latest = self.__cache().latest(self.__path)
+        if latest != timestamp and self.__is_fresh(latest, shelf_life):
+            self.__context.get_logger().info(
+                'Coalesced\n%s' % self.__cache().describe(self.__path,
+                                                          latest))
+            return latest
+
+    def __refresh_in_background(self, timestamp, shelf_life, alternative,
+                                detach=None):
+
+        key = tuple(self.__path)
+        with _refreshing_lock:
+            if key in _refreshing:
+                return
+            _refreshing.add(key)
+
+        logger = self.__context.get_logger()
+        logger.info('Stale\n%s' % self.__cache().describe(self.__path,
+                                                          timestamp))
+
+        # A detached refresh is started at most once for each path by
+        # this process, which then forgets about it.
+        if detach is not None:
+            try:
+                detach()
+            except Exception:
+                logger.exception('Detached refresh failed to start')
+            return
 
-    def __call__(self):
-        if self.__executed:
-            return self.__value
+        def run():
+            try:
+                with self.__cache().lock(self.__path):
+                    self.__refresh(timestamp, shelf_life, alternative)
+            except Exception:
+                logger.exception('Background refresh failed')
+            finally:
+                with _refreshing_lock:
+                    _refreshing.discard(key)
+
+        # Not a daemon, so that the refresh is completed (and written
+        # to the cache) even if the caller exits first.
+        thread = threading.Thread(target=run, name='grouch-refresh')
+        thread.start()
+
+    def __validator(self, timestamp):
+        """
+        :return: A Validator for the snapshot at the timestamp, which is
+            empty if there is no such snapshot.
+        """
+        if timestamp is None:
+            return Validator()
+        return Validator(self.__cache().validator(self.__path, timestamp))
+
+    def __renew(self, timestamp):
+        """
+        Moves an unchanged snapshot to the current time, so that it is
+        fresh again without being rewritten.
+
+        :return: The snapshot's new timestamp.
+        """
+
+        renewed = datetime.utcnow().strftime(timestamp_format)
+
+        self.__context.get_logger().info(
+            'Unchanged\n%s' % self.__cache().describe(self.__path, renewed))
+
+        self.__cache().renew(self.__path, timestamp, renewed)
+        if self.__known and self.__timestamp == timestamp:
+            self.__timestamp = renewed
+        return renewed
+
+    def __is_fresh(self, timestamp, shelf_life):
+        if timestamp is None:
+            return False
+        then = parse_timestamp(timestamp)
+        age = datetime.utcnow() - then
+        return age < shelf_life
+
+    def __dumper(self, data):
+        compression = self.__context.get_compression()
+        return lambda fp: data.dump(fp, compression)
+
+    def __migrate(self, data, timestamp):
+        """
+        Writes a snapshot from before the codec again, with the codec,
+        keeping its timestamp and validator.
+        """
+
+        cache = self.__cache()
+        self.__context.get_logger().info(
+            'Migrate\n%s' % cache.describe(self.__path, timestamp))
+        cache.put(self.__path, timestamp, self.__dumper(data),
+                  cache.validator(self.__path, timestamp))
+        data.migrated = False
+
+    def __load(self, type_, timestamp):
+
+        # If the snapshot is already in memory, there is no need to
+        # read it again.
+        if self.__known and timestamp is not None \
+                and self.__timestamp == timestamp:
+            return self.__data
+
+        # If some snapshot exists, use it.
+        if timestamp is not None:
+            self.__context.get_logger().info(
+                'Load\n%s' % self.__cache().describe(self.__path, timestamp))
+            try:
+                data = self.__cache().load(self.__path, timestamp,
+                                           type_.load)
+            except MissingSnapshot:
+                # Pruned since it was found. Use whatever is latest now.
+                return self.__load(type_, self.__cache().latest(self.__path))
+            if getattr(data, 'migrated', False):
+                self.__migrate(data, timestamp)
+            self.__know(data, timestamp)
+            return data
+
+        # Alternate and file approaches have both failed.
+        self.__know(None, None)
 
-        value = self.__fn()
-        self.__fn = None
-        self.__value = value
-        self.__executed = True
-        return value
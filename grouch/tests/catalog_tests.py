@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+
+from grouch import Capacity, CourseRecord, SectionRecord, Subject
+from grouch.catalog import Catalog, write_catalog
+
+def create_catalog():
+  d = tempfile.mkdtemp()
+  try:
+    filename = os.path.join(d, 'catalogs', '201208.catalog')
+    write_catalog(
+      filename,
+      subjects = [
+        Subject(u'MATH', u'Mathematics'),
+        Subject(u'CS', u'Computer Science'),
+      ],
+      courses = {
+        u'CS': [
+          CourseRecord(u'2110', u'Data Structures', u'Lists and trees.'),
+          CourseRecord(u'1331', u'Intro to Java'),
+        ],
+      },
+      sections = {
+        u'CS': [
+          SectionRecord(u'87134', u'2110', u'A2'),
+          SectionRecord(u'87133', u'2110', u'A1'),
+          SectionRecord(u'TBA', u'2110', u'Z1'),
+        ],
+        u'MATH': [
+          SectionRecord(u'84541', u'3451', u'A'),
+        ],
+      },
+      capacities = { u'87134': Capacity(50, 49) },
+    )
+    return Catalog.open(filename)
+  finally:
+    shutil.rmtree(d)
+
+def test_subjects():
+  subjects = create_catalog().get_subjects()
+  assert [s.get_id() for s in subjects] == [u'CS', u'MATH']
+
+def test_courses():
+  catalog = create_catalog()
+  assert catalog.get_courses(u'CS') == [
+    CourseRecord(u'1331', u'Intro to Java'),
+    CourseRecord(u'2110', u'Data Structures', u'Lists and trees.'),
+  ]
+  assert catalog.get_courses(u'MATH') == []
+  assert catalog.get_courses(u'PHYS') is None
+
+def test_find_crn():
+  catalog = create_catalog()
+  found = catalog.find_crn(u'87134')
+  assert found['course'].get_subject() == u'CS'
+  assert found['course'].get_number() == u'2110'
+  assert found['name'] == u'A2'
+  assert found['capacity'].get_current() == 49
+  assert catalog.find_crn(u'84541')['capacity'] is None
+  assert catalog.find_crn(u'11111') is None
+  assert catalog.find_crn(u'TBA') is None
+
+def test_find_section():
+  catalog = create_catalog()
+  assert catalog.find_section(u'CS', u'2110', u'a1') == u'87133'
+  assert catalog.find_section(u'MATH', u'3451', u'A') == u'84541'
+  assert catalog.find_section(u'CS', u'2110', u'B') is None
+
+def test_missing_file():
+  assert Catalog.open('/nonexistent/201208.catalog') is None
@@ -0,0 +1,95 @@
+from array import array
+from io import BytesIO
+import pickle
+
+from grouch import Course, CourseRecord, SectionRecord, Subject
+from grouch import codec
+from grouch.store import Courses, Sections, Subjects
+
+def create_sections():
+  return Sections([
+    SectionRecord(u'87133', u'2110', u'A1'),
+    SectionRecord(u'87134', u'2110', u'A2'),
+    SectionRecord(u'84541', u'3451', u'A'),
+  ])
+
+def round_trip(data, type_, compression='none'):
+  fp = BytesIO()
+  data.dump(fp, compression)
+  fp.seek(0)
+  return type_.load(fp)
+
+def test_sections():
+  for compression in ('none', 'zlib', 'lzma'):
+    s = round_trip(create_sections(), Sections, compression)
+    assert not s.migrated
+    assert list(s.source) == list(create_sections().source)
+    assert [x['crn'] for x in s.for_course(u'2110')] == [u'87133', u'87134']
+    assert s.find_crn(u'2110', u'a2') == u'87134'
+
+def test_sections_version_1():
+  # The index was a dict of each course's positions.
+  fp = BytesIO()
+  sections = create_sections()
+  codec.dump(fp, 'Sections', {
+    'source': codec.Lazy(sections.source),
+    'index': { u'2110': array('I', [0, 1]), u'3451': array('I', [2]) },
+  })
+  fp.seek(0)
+  s = Sections.load(fp)
+  assert [x['crn'] for x in s.for_course(u'2110')] == [u'87133', u'87134']
+
+def create_subjects():
+  return Subjects([
+    Subject(id=u'CS', name=u'Computer Science'),
+    Subject(id=u'MATH', name=u'Mathematics'),
+  ])
+
+def test_subjects():
+  s = round_trip(create_subjects(), Subjects)
+  assert s.find(u'comp sci').get_id() == u'CS'
+  assert s.find(u'math').get_id() == u'MATH'
+  assert s.find(u'Mathematcs').get_id() == u'MATH'
+
+def test_subjects_version_1():
+  # Only the list of subjects was stored.
+  fp = BytesIO()
+  codec.dump(fp, 'Subjects', create_subjects().source)
+  fp.seek(0)
+  assert Subjects.load(fp).find(u'comp sci').get_id() == u'CS'
+
+def test_courses():
+  c = round_trip(Courses([
+    CourseRecord(u'2110', u'Object-Oriented Programming', None),
+    CourseRecord(u'4641', u'Machine Learning', u'Theory and practice'),
+  ]), Courses)
+  assert c.source[1]['description'] == u'Theory and practice'
+  assert c.source[0]['description'] is None
+  assert c.source[-1]['number'] == u'4641'
+  assert list(c.source) == [
+    CourseRecord(u'2110', u'Object-Oriented Programming', None),
+    CourseRecord(u'4641', u'Machine Learning', u'Theory and practice'),
+  ]
+
+def test_lazy_strings():
+  fp = BytesIO()
+  codec.dump(fp, 'Test', (codec.Lazy([u'b\xe9ta', u'a', u'b\xe9ta']), u'a'))
+  fp.seek(0)
+  (strings, version) = codec.load(fp, 'Test')
+  assert strings[0][2] == u'b\xe9ta'
+  assert list(strings[0]) == [u'b\xe9ta', u'a', u'b\xe9ta']
+  assert strings[1] == u'a'
+
+def test_legacy_pickle():
+  fp = BytesIO(pickle.dumps([{
+    'number': u'2110',
+    'name': u'Object-Oriented Programming',
+    'description': None,
+  }]))
+  c = Courses.load(fp)
+  assert c.migrated
+  assert c.source[0]['number'] == u'2110'
+
+def test_sections_dump_loaded():
+  s = round_trip(round_trip(create_sections(), Sections), Sections)
+  assert [x['crn'] for x in s.for_course(u'2110')] == [u'87133', u'87134']
@@ -0,0 +1,51 @@
+from io import BytesIO
+
+from grouch.index import CrnIndex
+
+def create_index():
+  return CrnIndex().update('CS', [
+    { 'crn': '87134', 'course': '2110', 'name': 'A2' },
+    { 'crn': '87133', 'course': '2110', 'name': 'A1' },
+    { 'crn': 'TBA', 'course': '2110', 'name': 'A9' },
+  ]).update('MATH', [
+    { 'crn': '84541', 'course': '3451', 'name': 'A' },
+  ])
+
+def test_find():
+  index = create_index()
+  assert index.find('87133') == ('CS', '2110', 'A1')
+  assert index.find('84541') == ('MATH', '3451', 'A')
+  assert index.find('11111') is None
+  assert index.find('TBA') is None
+
+def test_subjects():
+  assert create_index().get_subjects() == ['CS', 'MATH']
+
+def test_update_replaces_subject():
+  index = create_index().update('CS', [
+    { 'crn': '87135', 'course': '2110', 'name': 'A3' },
+  ])
+  assert index.find('87133') is None
+  assert index.find('87135') == ('CS', '2110', 'A3')
+  assert index.find('84541') == ('MATH', '3451', 'A')
+
+def test_dump_load():
+  fp = BytesIO()
+  create_index().dump(fp)
+  fp.seek(0)
+  index = CrnIndex.load(fp)
+  assert not index.migrated
+  assert index.find('87134') == ('CS', '2110', 'A2')
+  assert index.get_subjects() == ['CS', 'MATH']
+  index = index.update('MATH', [])
+  assert index.find('87133') == ('CS', '2110', 'A1')
+  assert index.find('84541') is None
+
+def test_build():
+  index = CrnIndex.build({
+    'MATH': [{ 'crn': '84541', 'course': '3451', 'name': 'A' }],
+    'CS': [{ 'crn': '87133', 'course': '2110', 'name': 'A1' }],
+  })
+  assert index.get_subjects() == ['CS', 'MATH']
+  assert index.find('84541') == ('MATH', '3451', 'A')
+  assert index.find('87133') == ('CS', '2110', 'A1')
@@ -0,0 +1,55 @@
+import pickle
+
+from grouch import Capacity, Course, SectionRecord
+
+def create_record():
+  return SectionRecord(u'87134', u'2110', u'A2')
+
+def test_items():
+  r = create_record()
+  assert r['crn'] == u'87134'
+  assert r['course'] == u'2110'
+  assert r.get('name') == u'A2'
+  assert r.get('capacity') is None
+
+def test_methods_are_not_items():
+  r = create_record()
+  for key in ('index', 'count', 'keys', 'get', '_fields'):
+    assert r.get(key) is None
+    try:
+      r[key]
+    except KeyError:
+      pass
+    else:
+      assert False, key
+
+def test_equals_dict():
+  assert create_record() == {
+    'crn': u'87134',
+    'course': u'2110',
+    'name': u'A2',
+  }
+
+def test_no_dict():
+  assert not hasattr(create_record(), '__dict__')
+  assert not hasattr(Course('CS', '2110'), '__dict__')
+
+def test_interned():
+  a = SectionRecord('87133', ''.join(['21', '10']), ''.join(['A', '1']))
+  b = SectionRecord('87134', ''.join(['21', '10']), ''.join(['A', '1']))
+  assert a['course'] is b['course']
+  assert a['name'] is b['name']
+
+def test_pickle():
+  r = create_record()
+  assert pickle.loads(pickle.dumps(r)) == r
+  c = pickle.loads(pickle.dumps(Course('CS', '2110')))
+  assert c.get_subject() == 'CS'
+  assert c.get_number() == '2110'
+
+def test_models_equal_by_value():
+  assert Course('CS', '2110') == Course('CS', '2110')
+  assert Course('CS', '2110') != Course('CS', '1331')
+  assert Capacity(50, 49) == Capacity(50, 49)
+  assert Capacity(50, 49) != Capacity(50, 50)
+  assert len(set([Course('CS', '2110'), Course('CS', '2110')])) == 1
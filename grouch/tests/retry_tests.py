@@ -0,0 +1,44 @@
+from urllib.error import HTTPError
+
+from nose.tools import *
+
+from grouch.connections import retry_delay
+from grouch.transport import RateLimiter, RetryPolicy
+
+def http_error(code):
+  return HTTPError('http://example.com/', code, 'error', {}, None)
+
+def test_retries_server_errors():
+  policy = RetryPolicy(retries=2, base_delay=1, max_delay=8)
+  delay = retry_delay(policy, http_error(503), 1)
+  assert 0 <= delay <= 1
+  delay = retry_delay(policy, http_error(503), 2)
+  assert 0 <= delay <= 2
+
+def test_gives_up_after_retries():
+  policy = RetryPolicy(retries=2)
+  assert_equal(retry_delay(policy, http_error(503), 3), None)
+
+def test_does_not_retry_client_errors():
+  policy = RetryPolicy()
+  assert_equal(retry_delay(policy, http_error(404), 1), None)
+  assert_equal(retry_delay(policy, http_error(304), 1), None)
+
+def test_retries_network_errors():
+  policy = RetryPolicy()
+  assert retry_delay(policy, OSError('connection reset'), 1) is not None
+
+def test_does_not_retry_other_errors():
+  policy = RetryPolicy()
+  assert_equal(retry_delay(policy, ValueError(), 1), None)
+
+def test_limiter_allows_burst():
+  limiter = RateLimiter(rate=1, burst=3)
+  waits = [limiter.reserve('a') for i in range(4)]
+  assert_equal(waits[:3], [0, 0, 0])
+  assert waits[3] > 0.9
+
+def test_limiter_is_per_host():
+  limiter = RateLimiter(rate=1, burst=1)
+  assert_equal(limiter.reserve('a'), 0)
+  assert_equal(limiter.reserve('b'), 0)
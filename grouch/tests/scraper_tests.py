@@ -83,12 +83,42 @@ def test_get_courses_xml():
   courses = scraper.scrape_courses_xml(xml)
   assert_list_equal(courses, courses_expected())
 
+def test_get_courses_xml_chunked():
+  scraper = create_scraper()
+  xml = read('bwckctlg.p_display_courses.xml')
+  chunks = [xml[i:i+7] for i in range(0, len(xml), 7)]
+  courses = list(scraper.iter_courses_xml(chunks))
+  assert_list_equal(courses, courses_expected())
+
 def test_get_courses_html():
   scraper = create_scraper()
   html = read('bwckctlg.p_display_courses.html')
   courses = scraper.scrape_courses_html(html)
   assert_list_equal(courses, courses_expected())
 
+def test_get_courses_html_wrapped_title():
+  scraper = create_scraper()
+  html = read('bwckctlg.p_display_courses.html').replace(
+    '<TD CLASS="nttitle" scope="colgroup" ><A',
+    '<TD CLASS="nttitle" scope="colgroup" >\n<A', 1)
+  courses = scraper.scrape_courses_html(html)
+  assert_list_equal(courses, courses_expected())
+
+def test_get_courses_html_entities():
+  scraper = create_scraper()
+  html = (
+    '<TR>\n<TD CLASS="nttitle" scope="colgroup" ><A HREF="/x">'
+    'CS 1332 - Data Structures</A></TD>\n</TR>\n'
+    '<TR>\n<TD CLASS="ntdefault">\n'
+    'Lists &amp; trees &lt;intro&gt;.\n<BR>\n</TD>\n</TR>\n'
+  )
+  courses = scraper.scrape_courses_html(html)
+  assert_list_equal(courses, [{
+    'number': u'1332',
+    'name': u'Data Structures',
+    'description': u'Lists & trees <intro>.',
+  }])
+
 # sections
 
 def sections_expected():
@@ -115,6 +145,13 @@ def test_get_sections():
   sections = scraper.scrape_sections_html(html)
   assert_list_equal(sections, sections_expected())
 
+def test_get_sections_chunked():
+  scraper = create_scraper()
+  html = read('bwckschd.p_get_crse_unsec.html')
+  chunks = [html[i:i+7] for i in range(0, len(html), 7)]
+  sections = list(scraper.iter_sections_html(chunks))
+  assert_list_equal(sections, sections_expected())
+
 # section
 
 def section_expected():
@@ -130,3 +167,16 @@ def test_section():
   html = read('bwckschd.p_disp_detail_sched.html')
   section = scraper.scrape_section_html(html)
   assert_dict_equal(section, section_expected())
+
+def test_section_without_capacity():
+  scraper = create_scraper()
+  html = read('bwckschd.p_disp_detail_sched.html')
+  html = html[:html.index('Registration Availability')]
+  section = scraper.scrape_section_html(html)
+  expected = section_expected()
+  del expected['capacity']
+  assert_dict_equal(section, expected)
+
+def test_section_not_found():
+  scraper = create_scraper()
+  assert_equal(scraper.scrape_section_html('<html></html>'), None)
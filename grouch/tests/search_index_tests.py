@@ -0,0 +1,72 @@
+from io import BytesIO
+
+from grouch import codec
+from grouch.index import SearchIndex
+
+def create_index():
+  return SearchIndex().update('CS', [
+    { 'number': '4780', 'name': 'Machine Learning',
+      'description': 'Learning from data.' },
+    { 'number': '2110', 'name': 'Data Structures',
+      'description': 'Object-oriented programming and data structures.' },
+  ]).update('ISYE', [
+    { 'number': '6740', 'name': 'Computational Data Analysis',
+      'description': 'Statistical machine learning methods.' },
+  ])
+
+def numbers(results):
+  return [r[1] for r in results]
+
+def test_search():
+  results = create_index().search('machine learning')
+  assert numbers(results) == ['4780', '6740']
+
+def test_name_outranks_description():
+  results = create_index().search('data')
+  assert numbers(results)[0] in ('2110', '6740')
+  assert numbers(results)[-1] == '4780'
+
+def test_limit():
+  assert len(create_index().search('data', limit=1)) == 1
+
+def test_stop_words():
+  assert create_index().search('the of and') == []
+
+def test_update_replaces_subject():
+  index = create_index().update('CS', [
+    { 'number': '1331', 'name': 'Intro to Java', 'description': None },
+  ])
+  assert numbers(index.search('machine learning')) == ['6740']
+  assert numbers(index.search('java')) == ['1331']
+
+def test_dump_load():
+  fp = BytesIO()
+  create_index().dump(fp)
+  fp.seek(0)
+  index = SearchIndex.load(fp)
+  assert not index.migrated
+  assert numbers(index.search('learning')) == ['4780', '6740']
+  assert index.get_subjects() == ['CS', 'ISYE']
+  index = index.update('ISYE', [])
+  assert numbers(index.search('learning')) == ['4780']
+
+def test_load_version_1():
+  fp = BytesIO()
+  codec.dump(fp, 'SearchIndex', (
+    [('CS', '4780', 'Machine Learning')],
+    { 'machine': [(0, 3)], 'learning': [(0, 4)] },
+  ))
+  fp.seek(0)
+  index = SearchIndex.load(fp)
+  assert index.migrated
+  assert numbers(index.search('learning')) == ['4780']
+
+def test_build():
+  index = SearchIndex.build({
+    'ISYE': [{ 'number': '6740', 'name': 'Computational Data Analysis',
+               'description': 'Statistical machine learning methods.' }],
+    'CS': [{ 'number': '4780', 'name': 'Machine Learning',
+             'description': 'Learning from data.' }],
+  })
+  assert index.get_subjects() == ['CS', 'ISYE']
+  assert numbers(index.search('machine learning')) == ['4780', '6740']
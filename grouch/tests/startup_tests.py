@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+def modules_imported_by_grouch():
+  # In a new interpreter, since these tests have imported everything.
+  code = 'import sys, grouch; print(" ".join(sorted(sys.modules)))'
+  env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+  out = subprocess.check_output([sys.executable, '-c', code], env=env)
+  return set(out.decode('utf-8').split())
+
+def test_lazy_imports():
+  modules = modules_imported_by_grouch()
+  for name in ['asyncio', 'bs4', 'http.client', 'scraper', 'sqlite3',
+               'urllib.request']:
+    assert name not in modules, name
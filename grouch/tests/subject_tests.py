@@ -9,3 +9,33 @@ def test():
   assert s.get_name() == 'Computer Science'
   assert str(s) == 'CS Computer Science'
   assert repr(s) == '<Subject id="CS" name="Computer Science">'
+
+def create_index():
+  from grouch.index import SubjectIndex
+  subjects = [
+    Subject('ACCT', 'Accounting'),
+    Subject('CS', 'Computer Science'),
+    Subject('CM', 'Computational Media'),
+    Subject('PHYS', 'Physics'),
+  ]
+  return (SubjectIndex(subjects), subjects)
+
+def test_index_id():
+  (index, subjects) = create_index()
+  assert subjects[index.find('cs')].get_id() == 'CS'
+
+def test_index_name():
+  (index, subjects) = create_index()
+  assert subjects[index.find('physics')].get_id() == 'PHYS'
+
+def test_index_abbreviation():
+  (index, subjects) = create_index()
+  assert subjects[index.find('comp sci')].get_id() == 'CS'
+
+def test_index_misspelling():
+  (index, subjects) = create_index()
+  assert subjects[index.find('acounting')].get_id() == 'ACCT'
+
+def test_index_no_match():
+  (index, subjects) = create_index()
+  assert index.find('xyz') is None
@@ -0,0 +1,41 @@
+from nose.tools import *
+
+from grouch.transport import NotModified, Validator
+
+class Response:
+  def __init__(self, headers):
+    self.headers = headers
+  def getheader(self, name, default=None):
+    return self.headers.get(name, default)
+
+def test_records_headers_and_digest():
+  v = Validator()
+  v.check(Response({'ETag': '"abc"'}), body=b'hello')
+  assert_equal(v.etag, '"abc"')
+  assert_equal(v.last_modified, None)
+  assert v.digest
+
+def test_same_body_is_not_modified():
+  v = Validator()
+  v.check(Response({}), body=b'hello')
+  v = Validator(v.to_dict())
+  assert_raises(NotModified, v.check, Response({}), b'hello')
+
+def test_changed_body_is_modified():
+  v = Validator()
+  v.check(Response({}), body=b'hello')
+  digest = v.digest
+  v.check(Response({}), body=b'goodbye')
+  assert_not_equal(v.digest, digest)
+
+def test_empty_validator_adds_no_headers():
+  class Request:
+    def __init__(self):
+      self.headers = {}
+    def add_header(self, name, value):
+      self.headers[name] = value
+  r = Request()
+  Validator().prepare(r)
+  assert_equal(r.headers, {})
+  Validator({'etag': '"abc"'}).prepare(r)
+  assert_equal(r.headers, {'If-None-Match': '"abc"'})
@@ -0,0 +1,90 @@
+from datetime import timedelta
+
+from nose.tools import *
+
+from grouch import Capacity
+from grouch.watch import Watcher, events
+
+class FakeStore:
+  def __init__(self, capacities):
+    self.capacities = capacities
+    self.polls = []
+  def get_section(self, crn, term=None, shelf_life=None):
+    self.polls.append(crn)
+    capacity = self.capacities[crn]
+    return {} if capacity is None else {'capacity': capacity}
+
+class FakeClock:
+  def __init__(self):
+    self.now = 0.0
+  def __call__(self):
+    return self.now
+  def sleep(self, seconds):
+    self.now += seconds
+
+def create_watcher(store, emitted, clock):
+  return Watcher(
+    store = store,
+    crns = sorted(store.capacities),
+    emit = emitted.append,
+    min_interval = timedelta(seconds=10),
+    max_interval = timedelta(seconds=80),
+    hot_interval = timedelta(seconds=20),
+    rate = 1.0,
+    clock = clock,
+    sleep = clock.sleep,
+  )
+
+def test_no_event_without_change():
+  assert_equal(list(events('1', Capacity(20, 9), Capacity(20, 9))), [])
+
+def test_seats_event():
+  (e,) = events('1', Capacity(20, 9), Capacity(20, 10))
+  assert_equal(e['event'], 'seats')
+  assert_equal(e['delta'], 1)
+
+def test_opened_and_closed_events():
+  (e,) = events('1', Capacity(20, 20), Capacity(20, 19))
+  assert_equal(e['event'], 'opened')
+  (e,) = events('1', Capacity(20, 19), Capacity(20, 20))
+  assert_equal(e['event'], 'closed')
+
+def test_stable_section_backs_off():
+  store = FakeStore({'1': Capacity(50, 10)})
+  clock = FakeClock()
+  watcher = create_watcher(store, [], clock)
+  watcher.run(polls=5)
+  assert_equal(watcher.get_interval('1'), 80)
+
+def test_nearly_full_section_stays_hot():
+  store = FakeStore({'1': Capacity(50, 49)})
+  clock = FakeClock()
+  watcher = create_watcher(store, [], clock)
+  watcher.run(polls=5)
+  assert_equal(watcher.get_interval('1'), 20)
+
+def test_section_without_capacity_backs_off():
+  store = FakeStore({'1': None})
+  clock = FakeClock()
+  watcher = create_watcher(store, [], clock)
+  watcher.run(polls=5)
+  assert_equal(watcher.get_interval('1'), 80)
+
+def test_change_resets_interval_and_is_emitted():
+  store = FakeStore({'1': Capacity(50, 10)})
+  clock = FakeClock()
+  emitted = []
+  watcher = create_watcher(store, emitted, clock)
+  watcher.run(polls=3)
+  store.capacities['1'] = Capacity(50, 11)
+  watcher.run(polls=1)
+  assert_equal(watcher.get_interval('1'), 10)
+  assert_equal([e['current'] for e in emitted], [11])
+
+def test_rate_ceiling():
+  store = FakeStore(dict((str(i), Capacity(50, 10)) for i in range(5)))
+  clock = FakeClock()
+  watcher = create_watcher(store, [], clock)
+  watcher.run(polls=5)
+  assert_equal(len(store.polls), 5)
+  assert clock.now >= 4.0
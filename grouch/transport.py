@@ -0,0 +1,206 @@
+import random
+import threading
+import time
+
+# The connection pools, and the errors they raise, are in connections,
+# which imports asyncio, http.client and urllib; this module is kept
+# free of them, since every command imports it. hashlib is imported by
+# new_digest for the same reason.
+
+
+class NotModified(Exception):
+    """
+    Raised when a response shows that a resource is unchanged since
+    the response that a Validator was made from.
+    """
+
+
+class Validator:
+    """
+    Identifies a version of a resource, so that a later fetch of it
+    can tell whether it has changed. The ETag and Last-Modified headers
+    are recorded when the server provides them, and a digest of the
+    body always.
+
+    A Validator is passed into a fetch holding what is known about the
+    cached version (if anything), and is updated to describe the
+    version that was fetched.
+    """
+
+    def __init__(self, source=None):
+        source = source or {}
+        self.etag = source.get('etag')
+        self.last_modified = source.get('last_modified')
+        self.digest = source.get('digest')
+
+    def to_dict(self):
+        return {
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'digest': self.digest,
+        }
+
+    def prepare(self, request):
+        """
+        Makes a request conditional on the resource having changed.
+        """
+        if self.etag is not None:
+            request.add_header('If-None-Match', self.etag)
+        if self.last_modified is not None:
+            request.add_header('If-Modified-Since', self.last_modified)
+
+    def check(self, response, body=None, digest=None):
+        """
+        Raises NotModified if the response is the same as the version
+        this Validator describes. Otherwise, updates it to describe
+        the response.
+
+        :param digest: The digest of the body, from new_digest, if the
+            body itself is not given.
+        """
+
+        if digest is None:
+            digest = digest_of(body)
+
+        if self.digest is not None and digest == self.digest:
+            raise NotModified()
+
+        self.etag = response.getheader('ETag')
+        self.last_modified = response.getheader('Last-Modified')
+        self.digest = digest
+
+
+def new_digest():
+    import hashlib
+    return hashlib.sha1()
+
+
+def digest_of(body):
+    h = new_digest()
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    h.update(body or b'')
+    return h.hexdigest()
+
+
+class TokenBucket:
+    """
+    Allows rate events per second on average, and up to burst at once.
+    """
+
+    def __init__(self, rate, burst):
+        self.__rate = float(rate)
+        self.__burst = float(burst)
+        self.__tokens = float(burst)
+        self.__updated = time.time()
+        self.__lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token, going into debt if there is none.
+
+        :return: The number of seconds to wait before the token may be
+            used.
+        """
+
+        with self.__lock:
+            now = time.time()
+            self.__tokens = min(
+                self.__burst,
+                self.__tokens + (now - self.__updated) * self.__rate)
+            self.__updated = now
+            self.__tokens -= 1
+            if self.__tokens >= 0:
+                return 0.0
+            return -self.__tokens / self.__rate
+
+
+class RateLimiter:
+    """
+    Limits the rate of requests to each host, and optionally the rate
+    of all requests together.
+
+    :param rate: Requests per second to any one host.
+    :param burst: The number of requests to a host that may be made at
+        once after a quiet period.
+    :param total_rate: Requests per second to all hosts, or None.
+    """
+
+    def __init__(self, rate=4.0, burst=8, total_rate=None):
+        self.__rate = rate
+        self.__burst = burst
+        self.__buckets = {}
+        self.__lock = threading.Lock()
+        self.__total = None
+        if total_rate is not None:
+            self.__total = TokenBucket(total_rate, max(1, total_rate))
+
+    def reserve(self, host):
+        """
+        :return: The number of seconds to wait before a request to the
+            host may be made.
+        """
+
+        with self.__lock:
+            if host not in self.__buckets:
+                self.__buckets[host] = TokenBucket(self.__rate,
+                                                   self.__burst)
+            bucket = self.__buckets[host]
+
+        wait = bucket.reserve()
+        if self.__total is not None:
+            wait = max(wait, self.__total.reserve())
+        return wait
+
+    def acquire(self, host):
+        """
+        Blocks until a request to the host may be made.
+
+        :return: The number of seconds waited.
+        """
+
+        wait = self.reserve(host)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+_shared_limiter = RateLimiter()
+
+
+def shared_limiter():
+    """
+    :return: The RateLimiter used by default by every Scraper in this
+        process.
+    """
+    return _shared_limiter
+
+
+class RetryPolicy:
+    """
+    How many times, and after what delays, to retry a failed request
+    (where connections.retry_delay judges it worth retrying). The delay
+    before the n-th retry is chosen uniformly at random between zero
+    and base_delay * 2 ** (n - 1), capped at max_delay, so that
+    clients which failed together do not retry together.
+
+    :param retries: The number of times to retry a request.
+    :param statuses: HTTP statuses worth retrying. Other HTTP errors
+        are not retried; network errors and timeouts always are.
+    """
+
+    def __init__(self, retries=2, base_delay=0.5, max_delay=8.0,
+                 statuses=(429, 500, 502, 503, 504)):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.statuses = statuses
+
+    def backoff(self, retry):
+        """
+        :param retry: The number of this retry, starting at 1.
+        :return: A number of seconds to wait before the retry, chosen
+            as described above.
+        """
+        cap = min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+        return random.uniform(0, cap)
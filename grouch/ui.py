@@ -1,12 +1,16 @@
 import argparse
+from datetime import timedelta
 import logging
 import sys
 from textwrap import TextWrapper
 
+from cache import RetentionPolicy
 from context import Context
 from model import Course, Term
-from scraper import Scraper
+from remote import RemoteStore
 from store import Store
+from transport import RateLimiter, RetryPolicy
+from watch import Watcher, json_lines
 
 
 def err(x):
@@ -41,8 +45,17 @@ def course_type(value):
 commands = {}
 
 
-def command():
+def command(remote=False, long_lived=False):
+    """
+    :param remote: Whether the command only looks things up, and so
+        can be answered by a running server.
+    :param long_lived: Whether the command runs until it is stopped,
+        and so needs a Store whose memory expires.
+    """
+
     def g(f):
+        f.remote = remote
+        f.long_lived = long_lived
         commands[f.__name__] = f
         return f
 
@@ -63,7 +76,7 @@ def log_handler():
     return handler
 
 
-@command()
+@command(remote=True)
 def terms(args, store):
     terms = store.get_terms()
     if terms is None:
@@ -73,7 +86,7 @@ def terms(args, store):
             print(str(term))
 
 
-@command()
+@command(remote=True)
 def subjects(args, store):
     subjects = store.get_subjects(term=args.term)
     if subjects is None:
@@ -83,7 +96,7 @@ def subjects(args, store):
             print('\t'.join((s.get_id(), s.get_name())))
 
 
-@command()
+@command(remote=True)
 def courses(args, store):
     if args.subject is None:
         err('--subject is required')
@@ -115,7 +128,7 @@ def courses(args, store):
                     print('')
 
 
-@command()
+@command(remote=True)
 def sections(args, store):
     course = get_course(args)
     if course is not None:
@@ -161,9 +174,14 @@ def sections_by_subject(args, store):
             print('')
 
 
-@command()
+@command(remote=True)
 def section(args, store):
+    if args.crn is not None and len(args.crn) != 1:
+        sections_by_crn(args, store, known_crns(args, store, args.crn))
+        return
     crn = get_crn(args, store)
+    if args.crn and not known_crns(args, store, [crn]):
+        return
     section = store.get_section(crn)
     print('%s - %s\n\nSection %s: %s' % (
         section['course'],
@@ -173,16 +191,189 @@ def section(args, store):
     ))
 
 
+def sections_by_crn(args, store, crns):
+    """
+    Prints one line for each CRN, as soon as its section is available.
+    """
+
+    results = store.get_sections_capacity(
+        crns=crns,
+        term=args.term,
+        workers=args.workers,
+    )
+
+    for (crn, section) in results:
+        if section is None:
+            err('%s: Information not available.' % crn)
+        else:
+            print('%s\t%s - %s\tSection %s: %s' % (
+                crn,
+                section['course'],
+                section['name'],
+                section['section'],
+                section.get('capacity'),
+            ))
+        sys.stdout.flush()
+
+
 @command()
+def prefetch(args, store):
+
+    def progress(done, total, subject, kind):
+        err('[%d/%d] %s %s' % (done, total, subject.get_id(), kind))
+
+    failures = store.prefetch(
+        term=args.term,
+        workers=args.workers,
+        progress=progress if args.chatty else None,
+    )
+
+    if failures is None:
+        not_available()
+    elif failures != 0:
+        err('%d fetches failed' % failures)
+
+
+@command()
+def catalog(args, store):
+
+    def progress(done, total, subject, kind):
+        err('[%d/%d] %s %s' % (done, total, subject.get_id(), kind))
+
+    count = store.build_catalog(
+        term=args.term,
+        workers=args.workers,
+        progress=progress if args.chatty else None,
+    )
+
+    if count is None:
+        not_available()
+    elif args.chatty:
+        print('%d sections' % count)
+
+
+@command()
+def cache(args, store):
+    if args.arguments == ['prune']:
+        (count, size) = store.prune_cache()
+        if args.chatty:
+            print('Removed %d snapshots (%.1f KB)' % (count, size / 1024.0))
+    else:
+        err('usage: grouch cache prune')
+
+
+@command(remote=True)
 def crn(args, store):
+    if args.crn:
+        crn_lookup(args, store, args.crn)
+        return
     crn = get_crn(args, store)
     if crn:
         print(crn)
 
 
+def crn_lookup(args, store, crns):
+    """
+    Prints the course and section name of each CRN, from the index of
+    the sections that have been cached.
+    """
+
+    for crn in crns:
+        found = store.find_crn(crn, term=args.term)
+        if found is None:
+            err('%s: Not found.' % crn)
+        else:
+            print('%s\t%s %s' % (crn, found['course'], found['name']))
+
+
+def known_crns(args, store, crns):
+    """
+    :return: The CRNs, less those which are certainly not in the term,
+        which are reported as errors.
+    """
+
+    found = store.are_crns(crns, term=args.term)
+
+    known = []
+    for crn in crns:
+        if found[crn] is False:
+            err('%s: No such CRN.' % crn)
+        else:
+            known.append(crn)
+    return known
+
+
+@command(remote=True)
+def search(args, store):
+    if not args.arguments:
+        err('usage: grouch search WORDS')
+        return
+    results = store.search(' '.join(args.arguments), term=args.term)
+    if results is None:
+        not_available()
+    else:
+        for result in results:
+            print('%s\t%s' % (result['course'], result['name']))
+
+
+@command(long_lived=True)
+def serve(args, store):
+    # http.server is slow to import, and only this command needs it.
+    from server import Server
+
+    server = Server(store, port=args.port)
+    if args.chatty:
+        print('Serving on %s' % server.get_address())
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+
+
+def read_crns(values):
+    """
+    :param values: The values given with --crn, or None.
+    :return: The CRNs, where "-" stands for those read from standard
+        input.
+    """
+
+    if values is None:
+        return None
+
+    crns = []
+    for crn in values:
+        if crn == '-':
+            crns.extend(sys.stdin.read().split())
+        else:
+            crns.append(crn)
+    return crns
+
+
+@command(long_lived=True)
+def watch(args, store):
+    if not args.crn:
+        err('--crn is required')
+        return
+
+    watcher = Watcher(
+        store=store,
+        crns=args.crn,
+        emit=json_lines(sys.stdout),
+        term=args.term,
+        min_interval=timedelta(seconds=args.interval),
+        max_interval=timedelta(seconds=max(args.interval,
+                                           args.max_interval)),
+        rate=args.rate,
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+
+
 def get_crn(args, store):
     if args.crn:
-        return args.crn
+        return args.crn[0]
 
     course = get_course(args)
 
@@ -220,6 +411,13 @@ def main():
         nargs='?',
     )
 
+    parser.add_argument(
+        'arguments',
+        help='Arguments to the command, such as "prune" for '
+             '"grouch cache prune", or the words to search for',
+        nargs='*',
+    )
+
     parser.add_argument(
         '--term',
         type=term_type,
@@ -256,7 +454,10 @@ def main():
 
     parser.add_argument(
         '--crn',
-        help='CRN (number that identifies a section)',
+        action='append',
+        help='CRN (number that identifies a section). The section '
+             'command accepts any number of CRNs, each with its own '
+             '--crn, and "-" to read them from standard input',
         metavar='',
     )
 
@@ -274,6 +475,157 @@ def main():
              'server, regardless of the cache state'
     )
 
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=8,
+        help='Number of concurrent fetches for prefetch and for '
+             'section with many CRNs (default 8)',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--connections',
+        type=int,
+        default=4,
+        help='Maximum number of simultaneous connections '
+             'to the server (default 4)',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--http-rate',
+        dest='http_rate',
+        type=float,
+        default=4.0,
+        help='Maximum number of requests per second to the server '
+             '(default 4)',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=30,
+        help='Seconds to wait on the server before a request fails '
+             '(default 30)',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=2,
+        help='Number of times to retry a request that fails with a '
+             'network or server error (default 2)',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--stale-grace',
+        dest='stale_grace',
+        type=int,
+        help='Use cached information up to this many minutes after it '
+             'expires, and refresh it in the background',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--interval',
+        type=int,
+        default=60,
+        help='For watch, the number of seconds between polls of a '
+             'section that is changing (default 60)',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--max-interval',
+        dest='max_interval',
+        type=int,
+        default=1800,
+        help='For watch, the longest time in seconds between polls '
+             'of a section that is not changing (default 1800)',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=1.0,
+        help='For watch, the most sections to poll per second '
+             '(default 1)',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=0,
+        help='Port for serve to listen on (default: any free port)',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--no-server',
+        dest='use_server',
+        action='store_false',
+        help='Do not send queries to a running server',
+    )
+
+    parser.add_argument(
+        '--compression',
+        choices=['none', 'zlib', 'lzma'],
+        default='none',
+        help='How to compress cached data as it is written (default '
+             'none)',
+    )
+
+    parser.add_argument(
+        '--cache',
+        choices=['file', 'sqlite'],
+        default='file',
+        help='Where to keep cached data: "file" for a directory tree '
+             'of snapshots (the default), or "sqlite" for a single '
+             'database file',
+    )
+
+    parser.add_argument(
+        '--keep',
+        type=int,
+        default=3,
+        help='Number of cached snapshots to keep for each item '
+             '(default 3)',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--max-age',
+        dest='max_age',
+        type=int,
+        default=180,
+        help='Delete cached snapshots older than this many days '
+             '(default 180)',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--max-size',
+        dest='max_size',
+        type=int,
+        default=256,
+        help='Keep the cache under this many megabytes by deleting '
+             'the least recently used snapshots (default 256)',
+        metavar='',
+    )
+
+    parser.add_argument(
+        '--no-auto-prune',
+        dest='auto_prune',
+        action='store_false',
+        help='Do not prune the cache in the background',
+    )
+
     parser.add_argument(
         '--verbose',
         action='store_true',
@@ -298,7 +650,17 @@ def main():
 
     args = parser.parse_args()
 
-    context = Context()
+    args.crn = read_crns(args.crn)
+
+    retention = RetentionPolicy(
+        keep_last=max(1, args.keep),
+        max_age=timedelta(days=args.max_age),
+        max_bytes=args.max_size * 1024 * 1024,
+        auto_interval=timedelta(hours=1) if args.auto_prune else None,
+    )
+
+    context = Context(cache=args.cache, retention=retention,
+                      compression=args.compression)
 
     if args.chatty:
         print('')
@@ -306,12 +668,35 @@ def main():
     if args.verbose:
         context.get_logger().addHandler(log_handler())
 
-    store = Store(
-        context=context,
-        enable_http=args.enable_http,
-        log_http=args.log_http,
-        force_refresh=args.refresh,
-    )
+    store = None
+
+    # Queries go to a running server, if there is one, unless they
+    # ask for something that the server's Store is not set up to do.
+    if args.command is not None and args.command.remote \
+            and args.use_server and args.enable_http \
+            and not args.refresh and not args.log_http:
+        store = RemoteStore.find(context)
+
+    if store is None:
+        store = Store(
+            context=context,
+            enable_http=args.enable_http,
+            log_http=args.log_http,
+            force_refresh=args.refresh,
+            max_connections_per_host=args.connections,
+            stale_grace=None if args.stale_grace is None
+                else timedelta(minutes=args.stale_grace),
+            ephemeral=args.command is None
+                or not args.command.long_lived,
+            limiter=RateLimiter(
+                rate=args.http_rate,
+                burst=max(1, int(2 * args.http_rate)),
+            ),
+            retry_policy=RetryPolicy(retries=max(0, args.retries)),
+            timeout=args.timeout,
+            detach_refreshes=args.command is None
+                or not args.command.long_lived,
+        )
 
     if args.subject is not None:
         subject = store.find_subject(args.subject)
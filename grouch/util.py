@@ -1,17 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import errno
 from itertools import zip_longest
 import os, os.path
-import string
 
 
 def makedirs(path):
     if not os.path.exists(path):
-        os.makedirs(path)
+        try:
+            os.makedirs(path)
+        except OSError as e:
+            # Another thread or process may have created it first.
+            if e.errno != errno.EEXIST:
+                raise
+
+
+def maybe(fn):
+    """
+    :return: A function which applies fn to anything but None.
+    """
+    def g(x):
+        if x is not None:
+            return fn(x)
+    return g
+
+
+def map_distinct(fn, items, workers, logger=None):
+    """
+    Calls fn once for each distinct item, concurrently on a pool of
+    worker threads.
+
+    :param logger: If given, a call which fails is logged, and its
+        result is None. Otherwise its exception is raised.
+    :return: A generator of tuples (item, result), in the order in
+        which the calls complete.
+    """
+
+    distinct = []
+    seen = set()
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            distinct.append(item)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = dict(
+            (executor.submit(fn, item), item)
+            for item in distinct
+        )
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                result = future.result()
+            except Exception:
+                if logger is None:
+                    raise
+                logger.exception('%s failed' % item)
+                result = None
+            yield (item, result)
 
 
 def character_whitelist(x, whitelist):
-    return x.translate(None, string.maketrans(
-        whitelist, ' ' * len(whitelist)
-    ))
+    """
+    :return: The characters of x which are in the whitelist.
+    """
+    return ''.join(c for c in x if c in whitelist)
 
 
 def grouper(n, iterable, fillvalue=None):
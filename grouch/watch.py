@@ -0,0 +1,182 @@
+from datetime import datetime, timedelta
+import heapq
+import json
+import time
+
+
+class Watcher:
+    """
+    Polls the capacity of a set of sections and reports changes.
+
+    Each section has its own polling interval. A section that has just
+    changed is polled again after min_interval; one that has not
+    changed is polled half as often each time, up to max_interval. A
+    section with no more than nearly_full open seats is never polled
+    less often than hot_interval.
+
+    However many sections are watched, polls are spaced so that there
+    are at most rate per second.
+
+    :param emit: A function which is called with each change event,
+        a dict (see events).
+    """
+
+    def __init__(self, store, crns, emit, term=None,
+                 min_interval=timedelta(minutes=1),
+                 max_interval=timedelta(minutes=30),
+                 hot_interval=timedelta(minutes=2),
+                 nearly_full=2, rate=1.0,
+                 clock=time.time, sleep=time.sleep):
+        self.__store = store
+        self.__emit = emit
+        self.__term = term
+        self.__min = min_interval.total_seconds()
+        self.__max = max_interval.total_seconds()
+        self.__hot = hot_interval.total_seconds()
+        self.__nearly_full = nearly_full
+        self.__spacing = 1.0 / rate
+        self.__clock = clock
+        self.__sleep = sleep
+        self.__last_poll = None
+
+        # The previous Capacity and current interval of each section.
+        self.__capacity = {}
+        self.__interval = {}
+
+        # A heap of (time when due, crn).
+        now = clock()
+        self.__queue = []
+        for crn in crns:
+            if crn not in self.__interval:
+                self.__interval[crn] = self.__min
+                self.__queue.append((now, crn))
+        heapq.heapify(self.__queue)
+
+    def get_interval(self, crn):
+        return self.__interval[crn]
+
+    def run(self, polls=None):
+        """
+        Polls sections as they come due.
+
+        :param polls: The number of polls to make before returning, or
+            None to continue forever.
+        """
+
+        while self.__queue and (polls is None or polls > 0):
+            self.poll_next()
+            if polls is not None:
+                polls -= 1
+
+    def poll_next(self):
+        """
+        Waits until the next section is due, then polls it.
+        """
+
+        (due, crn) = heapq.heappop(self.__queue)
+
+        if self.__last_poll is not None:
+            due = max(due, self.__last_poll + self.__spacing)
+        wait = due - self.__clock()
+        if wait > 0:
+            self.__sleep(wait)
+
+        self.__last_poll = self.__clock()
+        self.poll(crn)
+
+        heapq.heappush(self.__queue,
+                       (self.__last_poll + self.__interval[crn], crn))
+
+    def poll(self, crn):
+        """
+        Looks up one section, emits any changes, and sets its next
+        polling interval.
+        """
+
+        interval = self.__interval[crn]
+
+        # A snapshot younger than the polling interval (fetched by
+        # someone else, perhaps) is as good as a new one.
+        section = self.__store.get_section(
+            crn,
+            term=self.__term,
+            shelf_life=timedelta(seconds=interval),
+        )
+
+        capacity = None if section is None else section.get('capacity')
+
+        if capacity is None:
+            self.__interval[crn] = min(self.__max, interval * 2)
+            return
+
+        old = self.__capacity.get(crn)
+        self.__capacity[crn] = capacity
+
+        changes = [] if old is None else list(events(crn, old, capacity))
+        for change in changes:
+            self.__emit(change)
+
+        if changes:
+            interval = self.__min
+        else:
+            interval = min(self.__max, interval * 2)
+
+        if capacity.get_max() - capacity.get_current() <= self.__nearly_full:
+            interval = min(interval, self.__hot)
+
+        self.__interval[crn] = max(self.__min, interval)
+
+
+def events(crn, old, new):
+    """
+    Compares two Capacities of a section.
+
+    :return: A generator of change events, each a dict in the form
+        {
+            'time': '2012-08-20T14:05:00Z',
+            'crn': '87134',
+            'event': 'seats',
+            'current': 45,
+            'max': 50,
+            'delta': -1,
+        }
+        where event is 'opened' if a full section now has open seats,
+        'closed' if a section with open seats is now full, and 'seats'
+        for any other change.
+    """
+
+    if (old.get_current(), old.get_max()) == \
+            (new.get_current(), new.get_max()):
+        return
+
+    was_open = old.get_current() < old.get_max()
+    is_open = new.get_current() < new.get_max()
+
+    if is_open and not was_open:
+        event = 'opened'
+    elif was_open and not is_open:
+        event = 'closed'
+    else:
+        event = 'seats'
+
+    yield {
+        'time': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'crn': crn,
+        'event': event,
+        'current': new.get_current(),
+        'max': new.get_max(),
+        'delta': new.get_current() - old.get_current(),
+    }
+
+
+def json_lines(out):
+    """
+    :return: An emit function for Watcher which writes each event to
+        out as a line of JSON.
+    """
+
+    def emit(event):
+        out.write(json.dumps(event, sort_keys=True) + '\n')
+        out.flush()
+
+    return emit